@@ -0,0 +1,216 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.d00_utils import proj_utils
+
+## ID REGISTRY
+##
+## FRDPersonnelID is a 36 character GUID string. Hashing and comparing
+## those strings dominates every drop_duplicates, merge and set operation
+## on the provider key. The registry maps each GUID to a dense int32 code
+## (0, 1, 2, ...) that is stable across the Patients, Procedures and
+## Medications tables and across runs, so the analysis works on integers
+## and decodes back to GUIDs only for output.
+##
+## The registry is a one column csv file in the 02_intermediate folder
+## (ids-FRDPersonnelID.csv). The code of a GUID is its row number; new
+## GUIDs are appended, so existing codes never change. GUIDs are compared
+## in upper case without surrounding spaces.
+##
+## PatientId is already an integer in the extract and needs no registry.
+## A patient-provider pair becomes a single int64 composite key:
+##
+##      composite_key = (PatientId << 32) | provider_code
+
+ID_COLUMNS = ['FRDPersonnelID']
+
+NULL_CODE = -1
+
+_data_folder = Path(__file__).resolve().parents[2].joinpath('data')
+
+
+class IdRegistry:
+
+    def __init__(self, name='FRDPersonnelID', path=None):
+        """
+        A class created to keep the persistent, append only GUID to integer code dictionary
+        of one identifier column.
+
+        Parameters
+        ----------
+            name : string (optional)
+                The identifier column. Defaults to FRDPersonnelID.
+
+            path : string or Path (optional)
+                The registry file. Defaults to data/02_intermediate/ids-<name>.csv.
+
+        Methods
+        -------
+            encode(values, add=True)
+            decode(codes)
+            save()
+        """
+        self.name = name
+        self.path = Path(path) if path is not None else \
+            _data_folder.joinpath('02_intermediate', 'ids-{}.csv'.format(name))
+
+        __values = list()
+        if self.path.exists():
+            __values = pd.read_csv(self.path, dtype=str)[name].tolist()
+
+        self.__index = pd.Index(__values, dtype=object)
+        self.__saved = len(__values)
+
+    def __len__(self):
+        return len(self.__index)
+
+    @property
+    def values(self):
+        return self.__index.values
+
+    @staticmethod
+    def _normalize(values):
+        __values = pd.Series(values, dtype=object).copy()
+        __mask = __values.notna()
+        __values[__mask] = __values[__mask].astype(str).str.strip().str.upper()
+        return __values, __mask
+
+    def encode(self, values, add=True):
+        """
+        Return the int32 codes of an array of GUIDs. Nulls are encoded as NULL_CODE (-1).
+
+        Properties:
+        -----------
+            values : array like of strings (mandatory)
+                A Series, array, list or Categorical. A Categorical is encoded through its
+                categories only.
+
+            add : boolean (optional)
+                Append unknown GUIDs to the registry. When False they are encoded as
+                NULL_CODE. Defaults to True.
+
+        Return
+        ------
+            numpy int32 array
+        """
+        if isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+            __categorical = pd.Categorical(values)
+            __category_codes = self.encode(__categorical.categories, add=add)
+            __category_codes = np.append(__category_codes, NULL_CODE).astype(np.int32)
+            return __category_codes[__categorical.codes]
+
+        __values, __mask = self._normalize(values)
+        __uniques = pd.unique(__values[__mask])
+
+        if add:
+            __new = __uniques[self.__index.get_indexer(__uniques) == -1]
+            if len(__new):
+                self.__index = self.__index.append(pd.Index(__new, dtype=object))
+
+        __codes = np.full(len(__values), NULL_CODE, dtype=np.int32)
+        __codes[__mask.values] = self.__index.get_indexer(__values[__mask])
+        return __codes
+
+    def decode(self, codes):
+        """
+        Return the GUIDs of an array of codes. NULL_CODE is decoded as None.
+        """
+        __codes = np.asarray(codes)
+        __values = np.empty(len(__codes), dtype=object)
+        __mask = __codes != NULL_CODE
+        __values[__mask] = self.__index.values[__codes[__mask]]
+        return __values
+
+    def save(self):
+        """
+        Append the GUIDs added since the last save to the registry file.
+        """
+        if self.__saved == len(self.__index) and self.path.exists():
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        __new = pd.DataFrame({self.name: self.__index[self.__saved:]})
+
+        if self.path.exists():
+            __new.to_csv(self.path, mode='a', header=False, index=False)
+        else:
+            with proj_utils.atomic_path(self.path) as __tmp_path:
+                __new.to_csv(__tmp_path, index=False)
+
+        self.__saved = len(self.__index)
+
+
+_registries = dict()
+
+
+def get_registry(name='FRDPersonnelID'):
+    """
+    Return the project registry of an identifier column, loaded once per process.
+    """
+    if name not in _registries:
+        _registries[name] = IdRegistry(name)
+    return _registries[name]
+
+
+def composite_key(patient_ids, provider_codes):
+    """
+    Combine PatientId and the provider code into a single int64 key.
+    """
+    patients = np.asarray(patient_ids, dtype=np.int64)
+    providers = np.asarray(provider_codes, dtype=np.int64) & 0xFFFFFFFF
+    return (patients << 32) | providers
+
+
+def split_composite_key(keys):
+    """
+    Return the (PatientId, provider code) arrays of composite keys.
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    providers = (keys & 0xFFFFFFFF).astype(np.uint32).astype(np.int32)
+    return keys >> 32, providers
+
+
+def intern_ids(df, columns=None, save=True):
+    """
+    The intern_ids() function replaces the GUID identifier columns of a DataFrame with their
+    int32 registry codes, in place.
+
+    Properties:
+    -----------
+        df : DataFrame (mandatory)
+
+        columns : list of strings (optional)
+            Identifier columns to encode. Defaults to the ID_COLUMNS found in df.
+
+        save : boolean (optional)
+            Append the new GUIDs to the registry files. Defaults to True.
+
+    Return
+    ------
+        The same DataFrame
+    """
+    columns = columns if columns is not None else [column for column in ID_COLUMNS
+                                                   if column in df.columns]
+    for column in columns:
+        registry = get_registry(column)
+        df[column] = registry.encode(df[column])
+        if save:
+            registry.save()
+
+    return df
+
+
+def decode_ids(df, columns=None):
+    """
+    Return a copy of a DataFrame with the interned identifier columns decoded to GUIDs.
+    """
+    decoded = df.copy()
+    columns = columns if columns is not None else [column for column in ID_COLUMNS
+                                                   if column in df.columns]
+    for column in columns:
+        if pd.api.types.is_integer_dtype(decoded[column]):
+            decoded[column] = get_registry(column).decode(decoded[column])
+
+    return decoded
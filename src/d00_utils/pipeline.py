@@ -0,0 +1,444 @@
+from pathlib import Path
+import argparse
+import ast
+import hashlib
+import importlib
+import json
+import os
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from src.d00_utils import proj_utils
+
+## PIPELINE RUNNER
+##
+## Runs the project stages (src/d01_data to src/d07_visualization) in
+## dependency order. Every stage declares the function that runs it and
+## the files or folders it reads and writes under the data folder:
+##
+##      convert_raw             01_raw workbook -> 01_raw parquet sheets
+##      patients_intermediate   01_raw patients -> 02_intermediate dfPatients_dedup
+##      tenure                  02_intermediate -> 03_processed tenure and time travelers
+##      master_procedures       01_raw patients and procedures -> 03_processed
+##      master_medications      01_raw patients and medications -> 03_processed
+##      figures                 02_intermediate csv -> 06_reporting figures
+##
+## (d04_modeling and d05_model_evaluation have no stage yet.)
+##
+## A stage depends on the stages writing one of its inputs (or a folder
+## holding it). Stages whose dependencies are done run in parallel, each
+## in a new worker process, except stages writing the same output (e.g.,
+## the append only ID registry), which never run at the same time.
+##
+## A stage fails when its function raises or reports failed items (e.g.,
+## a figure of the figures stage that could not be rendered). A failed
+## stage loses its key, so it runs again on the next run, and the stages
+## depending on it are blocked.
+##
+## The key of a stage is the hash of the content of its inputs, of its
+## parameters and of the source files of its module and of every src
+## module it imports, directly or not (found by parsing the imports, e.g.
+## tenure imports create_int_patient_data and schema). A stage whose key has
+## not changed since its last run and whose outputs still exist is
+## skipped. The content hash of a file is recorded with its size and
+## modification time in _pipeline_state.json and only computed again
+## when the file changes, so a rerun without new data costs a few stats.
+## After a data refresh only the stages whose inputs actually changed
+## run again.
+##
+## The state file also records the wall time, the memory and the rows
+## read and written (parquet inputs and outputs) of every stage:
+##
+##      peak_mb             peak of the Python allocations (tracemalloc)
+##      max_rss_mb          peak resident memory of the stage process,
+##                          including pyarrow and other native buffers
+##      children_max_rss_mb peak resident memory of the largest process
+##                          started by the stage (e.g., figure workers)
+##
+## Usage (from the project root):
+##      python -m src.d00_utils.pipeline
+##      python -m src.d00_utils.pipeline --stages tenure figures --force
+
+STATE_FILE_NAME = '_pipeline_state.json'
+
+RAW_WORKBOOK = '01_raw/20210225-ems-raw-v04.xlsx'
+
+RAW_FOLDER = '01_raw/20210225-ems-raw-v04'
+
+ID_REGISTRY_FILE = '02_intermediate/ids-FRDPersonnelID.csv'
+
+READ_SIZE = 2**20
+
+## kwargs are passed as they are, data_kwargs are paths relative to the
+## data folder
+STAGES = [
+    {'name': 'convert_raw',
+     'function': 'src.d01_data.convert_raw:convert_raw_workbook',
+     'data_kwargs': {'xlsx_path': RAW_WORKBOOK},
+     'inputs': [RAW_WORKBOOK],
+     'outputs': [RAW_FOLDER + '/patients', RAW_FOLDER + '/procedures', RAW_FOLDER + '/medications']},
+    {'name': 'patients_intermediate',
+     'function': 'src.d02_intermediate.create_int_patient_data:build_patients_intermediate',
+     'kwargs': {'csv': True},
+     'data_kwargs': {'source': RAW_FOLDER + '/patients'},
+     'inputs': [RAW_FOLDER + '/patients'],
+     'outputs': ['02_intermediate/dfPatients_dedup.parquet', '02_intermediate/dfPatients_dedup.csv',
+                 ID_REGISTRY_FILE]},
+    {'name': 'tenure',
+     'function': 'src.d03_processing.create_tenure_data:build_tenure_data',
+     'inputs': ['02_intermediate/dfPatients_dedup.parquet'],
+     'outputs': ['03_processed/dfPatients_tenure.parquet', '03_processed/TimeTravelers.parquet',
+                 '03_processed/TimeTravelers.csv']},
+    {'name': 'master_procedures',
+     'function': 'src.d03_processing.create_master_table:build_master_table',
+     'kwargs': {'table': 'procedures'},
+     'inputs': [RAW_FOLDER + '/patients', RAW_FOLDER + '/procedures'],
+     'outputs': ['03_processed/ProceduresPatients', ID_REGISTRY_FILE]},
+    {'name': 'master_medications',
+     'function': 'src.d03_processing.create_master_table:build_master_table',
+     'kwargs': {'table': 'medications'},
+     'inputs': [RAW_FOLDER + '/patients', RAW_FOLDER + '/medications'],
+     'outputs': ['03_processed/MedicationsPatients', ID_REGISTRY_FILE]},
+    {'name': 'figures',
+     'function': 'src.d07_visualization.render_figures:render_figures',
+     'inputs': ['02_intermediate/dfPatients_dedup.csv'],
+     'outputs': ['06_reporting/_figures_manifest.json']}
+]
+
+_project_folder = Path(__file__).resolve().parents[2]
+
+_data_folder = _project_folder.joinpath('data')
+
+
+def _is_under(path, folder):
+    return path == folder or path.startswith(folder.rstrip('/') + '/')
+
+
+def stage_dependencies(stages):
+    """
+    Return {stage name: set of the names of the stages writing one of its inputs}. Raise a
+    ValueError when the dependencies have a cycle.
+    """
+    depends_on = {stage['name']: {other['name'] for other in stages
+                                  if other['name'] != stage['name'] and
+                                  any(_is_under(path, output) for path in stage['inputs']
+                                          for output in other['outputs'])}
+                  for stage in stages}
+
+    done = set()
+    while len(done) < len(depends_on):
+        ready = {name for name, dependencies in depends_on.items()
+                 if name not in done and dependencies <= done}
+        if not ready:
+            raise ValueError('The stage dependencies have a cycle: {}'.format(
+                ', '.join(sorted(set(depends_on) - done))))
+        done |= ready
+
+    return depends_on
+
+
+def _files(path):
+    if path.is_file():
+        return [path]
+    return sorted(file for file in path.rglob('*') if file.is_file() and not file.name.endswith('.tmp'))
+
+
+def _file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(READ_SIZE), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def content_hash(data_folder, relative_path, file_hashes):
+    """
+    Return the sha1 of the content of a file or folder of the data folder, or None when it
+    does not exist. file_hashes ({relative path: {'size', 'mtime_ns', 'sha1'}}) is updated
+    with the files hashed again.
+    """
+    path = Path(data_folder).joinpath(relative_path)
+    if not path.exists():
+        return None
+
+    sha1 = hashlib.sha1()
+    for file in _files(path):
+        relative = file.relative_to(data_folder).as_posix()
+        stat = file.stat()
+        entry = file_hashes.get(relative)
+
+        if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': _file_sha1(file)}
+            file_hashes[relative] = entry
+
+        sha1.update(file.relative_to(path).as_posix().encode())
+        sha1.update(entry['sha1'].encode())
+    return sha1.hexdigest()
+
+
+def _module_file(module_name):
+    """
+    Return the source file of a src module or package, or None when it is not one.
+    """
+    path = _project_folder.joinpath(*module_name.split('.'))
+    for file in (path.with_suffix('.py'), path.joinpath('__init__.py')):
+        if file.is_file():
+            return file
+    return None
+
+
+def _module_files(module_name, files=None):
+    """
+    Return {module name: source file} of a src module and of the src modules it imports, at
+    any depth, found by parsing the sources without importing them.
+    """
+    files = dict() if files is None else files
+    file = _module_file(module_name)
+    if file is None or module_name in files:
+        return files
+    files[module_name] = file
+
+    for node in ast.walk(ast.parse(file.read_text(), filename=str(file))):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            # from src.d00_utils import schema imports the module src.d00_utils.schema
+            names = [node.module] + [node.module + '.' + alias.name for alias in node.names]
+        else:
+            continue
+        for name in names:
+            if name.split('.')[0] == 'src':
+                _module_files(name, files)
+
+    return files
+
+
+def module_source_hash(module_name):
+    """
+    Hash the source files of a src module and of the src modules it imports, without
+    importing them.
+    """
+    sha1 = hashlib.sha1()
+    for name, file in sorted(_module_files(module_name).items()):
+        sha1.update(name.encode())
+        sha1.update(_file_sha1(file).encode())
+    return sha1.hexdigest()
+
+
+def _stage_key(stage, input_hashes):
+    content = {'function': stage['function'],
+               'source': module_source_hash(stage['function'].split(':')[0]),
+               'kwargs': stage.get('kwargs', dict()),
+               'data_kwargs': stage.get('data_kwargs', dict()),
+               'inputs': input_hashes}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _parquet_rows(data_folder, paths):
+    """
+    Return the number of rows of the parquet files of paths, read from the file footers, or
+    None when there is none.
+    """
+    import pyarrow.parquet as pq
+
+    rows = None
+    for relative_path in paths:
+        path = Path(data_folder).joinpath(relative_path)
+        if not path.exists():
+            continue
+        for file in _files(path):
+            if file.suffix == '.parquet':
+                rows = (rows or 0) + pq.ParquetFile(str(file)).metadata.num_rows
+    return rows
+
+
+def _failures(result):
+    """
+    Return {item: error} of the items a stage result reports as failed, e.g. the figures of
+    render_figures() ({figure name: {'status': 'failed', 'error'}}).
+    """
+    if not isinstance(result, dict):
+        return dict()
+    return {name: item.get('error', '') for name, item in result.items()
+            if isinstance(item, dict) and item.get('status') == 'failed'}
+
+
+def _run_stage(function, kwargs):
+    """
+    Import and call one stage function. Runs in a new worker process, so the resident memory
+    peak is the one of the stage. Raise a RuntimeError when the stage reports failed items,
+    so the stage is not recorded as done and runs again on the next run.
+    """
+    module_name, function_name = function.split(':')
+    stage_function = getattr(importlib.import_module(module_name), function_name)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = stage_function(**kwargs)
+    finally:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    failures = _failures(result)
+    if failures:
+        raise RuntimeError('{} of {} failed: {}'.format(
+            len(failures), len(result), ', '.join('{} {}'.format(name, error)
+                                                  for name, error in failures.items())))
+
+    return {'seconds': round(time.perf_counter() - start, 2), 'peak_mb': round(peak / 2**20, 1),
+            'max_rss_mb': proj_utils.max_rss_mb(), 'children_max_rss_mb': proj_utils.max_rss_mb(children=True)}
+
+
+def _write_state(path, state):
+    proj_utils.write_text_atomic(path, json.dumps(state, indent=1, sort_keys=True))
+
+
+def run_pipeline(names=None, max_workers=None, force=False):
+    """
+    The run_pipeline() function runs the project stages whose inputs, parameters or code
+    changed since their last run.
+
+    Properties:
+    -----------
+        names : list of strings (optional)
+            Run only these stages (see STAGES). Their dependencies outside the list are
+            assumed to be up to date. Defaults to every stage.
+
+        max_workers : int (optional)
+            Number of stages run at the same time. Defaults to the number of processors.
+
+        force : boolean (optional)
+            Run the stages even when their key has not changed. Defaults to False.
+
+    Return
+    ------
+        Dictionary : {stage name: {'status', 'seconds', 'peak_mb', 'max_rss_mb',
+        'children_max_rss_mb', 'rows_in', 'rows_out'}}
+        with status ran, skipped, failed (with 'error'), missing_input or blocked
+    """
+    data_folder = _data_folder
+    max_workers = max_workers or os.cpu_count() or 1
+    stages = {stage['name']: stage for stage in STAGES if names is None or stage['name'] in names}
+
+    unknown = set(names or ()) - set(stages)
+    if unknown:
+        raise ValueError('Unknown stages {}. Valid options are {}'.format(
+            ', '.join(sorted(unknown)), ', '.join(stage['name'] for stage in STAGES)))
+
+    dependencies = stage_dependencies(list(stages.values()))
+
+    state_path = data_folder.joinpath(STATE_FILE_NAME)
+    state = json.loads(state_path.read_text()) if state_path.exists() else dict()
+    state.setdefault('files', dict())
+    state.setdefault('stages', dict())
+
+    results = dict()
+    pending = [name for name in stages]
+    running = dict()
+
+    def outputs_exist(stage):
+        return all(data_folder.joinpath(path).exists() for path in stage['outputs'])
+
+    def start_ready():
+        """
+        Submit, skip or block every pending stage whose dependencies are finished, until no
+        more stage can start (a skipped stage may free a stage declared before it).
+        """
+        before = None
+        while len(pending) != before:
+            before = len(pending)
+            start_pass()
+
+    def start_pass():
+        for name in list(pending):
+            stage = stages[name]
+            statuses = [results.get(dependency, {}).get('status') for dependency in dependencies[name]]
+
+            if any(status in ('failed', 'missing_input', 'blocked') for status in statuses):
+                results[name] = {'status': 'blocked'}
+                pending.remove(name)
+                continue
+            if not all(status in ('ran', 'skipped') for status in statuses):
+                continue
+            if any(set(stage['outputs']) & set(stages[other]['outputs'])
+                   for other in running.values()):
+                continue
+            if len(running) >= max_workers:
+                continue
+
+            pending.remove(name)
+            input_hashes = {path: content_hash(data_folder, path, state['files'])
+                            for path in stage['inputs']}
+            if None in input_hashes.values():
+                results[name] = {'status': 'missing_input',
+                                 'error': ', '.join(path for path, value in input_hashes.items()
+                                                      if value is None)}
+                continue
+
+            key = _stage_key(stage, input_hashes)
+            entry = state['stages'].get(name, dict())
+            if not force and entry.get('key') == key and outputs_exist(stage):
+                results[name] = dict(entry, status='skipped')
+                continue
+
+            kwargs = dict(stage.get('kwargs', dict()))
+            kwargs.update({argument: str(data_folder.joinpath(path))
+                           for argument, path in stage.get('data_kwargs', dict()).items()})
+            pool = ProcessPoolExecutor(max_workers=1)
+            future = pool.submit(_run_stage, stage['function'], kwargs)
+            pool.shutdown(wait=False)
+            running[future] = name
+            state['stages'][name] = dict(entry, pending_key=key)
+
+    start_ready()
+    while running:
+        done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+
+        for future in done:
+            name = running.pop(future)
+            stage = stages[name]
+            entry = state['stages'][name]
+            key = entry.pop('pending_key')
+
+            try:
+                metrics = future.result()
+            except Exception as error:
+                # Without a key the stage runs again next time, even when it fails with the
+                # key of its last successful run (e.g., forced)
+                entry.pop('key', None)
+                results[name] = {'status': 'failed', 'error': repr(error)}
+                _write_state(state_path, state)
+                continue
+
+            metrics['rows_in'] = _parquet_rows(data_folder, stage['inputs'])
+            metrics['rows_out'] = _parquet_rows(data_folder, stage['outputs'])
+            state['stages'][name] = dict(metrics, key=key)
+            results[name] = dict(metrics, status='ran')
+
+            _write_state(state_path, state)
+
+        start_ready()
+
+    # The file hashes computed for skipped stages are kept as well
+    for entry in state['stages'].values():
+        entry.pop('pending_key', None)
+    _write_state(state_path, state)
+
+    return {name: results[name] for name in stages}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the project pipeline stages that are out of date.')
+    parser.add_argument('--stages', nargs='+', default=None,
+                        choices=[stage['name'] for stage in STAGES])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--force', action='store_true')
+    args = parser.parse_args()
+
+    results = run_pipeline(args.stages, args.workers, args.force)
+    for name, result in results.items():
+        print('{:<22} {:<13} {:>8}s {:>9} MB rss {:>11} rows in {:>11} rows out {}'.format(
+            name, result['status'], result.get('seconds', ''), result.get('max_rss_mb') or '',
+            result.get('rows_in') or '', result.get('rows_out') or '', result.get('error', '')))
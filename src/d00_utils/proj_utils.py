@@ -1,5 +1,8 @@
 from pathlib import Path, PureWindowsPath
+from contextlib import contextmanager
 import datetime
+import os
+import sys
 
 def get_project_file_path():
     """
@@ -27,3 +30,52 @@ def datetime_converter_for_json_dumps(obj):
 
     if isinstance(obj, datetime.datetime):
         return obj.__str__()   
+
+def max_rss_mb(children=False):
+    """
+    The peak resident memory in MB of this process, or of its largest finished child process
+    when children is True. Unlike tracemalloc, it counts the memory allocated outside of
+    Python (pyarrow, numpy, the matplotlib Agg buffers).
+
+    Returns None where the resource module is not available (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    __usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    __bytes = __usage.ru_maxrss if sys.platform == 'darwin' else __usage.ru_maxrss * 1024
+    return round(__bytes / 2**20, 1)
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    The atomic_path() context manager gives a temporary path next to path to write the file
+    to. The temporary file replaces path when the block ends without an error, and is removed
+    otherwise, so a reader never sees a partial file.
+
+    Usage:
+    ------
+        with proj_utils.atomic_path(path) as tmp_path:
+            tmp_path.write_text(text)
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def write_text_atomic(path, text):
+    """
+    Write text to path through atomic_path().
+    """
+    with atomic_path(path) as tmp_path:
+        tmp_path.write_text(text)
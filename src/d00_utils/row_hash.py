@@ -0,0 +1,211 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.d00_utils import schema
+
+## ROW HASHES
+##
+## Reads a table (csv file, parquet file, folder of partitions or a list
+## of those) a chunk at a time and reduces every value and every row to
+## a 64-bit hash, for the passes that only need to compare values or rows
+## (distinct counts, duplicates) and should not hold the table in memory.
+##
+## Numbers are hashed as float64, dates as int64 and everything else as
+## text, so a column hashes the same in every file format. The csv
+## columns are read with one dtype over the whole file (see csv_dtypes()),
+## as pd.read_csv infers the dtype of every chunk on its own: a column of
+## numeric-looking text (e.g., UnitId) would hold the number 401 in some
+## chunks and the text '401' in others. Nulls hash to NULL_HASH.
+##
+## A 128-bit fingerprint is two 64-bit hashes computed with different
+## hash keys, held as a structured array with the hi and lo fields.
+##
+## UniqueHashes keeps the distinct hashes of a stream of chunks (exact
+## distinct and duplicate counts of the profiler and the Venn analysis).
+##
+## Usage:
+##      from src.d00_utils import row_hash
+##      for chunk in row_hash.frame_chunks('../data/02_intermediate/dfPatients_dedup.csv', 100000):
+##          hashes = row_hash.row_hashes(chunk)
+
+## Hash of a null value and multiplier of the row hash combination
+NULL_HASH = np.uint64(0x9E3779B97F4A7C15)
+ROW_MULTIPLIER = np.uint64(0x100000001B3)
+
+## pd.util.hash_array keys of the two halves of a 128-bit fingerprint
+HASH_KEYS = ('0123456789123456', 'ems-analytics-lo')
+
+FINGERPRINT_128 = np.dtype([('hi', '<u8'), ('lo', '<u8')])
+
+
+def source_files(source):
+    """
+    Return the csv and parquet files of a file, a folder of partitions or a list of those, in
+    reading order.
+    """
+    if isinstance(source, (list, tuple)):
+        return [file for item in source for file in source_files(item)]
+
+    path = Path(source)
+    if path.is_dir():
+        return [item for item in sorted(path.rglob('*')) if item.suffix in ('.parquet', '.csv') and item.is_file()]
+    return [path]
+
+
+def csv_dtypes(paths, columns, chunk_size):
+    """
+    Return the dtype of every (unregistered) column of the csv files over all their chunks:
+    str when any chunk holds text, float64 when any chunk holds floats, and bool or int64
+    when every value is a boolean or an integer. Booleans and integers with nulls are str and
+    float64, all-null columns float64, as pd.read_csv reads them.
+    """
+    if not columns:
+        return dict()
+
+    column_kinds = {column: set() for column in columns}
+    nulls = {column: False for column in columns}
+    for path in paths:
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=chunk_size):
+            for column in columns:
+                notnull = chunk[column].notnull()
+                nulls[column] |= not notnull.all()
+                if notnull.any():
+                    column_kinds[column].add(chunk[column].dtype.kind)
+
+    dtypes = dict()
+    for column, kinds in column_kinds.items():
+        if 'O' in kinds or ('b' in kinds and (len(kinds) > 1 or nulls[column])):
+            dtypes[column] = str
+        elif kinds == {'b'}:
+            dtypes[column] = 'bool'
+        elif kinds == {'i'} and not nulls[column]:
+            dtypes[column] = 'int64'
+        else:
+            dtypes[column] = 'float64'
+    return dtypes
+
+
+def source_csv_dtypes(source, table=None, chunk_size=100000):
+    """
+    Return the csv_dtypes() of the csv columns of source that table does not register.
+    """
+    csv = [path for path in source_files(source) if path.suffix == '.csv']
+    if not csv:
+        return dict()
+
+    header = list(pd.read_csv(csv[0], nrows=0).columns)
+    registered = schema.table_dtypes(table, header) if table is not None else dict()
+    return csv_dtypes(csv, [column for column in header if column not in registered], chunk_size)
+
+
+def frame_chunks(source, chunk_size, table=None, dtypes=None):
+    """
+    Yield the rows of a csv file, a parquet file, a folder of parquet/csv partitions or a list
+    of those, chunk_size rows at a time, with the registered dtypes of table.
+
+    The csv columns table does not register are read with the csv_dtypes() of the csv files,
+    computed by a first read unless they are given in dtypes (see source_csv_dtypes()).
+    """
+    if dtypes is None:
+        dtypes = source_csv_dtypes(source, table, chunk_size)
+
+    for path in source_files(source):
+        if path.suffix == '.csv':
+            header = list(pd.read_csv(path, nrows=0).columns)
+            read_dtypes = schema.table_dtypes(table, header) if table is not None else dict()
+            dates = [column for column, dtype in read_dtypes.items() if dtype.startswith('datetime64')]
+            read_dtypes = {column: dtype for column, dtype in read_dtypes.items() if column not in dates}
+            read_dtypes.update({column: dtype for column, dtype in dtypes.items() if column in header})
+            yield from pd.read_csv(path, dtype=read_dtypes, parse_dates=dates, chunksize=chunk_size)
+        else:
+            import pyarrow.parquet as pq
+
+            for batch in pq.ParquetFile(str(path)).iter_batches(batch_size=chunk_size):
+                df = batch.to_pandas()
+                yield schema.apply_schema(df, table) if table is not None else df
+
+
+def column_hashes(column, hash_key=HASH_KEYS[0]):
+    """
+    Return the uint64 hash of every value of a column, NULL_HASH for the nulls, and the null
+    mask.
+    """
+    if pd.api.types.is_categorical_dtype(column):
+        # The null code (-1) selects the NULL_HASH appended to the category hashes
+        codes = np.asarray(column.cat.codes)
+        categories = np.append(pd.util.hash_array(column.cat.categories.astype(str).values.astype(object),
+                                                  hash_key=hash_key),
+                               NULL_HASH)
+        return categories[codes], codes < 0
+
+    nulls = np.asarray(column.isnull())
+    if pd.api.types.is_datetime64_any_dtype(column):
+        values = np.asarray(column.values, dtype='datetime64[ns]').view(np.int64)
+    elif pd.api.types.is_numeric_dtype(column):
+        values = column.to_numpy(dtype=np.float64, na_value=np.nan)
+    else:
+        values = column.astype(str).values.astype(object)
+
+    hashes = pd.util.hash_array(values, hash_key=hash_key)
+    hashes[nulls] = NULL_HASH
+    return hashes, nulls
+
+
+def combine_hashes(row_hashes, hashes):
+    """
+    Fold the hashes of one more column into the row hashes.
+    """
+    return row_hashes * ROW_MULTIPLIER ^ hashes
+
+
+def row_hashes(df, hash_key=HASH_KEYS[0]):
+    """
+    Return the uint64 hash of every row of df, from the hashes of its columns in order.
+    """
+    hashes = np.zeros(len(df), dtype=np.uint64)
+    for column in df.columns:
+        hashes = combine_hashes(hashes, column_hashes(df[column], hash_key)[0])
+    return hashes
+
+
+def row_fingerprints(df, bits=64):
+    """
+    Return the 64-bit (uint64 array) or 128-bit (FINGERPRINT_128 array) fingerprint of every
+    row of df.
+    """
+    if bits == 64:
+        return row_hashes(df)
+    if bits != 128:
+        raise ValueError('Fingerprints have 64 or 128 bits, not {}'.format(bits))
+
+    fingerprints = np.empty(len(df), dtype=FINGERPRINT_128)
+    fingerprints['hi'] = row_hashes(df, HASH_KEYS[0])
+    fingerprints['lo'] = row_hashes(df, HASH_KEYS[1])
+    return fingerprints
+
+
+class UniqueHashes:
+    """
+    Sorted unique uint64 hashes of a stream of hash arrays (e.g., the row hashes of the chunks
+    of a table), merged in amortized batches.
+    """
+
+    def __init__(self):
+        self.values = np.zeros(0, dtype=np.uint64)
+        self.__pending = list()
+        self.__pending_size = 0
+
+    def add(self, hashes):
+        self.__pending.append(np.unique(hashes))
+        self.__pending_size += len(self.__pending[-1])
+        if self.__pending_size > max(len(self.values), 2**20):
+            self.flush()
+
+    def flush(self):
+        if self.__pending:
+            self.values = np.unique(np.concatenate([self.values] + self.__pending))
+            self.__pending = list()
+            self.__pending_size = 0
+        return self.values
@@ -0,0 +1,359 @@
+from pathlib import Path
+import argparse
+
+import pandas as pd
+
+from src.d00_utils import id_registry
+
+## TABLE SCHEMA REGISTRY
+##
+## Canonical in memory dtypes of the Patients, Procedures and Medications
+## tables and of the intermediate datasets built from them. A column has
+## the same meaning (and dtype) in every table it appears in, so the
+## registry keeps one dtype per column and the list of columns of every
+## table.
+##
+##      category        low cardinality text (shift, outcome, gender,
+##                      roles, descriptions) and the station/battalion
+##                      numbers, plus the provider GUID (~1k values)
+##      Int8 / Int16    nullable small integers for the factorized codes
+##      Int32 / Int64   nullable identifiers and medical codes
+##      datetime64[ns]  timestamps
+##
+## An object column holds one Python string per row (~60-100 bytes); a
+## category holds one small integer code per row plus the distinct
+## values once. The Patients intermediate (~540k rows) shrinks roughly
+## tenfold.
+##
+## Usage:
+##      from src.d00_utils import schema
+##      dfPatients = schema.read_csv('../data/02_intermediate/dfPatients_dedup.csv',
+##                                   table='patients_intermediate')
+##
+##      python -m src.d00_utils.schema      (memory report of data/02_intermediate)
+
+COLUMN_DTYPES = {
+    # Identifiers
+    'PatientId': 'Int32',
+    'FRDPersonnelID': 'category',
+    'Dim_Procedure_PK': 'Int32',
+    'Dim_Medication_PK': 'Int32',
+
+    # Patients
+    'Shift': 'category',
+    'UnitId': 'category',
+    'FireStation': 'category',
+    'Battalion': 'category',
+    'PatientOutcome': 'category',
+    'PatientGender': 'category',
+    'CrewMemberRoles': 'category',
+    'FRDPersonnelGender': 'category',
+    'DispatchTime': 'datetime64[ns]',
+    'FRDPersonnelStartDate': 'datetime64[ns]',
+
+    # Procedures
+    'Procedure_Performed_Code': 'Int64',
+    'Procedure_Performed_Description': 'category',
+    'Procedure_Performed_Date_Time': 'datetime64[ns]',
+
+    # Medications
+    'Medication_Given_RXCUI_Code': 'Int32',
+    'Medication_Given_Description': 'category',
+    'Medication_Administered_Date_Time': 'datetime64[ns]',
+
+    # Derived in the intermediate datasets
+    'TenureMonths': 'Int16',
+    'ShiftCode': 'Int8',
+    'Shift_A': 'uint8',
+    'Shift_B': 'uint8',
+    'Shift_C': 'uint8',
+    'UnitIdCode': 'Int16',
+    'PatientOutcomeCode': 'Int8',
+    'PatientGenderCode': 'Int8',
+    'ProviderGenderCode': 'Int8',
+
+    # Derived in the processed datasets
+    'TenureYears': 'Int8',
+    'TimeTraveler': 'bool',
+    'Records': 'Int32',
+    'TimeTravelerRecords': 'Int32',
+    'FirstDispatchTime': 'datetime64[ns]',
+    'MaxDaysBeforeStart': 'Int32'
+}
+
+_patients_columns = ['PatientId', 'FRDPersonnelID', 'Shift', 'UnitId', 'FireStation', 'Battalion',
+                     'PatientOutcome', 'PatientGender', 'CrewMemberRoles', 'DispatchTime',
+                     'FRDPersonnelGender', 'FRDPersonnelStartDate']
+
+_procedures_columns = ['Dim_Procedure_PK', 'PatientId', 'Procedure_Performed_Code',
+                       'Procedure_Performed_Description', 'FRDPersonnelID',
+                       'Procedure_Performed_Date_Time']
+
+_medications_columns = ['Dim_Medication_PK', 'PatientId', 'Medication_Given_RXCUI_Code',
+                        'Medication_Given_Description', 'FRDPersonnelID',
+                        'Medication_Administered_Date_Time']
+
+_joined_patient_columns = ['PatientOutcome', 'PatientGender', 'DispatchTime',
+                           'FRDPersonnelGender', 'FRDPersonnelStartDate', 'TenureMonths',
+                           'PatientOutcomeCode', 'PatientGenderCode', 'ProviderGenderCode']
+
+_patients_intermediate_columns = _patients_columns + ['TenureMonths', 'ShiftCode', 'Shift_A', 'Shift_B',
+                                                      'Shift_C', 'UnitIdCode', 'PatientOutcomeCode',
+                                                      'PatientGenderCode', 'ProviderGenderCode']
+
+TABLES = {
+    'patients': _patients_columns,
+    'procedures': _procedures_columns,
+    'medications': _medications_columns,
+    'patients_intermediate': _patients_intermediate_columns,
+    'procedures_intermediate': _procedures_columns + _joined_patient_columns,
+    'medications_intermediate': _medications_columns + _joined_patient_columns,
+    'patients_tenure': _patients_intermediate_columns + ['TenureYears', 'TimeTraveler'],
+    'time_travelers': ['FRDPersonnelID', 'FRDPersonnelStartDate', 'Records', 'TimeTravelerRecords',
+                       'FirstDispatchTime', 'MaxDaysBeforeStart']
+}
+
+## Categorical columns holding numbers. The csv parser builds the categories
+## of a 'category' column as strings, they are converted back to numbers.
+NUMERIC_CATEGORIES = ['FireStation', 'Battalion']
+
+## Project files of the registered tables, relative to the data folder
+TABLE_FILES = {
+    'patients_intermediate': '02_intermediate/dfPatients_dedup.csv',
+    'procedures_intermediate': '02_intermediate/ProceduresPatients-Intermediate.csv',
+    'medications_intermediate': '02_intermediate/MedicationsPatients-Intermediate.csv'
+}
+
+_data_folder = Path(__file__).resolve().parents[2].joinpath('data')
+
+
+def table_dtypes(table=None, columns=None):
+    """
+    Return the {column: dtype} mapping of a table.
+
+    Properties:
+    -----------
+        table : string (optional)
+            One of the TABLES keys. When None every registered column is a candidate.
+
+        columns : list of strings (optional)
+            Restrict the mapping to these columns. Columns without a registered dtype are
+            left out.
+
+    Return
+    ------
+        Dictionary : {column: dtype string}
+    """
+    if table is not None and table not in TABLES:
+        raise ValueError('Unknown table {}. Registered tables are: {}'.format(table, ', '.join(TABLES)))
+
+    selected = TABLES[table] if table is not None else list(COLUMN_DTYPES)
+    if columns is not None:
+        selected = [column for column in columns if column in selected]
+
+    return {column: COLUMN_DTYPES[column] for column in selected}
+
+
+def _is_datetime(dtype):
+    return dtype.startswith('datetime64')
+
+
+def apply_schema(df, table=None):
+    """
+    Cast the registered columns of a DataFrame to their compact dtypes in place. Columns that
+    already have the registered dtype are left untouched.
+
+    Return
+    ------
+        The same DataFrame
+    """
+    for column, dtype in table_dtypes(table, df.columns).items():
+        if str(df[column].dtype) == dtype:
+            continue
+
+        if _is_datetime(dtype):
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+        elif dtype.startswith('Int') and df[column].dtype == object:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype(dtype)
+        else:
+            df[column] = df[column].astype(dtype)
+
+    return df
+
+
+def _numeric_categories(series):
+    """
+    Return a station or battalion category column with numeric categories in numeric order,
+    whether they were read as text (csv) or as nullable integers (parquet).
+    """
+    numeric = series.cat.rename_categories(pd.to_numeric(series.cat.categories.astype(str)))
+    return numeric.cat.reorder_categories(numeric.cat.categories.sort_values())
+
+
+def read_csv(path, table=None, columns=None, intern_ids=False, **kwargs):
+    """
+    The read_csv() function reads a csv file with the registered dtypes applied by the parser,
+    so text columns are built as categoricals directly instead of going through object columns.
+
+    Properties:
+    -----------
+        path : string or Path (mandatory)
+
+        table : string (optional)
+            One of the TABLES keys. When None the dtype of every registered column found in
+            the file is applied.
+
+        columns : list of strings (optional)
+            Columns to read (usecols). Defaults to every column.
+
+        intern_ids : boolean (optional)
+            Replace the GUID identifier columns with their int32 registry codes (see
+            src/d00_utils/id_registry.py). Defaults to False.
+
+        **kwargs :
+            Passed to pd.read_csv (e.g., nrows, na_values).
+
+    Return
+    ------
+        DataFrame
+    """
+    header = list(pd.read_csv(path, nrows=0).columns)
+    selected = list(columns) if columns is not None else header
+
+    dtypes = table_dtypes(table, selected)
+    parse_dates = [column for column, dtype in dtypes.items() if _is_datetime(dtype)]
+    dtypes = {column: dtype for column, dtype in dtypes.items() if not _is_datetime(dtype)}
+
+    df = pd.read_csv(path, usecols=columns, dtype=dtypes, parse_dates=parse_dates, **kwargs)
+
+    for column in NUMERIC_CATEGORIES:
+        if dtypes.get(column) == 'category':
+            df[column] = _numeric_categories(df[column])
+
+    if intern_ids:
+        id_registry.intern_ids(df)
+
+    return df
+
+
+def read_parquet(path, table=None, columns=None, intern_ids=False):
+    """
+    The read_parquet() function reads a parquet file or partitioned dataset folder and applies
+    the registered dtypes. Text columns are dictionary encoded by pyarrow before the conversion
+    to pandas, so they never exist as object columns.
+
+    Properties:
+    -----------
+        path : string or Path (mandatory)
+
+        table : string (optional)
+            One of the TABLES keys.
+
+        columns : list of strings (optional)
+            Columns to read. Defaults to every column.
+
+        intern_ids : boolean (optional)
+            Replace the GUID identifier columns with their int32 registry codes. Defaults
+            to False.
+
+    Return
+    ------
+        DataFrame
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_table = pq.read_table(str(path), columns=columns)
+    dtypes = table_dtypes(table, arrow_table.column_names)
+
+    # Only text columns are dictionary encoded by pyarrow, the numeric
+    # categories (station and battalion numbers stored as integers) are
+    # cast by apply_schema
+    types = {field.name: field.type for field in arrow_table.schema}
+    categories = [column for column, dtype in dtypes.items() if dtype == 'category' and
+                  (pa.types.is_string(types[column]) or pa.types.is_dictionary(types[column]))]
+
+    df = apply_schema(arrow_table.to_pandas(categories=categories), table)
+    for column in NUMERIC_CATEGORIES:
+        if dtypes.get(column) == 'category' and column not in categories:
+            df[column] = _numeric_categories(df[column])
+
+    if intern_ids:
+        id_registry.intern_ids(df)
+
+    return df
+
+
+def memory_report(df, table=None):
+    """
+    The memory_report() function compares the memory usage of every column of a DataFrame
+    with its usage once the registered dtypes are applied.
+
+    Return
+    ------
+        DataFrame : one row per column with the original and compact dtype and size (MB),
+        plus a Total row
+    """
+    rows = list()
+    dtypes = table_dtypes(table, df.columns)
+
+    for column in df.columns:
+        before = df[column].memory_usage(index=False, deep=True)
+        if column in dtypes:
+            compact = apply_schema(df[[column]].copy(), table)[column]
+        else:
+            compact = df[column]
+        after = compact.memory_usage(index=False, deep=True)
+
+        rows.append({'Column': column,
+                     'Original dtype': str(df[column].dtype),
+                     'Compact dtype': str(compact.dtype),
+                     'Original MB': before / 2**20,
+                     'Compact MB': after / 2**20})
+
+    report = pd.DataFrame(rows, columns=['Column', 'Original dtype', 'Compact dtype',
+                                         'Original MB', 'Compact MB'])
+    report.loc[len(report)] = ['Total', '', '', report['Original MB'].sum(),
+                               report['Compact MB'].sum()]
+    report['Saved MB'] = report['Original MB'] - report['Compact MB']
+
+    return report.round(2)
+
+
+def table_memory_summary(tables=None, data_folder=None):
+    """
+    Load every registered table file twice, with the default pandas dtypes and with the
+    registry, and report the memory saved per table. Missing files are skipped.
+
+    Return
+    ------
+        DataFrame : one row per table with the rows, original MB, compact MB and saved MB
+    """
+    data_folder = Path(data_folder) if data_folder is not None else _data_folder
+    rows = list()
+
+    for table in tables or TABLE_FILES:
+        path = data_folder.joinpath(TABLE_FILES[table])
+        if not path.exists():
+            print('Skipping {}: {} not found'.format(table, path))
+            continue
+
+        original = pd.read_csv(path).memory_usage(index=False, deep=True).sum()
+        compact_df = read_csv(path, table=table)
+        compact = compact_df.memory_usage(index=False, deep=True).sum()
+
+        rows.append({'Table': table,
+                     'Rows': len(compact_df),
+                     'Original MB': round(original / 2**20, 2),
+                     'Compact MB': round(compact / 2**20, 2),
+                     'Saved MB': round((original - compact) / 2**20, 2)})
+
+    return pd.DataFrame(rows, columns=['Table', 'Rows', 'Original MB', 'Compact MB', 'Saved MB'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report the memory saved by the table schema registry.')
+    parser.add_argument('--data-folder', default=None)
+    args = parser.parse_args()
+
+    print(table_memory_summary(data_folder=args.data_folder).to_string(index=False))
@@ -0,0 +1,89 @@
+from pathlib import Path
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+## STARTUP BENCHMARK
+##
+## Measures the cost of importing the project package in a fresh
+## interpreter, with and without remote (S3) use. Every scenario runs in
+## its own process so module caches of a previous run do not hide the
+## import cost.
+##
+## Usage (from the project root):
+##      python -m src.d00_utils.startup_benchmark --repeat 10
+
+_repo_root = Path(__file__).resolve().parents[2]
+
+SCENARIOS = {
+    'python (baseline)': 'pass',
+    'import src': 'import src',
+    'import src.d01_data.ingest': 'import src.d01_data.ingest',
+    'ingest + remote use': (
+        'import src.d01_data.ingest as ingest\n'
+        'ingest._import_aws()\n'
+        'ingest.boto3.Session(aws_access_key_id="x", aws_secret_access_key="x",\n'
+        '                     region_name="us-east-1").client("s3")'
+    ),
+}
+
+
+def _time_scenario(code):
+    """
+    Return the wall time in seconds of a fresh interpreter running code, and whether
+    boto3 ended up imported.
+    """
+    script = '{}\nimport sys\nprint("boto3" in sys.modules)'.format(code)
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', script], cwd=str(_repo_root),
+                            check=True, capture_output=True, text=True).stdout
+    return time.perf_counter() - start, output.strip().endswith('True')
+
+
+def startup_benchmark(repeat=5):
+    """
+    Run every scenario repeat times.
+
+    Properties:
+    -----------
+        repeat : int (optional)
+            Number of fresh interpreters started per scenario. Defaults to 5.
+
+    Return
+    ------
+        List of dictionaries with the scenario, median and minimum time (ms) and whether
+        boto3 was imported. A RuntimeError is raised when the runs of a scenario do not
+        agree on whether boto3 was imported.
+    """
+    rows = list()
+
+    for name, code in SCENARIOS.items():
+        times = list()
+        boto3_loaded = list()
+        for _ in range(repeat):
+            elapsed, loaded = _time_scenario(code)
+            times.append(elapsed * 1000)
+            boto3_loaded.append(loaded)
+
+        if len(set(boto3_loaded)) > 1:
+            raise RuntimeError('The {} runs of {!r} do not agree: boto3 was imported in {} of them'.format(
+                repeat, name, sum(boto3_loaded)))
+
+        rows.append({'scenario': name,
+                     'median_ms': statistics.median(times),
+                     'min_ms': min(times),
+                     'boto3_loaded': boto3_loaded[0]})
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the import cost of the src package.')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print('{:<30}{:>12}{:>12}{:>8}'.format('scenario', 'median ms', 'min ms', 'boto3'))
+    for row in startup_benchmark(args.repeat):
+        print('{:<30}{:>12.1f}{:>12.1f}{:>8}'.format(row['scenario'], row['median_ms'],
+                                                     row['min_ms'], str(row['boto3_loaded'])))
@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+
+## TIME BUCKET AGGREGATION
+##
+## Counts and first/last timestamps per time bucket (e.g., per year of
+## DispatchTime) in one pass over the datetime64 values, without copying
+## or re-typing the frame. Bucket codes are computed with datetime64
+## integer arithmetic (e.g., the year of a timestamp is its value in
+## datetime64[Y] units), so the buckets found are the ones present in the
+## data and new years in later data drops show up automatically.
+##
+## Calendar buckets are labelled with pandas Periods (2019, 2019Q3,
+## 2019-07, ...) and cyclic buckets with integers (hour of day 0-23,
+## day of week 0-6 starting on Monday).
+##
+## Usage:
+##      from src.d00_utils import time_buckets
+##      time_buckets.time_bucket_summary(df, 'year')
+##      time_buckets.time_bucket_summary(df, 'hour_of_day', by=['Shift'])
+
+CALENDAR_BUCKETS = {'year': 'A', 'quarter': 'Q', 'month': 'M', 'week': 'W-SUN', 'day': 'D', 'hour': 'H'}
+
+CYCLIC_BUCKETS = ['hour_of_day', 'day_of_week']
+
+# 1970-01-01 was a Thursday, shifting by 3 days starts the weeks on Monday
+_WEEK_OFFSET = 3
+
+
+def _as_datetime64(times):
+    """
+    Return the datetime64[ns] values of a Series, index or array of timestamps.
+    """
+    values = np.asarray(times)
+    if not np.issubdtype(values.dtype, np.datetime64):
+        values = pd.to_datetime(pd.Series(times), errors='coerce').values
+    return values.astype('datetime64[ns]', copy=False)
+
+
+def bucket_codes(times, bucket):
+    """
+    Return the int64 bucket code of every timestamp and the mask of the non null ones.
+
+    Properties:
+    -----------
+        times : Series or array of timestamps (mandatory)
+
+        bucket : string (mandatory)
+            year, quarter, month, week, day, hour, hour_of_day or day_of_week.
+
+    Return
+    ------
+        (numpy int64 array, numpy boolean array)
+    """
+    values = _as_datetime64(times)
+    mask = ~np.isnat(values)
+
+    if bucket == 'year':
+        codes = values.astype('datetime64[Y]').astype(np.int64)
+    elif bucket == 'quarter':
+        codes = values.astype('datetime64[M]').astype(np.int64) // 3
+    elif bucket == 'month':
+        codes = values.astype('datetime64[M]').astype(np.int64)
+    elif bucket in ('week', 'day_of_week'):
+        days = values.astype('datetime64[D]').astype(np.int64) + _WEEK_OFFSET
+        codes = days // 7 if bucket == 'week' else days % 7
+    elif bucket == 'day':
+        codes = values.astype('datetime64[D]').astype(np.int64)
+    elif bucket in ('hour', 'hour_of_day'):
+        codes = values.astype('datetime64[h]').astype(np.int64)
+        if bucket == 'hour_of_day':
+            codes = codes % 24
+    else:
+        raise ValueError('Please check the bucket {}. Valid options are {}'.format(
+            bucket, ', '.join(list(CALENDAR_BUCKETS) + CYCLIC_BUCKETS)))
+
+    return codes, mask
+
+
+def bucket_labels_from_codes(codes, bucket):
+    """
+    Return the labels of bucket codes (a PeriodIndex for calendar buckets).
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+
+    if bucket in CYCLIC_BUCKETS:
+        return pd.Index(codes, name=bucket)
+    if bucket == 'week':
+        starts = (codes * 7 - _WEEK_OFFSET).astype('datetime64[D]')
+        return pd.DatetimeIndex(starts).to_period(CALENDAR_BUCKETS['week']).rename(bucket)
+    return pd.PeriodIndex(ordinal=codes, freq=CALENDAR_BUCKETS[bucket], name=bucket)
+
+
+def bucket_labels(times, bucket):
+    """
+    Return the bucket of every timestamp as a categorical Series aligned with times
+    (e.g., to use as a plot hue). Null timestamps have a null bucket.
+    """
+    codes, mask = bucket_codes(times, bucket)
+    uniques, inverse = np.unique(codes[mask], return_inverse=True)
+
+    category_codes = np.full(len(codes), -1, dtype=np.int64)
+    category_codes[mask] = inverse
+
+    categories = bucket_labels_from_codes(uniques, bucket)
+    if bucket == 'year':
+        categories = categories.year
+
+    return pd.Series(pd.Categorical.from_codes(category_codes, categories=categories),
+                     index=getattr(times, 'index', None), name=bucket)
+
+
+def time_bucket_summary(data, bucket='year', time_column='DispatchTime', by=None):
+    """
+    The time_bucket_summary() function returns the number of records and the first and last
+    timestamp of every time bucket, optionally per grouping key.
+
+    Properties:
+    -----------
+        data : DataFrame or Series (mandatory)
+            A frame holding time_column (and the by columns), or a Series of timestamps.
+            Text timestamps are parsed, the frame itself is never copied.
+
+        bucket : string (optional)
+            year, quarter, month, week, day, hour, hour_of_day or day_of_week.
+            Defaults to year.
+
+        time_column : string (optional)
+            Defaults to DispatchTime.
+
+        by : list of strings or arrays (optional)
+            Additional grouping keys (e.g., ['FireStation', 'Shift']).
+
+    Return
+    ------
+        DataFrame : indexed by the by keys and the bucket, with the Count, First and Last
+        columns, sorted by key and bucket. Null timestamps are ignored.
+    """
+    times = data[time_column] if isinstance(data, pd.DataFrame) else pd.Series(data)
+    values = _as_datetime64(times)
+    codes, mask = bucket_codes(values, bucket)
+
+    if by is None and bucket not in CYCLIC_BUCKETS:
+        # Calendar buckets of sorted timestamps are contiguous runs
+        sorted_times = values[mask]
+        sorted_codes = codes[mask]
+        if len(sorted_times) > 1 and (sorted_times[1:] < sorted_times[:-1]).any():
+            order = np.argsort(sorted_times, kind='stable')
+            sorted_times, sorted_codes = sorted_times[order], sorted_codes[order]
+
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]) \
+            if len(sorted_times) else np.zeros(0, dtype=np.int64)
+        ends = np.r_[starts[1:], len(sorted_times)]
+
+        return pd.DataFrame({'Count': ends - starts,
+                             'First': sorted_times[starts],
+                             'Last': sorted_times[ends - 1]},
+                            index=bucket_labels_from_codes(sorted_codes[starts], bucket))
+
+    keys = list()
+    for key in by or []:
+        key_values = data[key] if isinstance(key, str) else pd.Series(key, index=times.index)
+        keys.append(key_values[mask].values)
+    keys.append(codes[mask])
+
+    summary = pd.Series(values[mask]).groupby(keys, observed=True) \
+        .agg(['size', 'min', 'max']).sort_index()
+    summary.columns = ['Count', 'First', 'Last']
+
+    names = [key if isinstance(key, str) else 'key_{}'.format(i) for i, key in enumerate(by or [])]
+    index = summary.index.to_frame(index=False)
+    index.columns = names + [bucket]
+    index[bucket] = bucket_labels_from_codes(index[bucket].values, bucket)
+    summary.index = pd.MultiIndex.from_frame(index) if names else pd.Index(index[bucket])
+
+    return summary
@@ -0,0 +1,154 @@
+import hashlib
+import math
+
+## S3 ETAG CHECKSUMS
+##
+## S3 reports an ETag for every object. For a single PUT the ETag is the
+## MD5 of the content. For a multipart upload it is the MD5 of the
+## concatenated part digests followed by '-' and the number of parts
+## (e.g., '0c78aef83f66abc1fa1e8477f296d394-3'). The part size is not
+## stored anywhere, so it has to be guessed from the object size and the
+## part count. The hasher below tracks several candidate part sizes in
+## the same pass, which lets a download be verified while it is written
+## without reading the file a second time.
+##
+## Uploads are hashed the same way: boto3 reads the file through an
+## EtagReader, which feeds every byte it hands out to an EtagHasher, so
+## the expected ETag is known once the upload is done without a separate
+## hashing pass over the file.
+
+MB = 2**20
+
+DEFAULT_PART_SIZE = 8 * MB  # boto3 TransferConfig default multipart_chunksize
+
+READ_SIZE = 1 * MB
+
+
+def candidate_part_sizes(size, etag, preferred=DEFAULT_PART_SIZE):
+    """
+    Return the part sizes that could have produced a multipart ETag for an object of
+    the given size. An empty list is returned for single part ETags.
+    """
+    if '-' not in etag:
+        return list()
+
+    parts = int(etag.rsplit('-', 1)[1])
+    candidates = [preferred, DEFAULT_PART_SIZE, 5 * MB, 16 * MB,
+                  math.ceil(size / parts / MB) * MB]
+
+    valid = list()
+    for part_size in candidates:
+        if part_size > 0 and part_size not in valid and math.ceil(size / part_size) == parts:
+            valid.append(part_size)
+    return valid
+
+
+class EtagHasher:
+
+    def __init__(self, part_sizes=()):
+        """
+        A class created to compute the whole content MD5 and the multipart ETag for one
+        or more part sizes while the content is streamed through update().
+
+        Parameters
+        ----------
+            part_sizes : list of int (optional)
+                Candidate multipart part sizes, see candidate_part_sizes().
+        """
+        self.__whole = hashlib.md5()
+        self.__parts = {size: {'md5': hashlib.md5(), 'filled': 0, 'digests': []}
+                        for size in part_sizes}
+        self.size = 0
+
+    def update(self, data):
+        self.__whole.update(data)
+        self.size += len(data)
+
+        for part_size, state in self.__parts.items():
+            __view = memoryview(data)
+            while len(__view):
+                __take = min(part_size - state['filled'], len(__view))
+                state['md5'].update(__view[:__take])
+                state['filled'] += __take
+                __view = __view[__take:]
+                if state['filled'] == part_size:
+                    state['digests'].append(state['md5'].digest())
+                    state['md5'] = hashlib.md5()
+                    state['filled'] = 0
+
+    def etags(self):
+        """
+        Return every ETag the streamed content could have, single part first.
+        """
+        __etags = [self.__whole.hexdigest()]
+
+        for state in self.__parts.values():
+            __digests = list(state['digests'])
+            if state['filled'] or not __digests:
+                __digests.append(state['md5'].digest())
+            __etags.append('{}-{}'.format(hashlib.md5(b''.join(__digests)).hexdigest(),
+                                          len(__digests)))
+        return __etags
+
+    def matches(self, etag):
+        return etag.strip('"') in self.etags()
+
+    def upload_etag(self, multipart_threshold=DEFAULT_PART_SIZE):
+        """
+        Return the ETag S3 reports for the streamed content uploaded by boto3 with the given
+        multipart threshold and the first part size of the hasher.
+        """
+        if self.__parts and self.size >= multipart_threshold:
+            return self.etags()[1]
+        return self.etags()[0]
+
+
+class EtagReader:
+
+    def __init__(self, file, hasher):
+        """
+        A class created to read a binary file for a boto3 upload_fileobj() call while its
+        content is streamed through an EtagHasher. The reader is not seekable, so boto3
+        reads it once from start to end (in parts for multipart uploads) and every byte
+        is hashed exactly once, in order.
+
+        Parameters
+        ----------
+            file : binary file object (mandatory)
+
+            hasher : EtagHasher (mandatory)
+
+        Methods
+        -------
+            read(size=-1)
+        """
+        self.__file = file
+        self.hasher = hasher
+
+    def read(self, size=-1):
+        __data = self.__file.read(size)
+        self.hasher.update(__data)
+        return __data
+
+    def seekable(self):
+        return False
+
+
+def file_etags(path, part_sizes=()):
+    """
+    Hash a local file and return the EtagHasher with every candidate ETag.
+    """
+    hasher = EtagHasher(part_sizes)
+
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(READ_SIZE), b''):
+            hasher.update(chunk)
+    return hasher
+
+
+def upload_etag(path, multipart_threshold=DEFAULT_PART_SIZE, part_size=DEFAULT_PART_SIZE):
+    """
+    Return the ETag S3 will report after a boto3 upload_file() call with the given
+    transfer configuration.
+    """
+    return file_etags(path, [part_size]).upload_etag(multipart_threshold)
@@ -0,0 +1,308 @@
+from pathlib import Path, PurePosixPath
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.d00_utils import schema
+
+## RAW WORKBOOK CONVERTER
+##
+## The raw extract is delivered as one .xlsx workbook with the Patients,
+## Procedures and Medications worksheets. Reading a sheet with
+## pd.read_excel takes minutes and holds the whole sheet in memory.
+##
+## This converter streams each sheet in openpyxl read only mode, a chunk
+## of rows at a time, applies the declared dtype schema and appends the
+## chunk to Parquet files partitioned by the year of the sheet date
+## column (e.g., 01_raw/20210225-ems-raw-v04/patients/year=2019/).
+## Sheets are converted in parallel worker processes.
+##
+## An .xlsx file is a zip archive with one XML member per worksheet. The
+## converter hashes the member of each sheet (plus the shared strings
+## and the schema) and skips the sheets whose hash has not changed since
+## the last run, which is recorded in _convert_state.json.
+
+## DECLARED RAW SCHEMA
+##
+## The dtypes come from the table schema registry (src/d00_utils/schema.py).
+## The 'category' columns are stored as dictionary encoded strings, except
+## the station and battalion numbers which are stored as integers.
+## schema.read_parquet only dictionary decodes the string columns and
+## casts these integer columns to categoricals (with numeric categories)
+## afterwards, as pyarrow cannot build categoricals from int columns.
+_STORAGE_DTYPES = {'FireStation': 'Int16', 'Battalion': 'Int16'}
+
+RAW_SCHEMA = {sheet: {column: _STORAGE_DTYPES.get(column, dtype)
+                      for column, dtype in schema.table_dtypes(sheet.lower()).items()}
+              for sheet in ['Patients', 'Procedures', 'Medications']}
+
+## Date column used to partition each sheet by year
+PARTITION_COLUMN = {
+    'Patients': 'DispatchTime',
+    'Procedures': 'Procedure_Performed_Date_Time',
+    'Medications': 'Medication_Administered_Date_Time'
+}
+
+## Rows without a date are written to year=0. The hive null partition
+## (__HIVE_DEFAULT_PARTITION__) cannot be read back by pd.read_parquet.
+NULL_PARTITION = '0'
+
+NA_VALUES = ['NA']
+
+STATE_FILE_NAME = '_convert_state.json'
+
+_ARROW_TYPES = {
+    'Int16': pa.int16(),
+    'Int32': pa.int32(),
+    'Int64': pa.int64(),
+    'string': pa.string(),
+    'category': pa.dictionary(pa.int32(), pa.string()),
+    'datetime64[ns]': pa.timestamp('ns')
+}
+
+
+def arrow_schema(sheet):
+    """
+    Return the pyarrow schema of a sheet from the declared pandas dtypes. The pandas
+    metadata is kept so nullable integers and categories are restored on read.
+    """
+    empty = pd.DataFrame({column: pd.Series(dtype=dtype)
+                          for column, dtype in RAW_SCHEMA[sheet].items()})
+    metadata = pa.Schema.from_pandas(empty, preserve_index=False).metadata
+
+    return pa.schema([(column, _ARROW_TYPES[dtype])
+                      for column, dtype in RAW_SCHEMA[sheet].items()], metadata=metadata)
+
+
+def apply_raw_schema(df, sheet):
+    """
+    Cast the columns of a raw chunk to the declared dtypes. Values that cannot be parsed
+    (e.g., text in a date column) become nulls.
+    """
+    for column, dtype in RAW_SCHEMA[sheet].items():
+        values = df[column]
+        if values.dtype == object:
+            values = values.where(~values.isin(NA_VALUES))
+
+        if dtype.startswith('datetime64'):
+            df[column] = pd.to_datetime(values, errors='coerce')
+        elif dtype.startswith('Int'):
+            df[column] = pd.to_numeric(values, errors='coerce').astype(dtype)
+        elif dtype == 'category':
+            df[column] = values.astype('string').astype('category')
+        else:
+            df[column] = values.astype(dtype)
+
+    return df
+
+
+def _sheet_members(xlsx_path):
+    """
+    Return the {sheet name: zip member} mapping of a workbook.
+    """
+    ns = {'main': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+          'rel': 'http://schemas.openxmlformats.org/package/2006/relationships',
+          'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'}
+
+    with zipfile.ZipFile(xlsx_path) as archive:
+        workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+        rels = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+
+    targets = {rel.get('Id'): rel.get('Target') for rel in rels.findall('rel:Relationship', ns)}
+    members = dict()
+
+    for sheet in workbook.find('main:sheets', ns):
+        target = targets[sheet.get('{{{}}}id'.format(ns['r']))]
+        if target.startswith('/'):
+            members[sheet.get('name')] = target.lstrip('/')
+        else:
+            members[sheet.get('name')] = str(PurePosixPath('xl').joinpath(target))
+
+    return members
+
+
+def sheet_source_hash(xlsx_path, sheet):
+    """
+    Hash the worksheet XML, the shared strings and the declared schema of one sheet.
+    """
+    sheet_members = _sheet_members(xlsx_path)
+    if sheet not in sheet_members:
+        raise ValueError('The {} workbook has no {} sheet'.format(Path(xlsx_path).name, sheet))
+
+    sha256 = hashlib.sha256(json.dumps(RAW_SCHEMA[sheet], sort_keys=True).encode())
+    members = [sheet_members[sheet], 'xl/sharedStrings.xml']
+
+    with zipfile.ZipFile(xlsx_path) as archive:
+        names = set(archive.namelist())
+        for member in members:
+            if member not in names:
+                continue
+            with archive.open(member) as file:
+                for chunk in iter(lambda: file.read(2**20), b''):
+                    sha256.update(chunk)
+
+    return sha256.hexdigest()
+
+
+def _convert_sheet(xlsx_path, sheet, sheet_dir, chunk_size):
+    """
+    Stream one worksheet into year partitioned parquet files. The files are written to a
+    temporary folder that replaces the previous output only when the sheet is complete.
+    """
+    import openpyxl
+
+    start = time.perf_counter()
+    sheet_dir = Path(sheet_dir)
+    tmp_dir = sheet_dir.with_name(sheet_dir.name + '.tmp')
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+
+    sheet_schema = arrow_schema(sheet)
+    partition_column = PARTITION_COLUMN[sheet]
+    writers = dict()
+    rows = 0
+
+    workbook = openpyxl.load_workbook(xlsx_path, read_only=True, data_only=True)
+    try:
+        row_iter = workbook[sheet].iter_rows(values_only=True)
+        header = [str(name).strip() for name in next(row_iter)]
+
+        missing = [column for column in sheet_schema.names if column not in header]
+        if missing:
+            raise ValueError('The {} sheet is missing the columns: {}'.format(sheet, ', '.join(missing)))
+
+        def write(batch):
+            df = apply_raw_schema(pd.DataFrame(batch, columns=header)[sheet_schema.names], sheet)
+            years = df[partition_column].dt.year
+
+            for year, index in df.groupby(years.fillna(int(NULL_PARTITION)).astype(int)).indices.items():
+                partition = str(year)
+                if partition not in writers:
+                    path = tmp_dir.joinpath('year={}'.format(partition), 'part-0.parquet')
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    writers[partition] = pq.ParquetWriter(str(path), sheet_schema)
+
+                writers[partition].write_table(
+                    pa.Table.from_pandas(df.iloc[index], schema=sheet_schema, preserve_index=False))
+
+        buffer = list()
+        for row in row_iter:
+            if not any(value is not None for value in row):
+                continue
+            buffer.append(row)
+            if len(buffer) == chunk_size:
+                write(buffer)
+                rows += len(buffer)
+                buffer = list()
+
+        if buffer:
+            write(buffer)
+            rows += len(buffer)
+
+    finally:
+        for writer in writers.values():
+            writer.close()
+        workbook.close()
+
+    if sheet_dir.exists():
+        shutil.rmtree(sheet_dir)
+    os.replace(tmp_dir, sheet_dir)
+
+    return {'status': 'converted', 'rows': rows, 'partitions': sorted(writers),
+            'seconds': round(time.perf_counter() - start, 1)}
+
+
+def convert_raw_workbook(xlsx_path, out_dir=None, sheets=None, chunk_size=50000,
+                         max_workers=None, force=False):
+    """
+    The convert_raw_workbook() function converts the worksheets of the raw extract into
+    year partitioned parquet datasets.
+
+    Properties:
+    -----------
+        xlsx_path : string or Path (mandatory)
+            The raw workbook (e.g., ../data/01_raw/20210225-ems-raw-v04.xlsx).
+
+        out_dir : string or Path (optional)
+            Output folder. Defaults to a folder named after the workbook next to it
+            (e.g., ../data/01_raw/20210225-ems-raw-v04/). Each sheet is written to a
+            lower case sub folder (patients, procedures, medications).
+
+        sheets : list of strings (optional)
+            Sheets to convert. Defaults to Patients, Procedures and Medications.
+
+        chunk_size : int (optional)
+            Number of rows held in memory per sheet. Defaults to 50,000.
+
+        max_workers : int (optional)
+            Number of worker processes. Defaults to one per sheet.
+
+        force : boolean (optional)
+            Convert the sheets even when their source hash has not changed.
+            Defaults to False.
+
+    Return
+    ------
+        Dictionary : {sheet: {'status', 'rows', 'partitions', 'seconds'}}
+    """
+    xlsx_path = Path(xlsx_path)
+    out_dir = Path(out_dir) if out_dir is not None else xlsx_path.with_suffix('')
+    sheets = list(sheets or RAW_SCHEMA)
+
+    unknown = [sheet for sheet in sheets if sheet not in RAW_SCHEMA]
+    if unknown:
+        raise ValueError('There is no declared schema for the sheets: {}'.format(', '.join(unknown)))
+
+    state_path = out_dir.joinpath(STATE_FILE_NAME)
+    state = json.loads(state_path.read_text()) if state_path.exists() else dict()
+    results = dict()
+    pending = dict()
+
+    for sheet in sheets:
+        source_hash = sheet_source_hash(xlsx_path, sheet)
+        sheet_dir = out_dir.joinpath(sheet.lower())
+        if not force and sheet_dir.exists() and state.get(sheet, {}).get('source_hash') == source_hash:
+            results[sheet] = {'status': 'skipped', 'rows': state[sheet]['rows'],
+                              'partitions': state[sheet]['partitions'], 'seconds': 0.0}
+        else:
+            pending[sheet] = (source_hash, sheet_dir)
+
+    if pending:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        with ProcessPoolExecutor(max_workers=max_workers or len(pending)) as pool:
+            futures = {sheet: pool.submit(_convert_sheet, str(xlsx_path), sheet,
+                                          str(sheet_dir), chunk_size)
+                       for sheet, (_, sheet_dir) in pending.items()}
+
+            for sheet, future in futures.items():
+                results[sheet] = future.result()
+                state[sheet] = {'source_hash': pending[sheet][0],
+                                'rows': results[sheet]['rows'],
+                                'partitions': results[sheet]['partitions']}
+                state_path.write_text(json.dumps(state, indent=1, sort_keys=True))
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert the raw EMS workbook into parquet.')
+    parser.add_argument('xlsx_path')
+    parser.add_argument('--out-dir', default=None)
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--force', action='store_true')
+    args = parser.parse_args()
+
+    for sheet, result in convert_raw_workbook(args.xlsx_path, args.out_dir,
+                                              chunk_size=args.chunk_size,
+                                              force=args.force).items():
+        print('{:<12} {status:<10} {rows:>9,} rows {seconds:>7}s'.format(sheet, **result))
@@ -1,12 +1,14 @@
-from pathlib import Path, PureWindowsPath
+from pathlib import Path
 import os
 from configparser import ConfigParser
 import json
 import datetime
-import boto3  # AWS library
-import botocore # AWS library
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from src.d00_utils import proj_utils
+from src.d01_data.manifest import FolderManifest
+from src.d01_data import checksum
 
 ## ENCAPSULATION CONCEPT:
 ##
@@ -26,45 +28,337 @@ from src.d00_utils import proj_utils
 ## Jupyter Labs
 
 
+## LAZY REMOTE STATE
+##
+## Importing this module is cheap on purpose: the configuration file,
+## the AWS libraries, the session and the S3 client are only loaded
+## the first time a method needs the bucket. Notebooks and worker
+## processes that only use local data never pay the boto3 start up
+## cost and never fail because the configuration file is missing.
+##
+## The remote state is cached per process. A forked child (e.g., a
+## multiprocessing worker on Linux) must not reuse the connection pool
+## or the lock of its parent, so the state is dropped after a fork and
+## created again on first use in the child.
+
+boto3 = None  # AWS library, imported on first remote use
+botocore = None  # AWS library, imported on first remote use
+
+_MAX_POOL_CONNECTIONS = 64
+
+_remote_state = {'pid': os.getpid(), 'config': None, 'session': None, 's3_client': None}
+_remote_lock = threading.Lock()
+
+_project_root = None
+
+
+def _reset_remote_state():
+    """
+    Drop the cached configuration, session and client of this process.
+    """
+    global _remote_lock
+
+    _remote_state.update(pid=os.getpid(), config=None, session=None, s3_client=None)
+    _remote_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_remote_state)
+
+
+def _import_aws():
+    """
+    Import the AWS libraries into the module namespace.
+    """
+    global boto3, botocore
+
+    if boto3 is None:
+        import botocore.exceptions  # AWS library
+        import boto3  # AWS library
+
+
+def _get_project_root():
+    """
+    Resolve the project root folder on first use and keep it for the life of the process.
+    """
+    global _project_root
+
+    if _project_root is None:
+        _project_root = proj_utils.get_project_file_path()
+    return _project_root
+
+
 ## DEFINE CONFIGURATION FILE PATH
 ##
-## The next two steps are created to define the the path where
-## the configuration file will be stored with the necessary
-## credential informations to access AWS S3 bucket.
+## The configuration file is stored with the necessary credential
+## informations to access AWS S3 bucket in <project root>/configs.
 ##
 ## Useful Documentation:
 ##      https://docs.python.org/3/library/configparser.html#supported-ini-file-structure
 ##      https://docs.python.org/3/library/configparser.html
 
-_project_root = proj_utils.get_project_file_path()
-__config_file = PureWindowsPath(
-    Path(_project_root).joinpath('configs', 'conf_local.ini'))
-
-## CREATE CONFIGURATION OBJECT
-## 
-## The next two lines of code instantiates a configuration object
-## and reads the content of the configuration file.
-__config = ConfigParser()
-__config.read(__config_file)
-
-## DEFINE SESSION ATTRIBUTES AND BUCKET NAME
-try:
-    __ACCESS_KEY = __config['AWS_SESSION']['ACCESS_KEY_ID']
-    __SECRET_KEY = __config['AWS_SESSION']['SECRET_ACCESS_KEY']
-    __REGION_NAME = __config['AWS_SESSION']['REGION_NAME']
-    _BUCKET_NAME = __config['s3']['PRI_BUCKET_NAME']
-except:
-    raise TypeError('CONFIG FILE PARAMETERS ERROR: Review config file and variable call outs.')
-
-## CREATE SESSION OBJECT
-_aws_session = boto3.Session(aws_access_key_id=__ACCESS_KEY,
-                             aws_secret_access_key=__SECRET_KEY,
-                             region_name=__REGION_NAME)
+def _get_config():
+    """
+    Read the configuration file once per process and return the session attributes and
+    the bucket name.
+    """
+    if _remote_state['config'] is None:
+        __config_file = Path(_get_project_root()).joinpath('configs', 'conf_local.ini')
+
+        __config = ConfigParser()
+        __config.read(__config_file)
+
+        ## DEFINE SESSION ATTRIBUTES AND BUCKET NAME
+        try:
+            __settings = {
+                'access_key': __config['AWS_SESSION']['ACCESS_KEY_ID'],
+                'secret_key': __config['AWS_SESSION']['SECRET_ACCESS_KEY'],
+                'region_name': __config['AWS_SESSION']['REGION_NAME'],
+                'bucket_name': __config['s3']['PRI_BUCKET_NAME'],
+                ## OPTIONAL ENDPOINT OVERRIDE
+                ##
+                ## ENDPOINT_URL is not needed for AWS. It allows the team to point the
+                ## ingest module at a local S3 stand-in (e.g., MinIO or moto_server)
+                ## to test transfers without touching the project bucket.
+                'endpoint_url': __config['s3'].get('ENDPOINT_URL', fallback=None)
+            }
+        except:
+            raise TypeError('CONFIG FILE PARAMETERS ERROR: Review config file and variable call outs.')
+
+        _remote_state['config'] = __settings
+
+    return _remote_state['config']
+
+
+def _bucket_name():
+    return _get_config()['bucket_name']
+
+
+## SHARED S3 CLIENT
+##
+## Building a client is expensive (endpoint resolution, credential
+## lookup and a new TLS connection pool), so every method in this module
+## shares one pooled client. boto3 clients are thread safe, which lets
+## the folder level transfers below use it from a thread pool. The pool
+## size needs to cover the worker threads times the multipart threads
+## of each transfer, otherwise urllib3 will discard connections.
+
+def _get_s3_client():
+    """
+    Return the process wide S3 client, creating the session and the client on first use.
+    """
+    if _remote_state['pid'] != os.getpid():
+        # A child process created without the fork hook
+        _reset_remote_state()
+
+    if _remote_state['s3_client'] is None:
+        with _remote_lock:
+            if _remote_state['s3_client'] is None:
+                _import_aws()
+                from botocore.config import Config
+
+                __config = _get_config()
+
+                ## CREATE SESSION OBJECT
+                _remote_state['session'] = boto3.Session(aws_access_key_id=__config['access_key'],
+                                                         aws_secret_access_key=__config['secret_key'],
+                                                         region_name=__config['region_name'])
+                _remote_state['s3_client'] = _remote_state['session'].client(
+                    's3',
+                    endpoint_url=__config['endpoint_url'],
+                    config=Config(max_pool_connections=_MAX_POOL_CONNECTIONS,
+                                  retries={'max_attempts': 5, 'mode': 'standard'}))
+
+    return _remote_state['s3_client']
+
+
+def _local_folder_path(sub_folder):
+    """
+    Return the local project data folder that mirrors an S3 logical folder.
+    """
+    return Path(_get_project_root()).joinpath(_PROJECT_NAME, _INGEST_FOLDER, sub_folder)
 
 _valid_folders = ['01_raw', '02_intermediate',
                   '03_processed', '04_models', '05_model_input', '06_reporting']
 
 _valid_file_extension = ['.csv', '.xlsx', '.html', '.parquet']
+
+_valid_refresh = ['incremental', 'full', 'none']
+
+_PROJECT_NAME = 'ems-analytics'
+_INGEST_FOLDER = 'data'
+
+
+def _folder_manifest(sub_folder):
+    return FolderManifest(_local_folder_path(sub_folder), sub_folder)
+
+
+def _list_folder(sub_folder, refresh='full', client=None):
+    """
+    Generator that yields the keys stored under an s3 folder and keeps the local manifest
+    of the folder up to date. The listing is paginated, so folders with more than 1,000
+    objects are listed completely.
+
+    Properties:
+    -----------
+        sub_folder : string (mandatory)
+            One of the project data folders (e.g., 01_raw).
+
+        refresh : string (optional)
+            'full' lists the complete folder and replaces the manifest, picking up new,
+            overwritten and deleted objects. 'incremental' yields the manifest keys and
+            then lists only the keys after the last known key, so it only finds new keys
+            that sort last (dated drops); it lists the complete folder when the manifest
+            has no full listing younger than FULL_LISTING_MAX_AGE (see manifest.py).
+            'none' answers from the manifest without calling s3. An empty manifest is
+            always listed completely. Defaults to 'full'.
+
+        client : boto3 S3 client (optional)
+            Defaults to the shared project client.
+
+    Return
+    ------
+        Generator of s3 keys in lexicographic order.
+    """
+    if refresh not in _valid_refresh:
+        raise ValueError("Please check your refresh selection. Valid options are "\
+                         "incremental, full, and none")
+
+    _import_aws()
+
+    __manifest = _folder_manifest(sub_folder)
+    __list_args = {'Bucket': _bucket_name(), 'Prefix': sub_folder + '/'}
+    __complete = refresh == 'full' or __manifest.is_empty or \
+        (refresh == 'incremental' and __manifest.full_listing_due())
+
+    if not __complete:
+        yield from __manifest.keys()
+        if refresh == 'none':
+            return
+        if __manifest.last_key is not None:
+            __list_args['StartAfter'] = __manifest.last_key
+
+    __listed = list()
+    __paginator = (client or _get_s3_client()).get_paginator('list_objects_v2')
+
+    try:
+        for __page in __paginator.paginate(**__list_args):
+            for item in __page.get('Contents', []):
+                if item['Key'] != str(sub_folder + "/"):
+                    __listed.append(item)
+                    yield item['Key']
+
+    except botocore.exceptions.ParamValidationError as error:
+        raise ValueError(
+            'The parameters you provided are incorredct: {}'.format(error))
+
+    __manifest.update(__listed, complete=__complete)
+    __manifest.save()
+
+
+def _head_entry(key, client=None):
+    """
+    Return the {'size', 'etag'} entry of a single key from a HEAD request, or None when
+    the key does not exist.
+    """
+    _import_aws()
+
+    try:
+        __response = (client or _get_s3_client()).head_object(Bucket=_bucket_name(), Key=key)
+
+    except botocore.exceptions.ClientError as error:
+        if error.response['Error']['Code'] == "404":
+            return None
+        raise
+
+    return {'size': __response['ContentLength'], 'etag': __response['ETag'].strip('"')}
+
+
+def _local_is_current(manifest, key, path, remote_entry, part_size=checksum.DEFAULT_PART_SIZE):
+    """
+    Decide whether a local file holds the same content as the remote object. The size is
+    compared first, then the ETag recorded in the manifest. A file without a valid record
+    is hashed once and the result is recorded for the next sync.
+    """
+    if remote_entry is None or not path.exists():
+        return False
+
+    if path.stat().st_size != remote_entry['size']:
+        return False
+
+    __etag = manifest.local_etag(key, path)
+    if __etag is not None:
+        return __etag == remote_entry['etag']
+
+    __hasher = checksum.file_etags(path, checksum.candidate_part_sizes(
+        remote_entry['size'], remote_entry['etag'], part_size))
+
+    if __hasher.matches(remote_entry['etag']):
+        manifest.record_local(key, path, remote_entry['etag'])
+        return True
+    return False
+
+
+def _download_verified(key, path, remote_entry, part_size=checksum.DEFAULT_PART_SIZE,
+                       callback=None, client=None):
+    """
+    Stream one object into a temporary file next to its destination, hashing the bytes
+    as they are written. The file is moved into place only when the size and ETag match
+    the expected entry, so a failed or interrupted transfer never leaves a half written
+    data file behind.
+    """
+    _import_aws()
+
+    __tmp_path = path.with_name(path.name + '.part')
+    __hasher = checksum.EtagHasher(checksum.candidate_part_sizes(
+        remote_entry['size'], remote_entry['etag'], part_size))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    try:
+        __response = (client or _get_s3_client()).get_object(
+            Bucket=_bucket_name(), Key=key, IfMatch='"{}"'.format(remote_entry['etag']))
+
+        with open(__tmp_path, 'wb') as file:
+            for chunk in iter(lambda: __response['Body'].read(checksum.READ_SIZE), b''):
+                file.write(chunk)
+                __hasher.update(chunk)
+                if callback is not None:
+                    callback(len(chunk))
+
+        if __hasher.size != remote_entry['size'] or not __hasher.matches(remote_entry['etag']):
+            raise IOError('Integrity check failed for {}: the downloaded content does not '\
+                          'match the ETag {}'.format(key, remote_entry['etag']))
+
+        os.replace(__tmp_path, path)
+
+    finally:
+        if __tmp_path.exists():
+            __tmp_path.unlink()
+
+    return remote_entry['etag']
+
+
+def _upload_with_etag(path, key, config=None, callback=None, client=None):
+    """
+    Upload one local file and return the ETag S3 will report for it. The file is hashed
+    while boto3 reads it (see checksum.EtagReader), so it is read once.
+    """
+    _import_aws()
+    from boto3.s3.transfer import TransferConfig
+
+    __config = config or TransferConfig()
+    __hasher = checksum.EtagHasher([__config.multipart_chunksize])
+
+    with open(path, 'rb') as file:
+        (client or _get_s3_client()).upload_fileobj(Fileobj=checksum.EtagReader(file, __hasher),
+                                                    Bucket=_bucket_name(),
+                                                    Key=key,
+                                                    Config=__config,
+                                                    Callback=callback)
+    return __hasher.upload_etag(__config.multipart_threshold)
+
+
 class ProjectIngest:
         
     def __init__(self, sub_folder, file):
@@ -92,6 +386,12 @@ class ProjectIngest:
         Methods
         -------
             remote_object_list()
+            remote_object_iter()
+            remote_object_info()
+            local_download_gen()
+            remote_read_parquet()
+            s3_key_exist()
+            remote_upload()
         """
         
 
@@ -115,46 +415,71 @@ class ProjectIngest:
         self.__file = file
 
         # Internal Class Variables
-        self.__project_name = 'ems-analytics'
+        self.__project_name = _PROJECT_NAME
 
-        self.__ingest_folder = 'data'
+        self.__ingest_folder = _INGEST_FOLDER
 
-        self.__local_file_path = PureWindowsPath(
-            Path(_project_root).joinpath(self.__project_name,
-                                         self.__ingest_folder,
-                                         self.__sub_folder,
-                                         self.__file))
+        self.__local_file_path = _local_folder_path(self.__sub_folder).joinpath(self.__file)
 
         self.__s3_key = (self.__sub_folder + "/" + self.__file)
         
         
-    def remote_object_list(self):
+    def remote_object_list(self, refresh='full'):
         """
         The method intends to provide a list of the files/objects that
         are stored in AWS S3. This will allow the team look at the files
         that has been stored.
 
         This method will use the Class attribute folder to provide the list
-        of objects stored in the specific s3 folder.        
+        of objects stored in the specific s3 folder. The listing is cached in
+        the local manifest of the folder, see remote_object_iter().
         """
-        
-        try:
-            __response = _aws_session.client('s3').list_objects(
-                Bucket=_BUCKET_NAME, Prefix=self.__sub_folder)
+        return list(self.remote_object_iter(refresh=refresh))
 
-        except botocore.exceptions.ParamValidationError as error:
-            raise ValueError(
-                'The parameters you provided are incorredct: {}'.format(error))
+    def remote_object_iter(self, refresh='full'):
+        """
+        The remote_object_iter() method streams the keys stored in the s3 folder as a
+        generator. Every listing is saved in a local manifest (data/<folder>/.s3_manifest.json)
+        so remote_object_info() and refresh='none' can answer without calling s3.
+
+        Properties:
+        -----------
+            refresh : string (optional)
+                'full', 'incremental' or 'none' (see _list_folder). 'incremental' only asks
+                s3 for the keys after the last known key and misses overwritten, deleted or
+                earlier sorting keys between two full listings. Defaults to 'full'.
+
+        Return
+        ------
+            Generator of s3 keys (e.g., 01_raw/20210225-ems-raw-v04.xlsx)
+        """
+        return _list_folder(self.__sub_folder, refresh=refresh)
 
-        __object_list = list()
+    def remote_object_info(self, refresh='full'):
+        """
+        The remote_object_info() method looks up the instance key in the local manifest.
+        The folder is refreshed only when the key is not in the manifest yet.
+
+        Properties:
+        -----------
+            refresh : string (optional)
+                Refresh mode used when the key is missing from the manifest.
+                Defaults to 'full'.
+
+        Return
+        ------
+            Dictionary : {'size', 'etag', 'last_modified'} or None when the key does not exist.
+        """
+        __entry = _folder_manifest(self.__sub_folder).get(self.__s3_key)
 
-        for item in __response['Contents']:
-            if item['Key'] != str(self.__sub_folder + "/"):
-                __object_list.append(item['Key'])
+        if __entry is None and refresh != 'none':
+            for _ in _list_folder(self.__sub_folder, refresh=refresh):
+                pass
+            __entry = _folder_manifest(self.__sub_folder).get(self.__s3_key)
 
-        return(__object_list)
+        return __entry
 
-    def local_download_gen(self):
+    def local_download_gen(self, incremental=False):
         """
         The local_download_gen() method provides a flexible download experience, this method 
         will take the ProjectIngest class attributes <folder> and <file> to ingest an s3 object 
@@ -163,17 +488,34 @@ class ProjectIngest:
 
         Properties:
         -----------
-            No additional properties required
+            incremental : boolean (optional)
+                When False, the download is skipped if a local file with the same name
+                exist. When True, the local file is compared with the s3 object (size and
+                ETag) and refreshed when they differ. The refreshed file is written through
+                a temporary file and verified while it is streamed. Defaults to False.
         
         Return
         ------
             S3 object / data file (e.g., raw.csv)
         """
         
-        if not os.path.exists(self.__local_file_path):
+        if incremental:
+            __entry = _head_entry(str(self.__s3_key))
+            __manifest = _folder_manifest(self.__sub_folder)
+
+            if __entry is None:
+                print("The {} file does not exist in the {} folder at the S3 bucket.".format(self.__file, self.__sub_folder))
+            elif _local_is_current(__manifest, self.__s3_key, self.__local_file_path, __entry):
+                print('{} file in your local {} folder is up to date'.format(self.__file, self.__sub_folder))
+            else:
+                __etag = _download_verified(self.__s3_key, self.__local_file_path, __entry)
+                __manifest.record_local(self.__s3_key, self.__local_file_path, __etag)
+            __manifest.save()
+
+        elif not os.path.exists(self.__local_file_path):
             try:
-                __response = _aws_session.client('s3').download_file(
-                    Bucket=_BUCKET_NAME, 
+                __response = _get_s3_client().download_file(
+                    Bucket=_bucket_name(), 
                     Key=str(self.__s3_key),
                     Filename=str(self.__local_file_path))
             
@@ -185,6 +527,46 @@ class ProjectIngest:
         else:
             print('{} file already exist in your local {} folder'.format(self.__file, self.__sub_folder))
 
+    def remote_read_parquet(self, columns=None, filters=None, as_arrow=False):
+        """
+        The remote_read_parquet() method reads a parquet object straight from the s3 bucket into
+        a DataFrame without writing it to the local data folder. Only the parquet footer, the
+        requested columns and the row groups whose statistics match the filters are fetched,
+        using ranged reads.
+
+        Properties:
+        -----------
+            columns : list of strings (optional)
+                Columns to return (e.g., ['FireStation', 'Shift', 'PatientOutcome']).
+                Defaults to every column.
+
+            filters : list of tuples (optional)
+                [(column, operator, value), ...] combined with AND, for example
+                [('DispatchTime', '>=', '2020-01-01'), ('FireStation', 'in', [401, 402])].
+                Valid operators are ==, !=, <, <=, >, >=, in, and not in.
+
+            as_arrow : boolean (optional)
+                Return a pyarrow Table instead of a pandas DataFrame. Defaults to False.
+
+        Return
+        ------
+            pandas DataFrame or pyarrow Table
+        """
+        from src.d01_data import remote_parquet
+
+        if Path(self.__file).suffix != '.parquet':
+            raise TypeError("Please validate that '{}' is a parquet file".format(self.__file))
+
+        __entry = _head_entry(str(self.__s3_key))
+        if __entry is None:
+            raise ValueError("The {} file does not exist in the {} folder at the S3 bucket.".format(
+                self.__file, self.__sub_folder))
+
+        __source = remote_parquet.S3RangeFile(_get_s3_client(), _bucket_name(), str(self.__s3_key),
+                                              __entry['size'], etag=__entry['etag'])
+        return remote_parquet.read_parquet(__source, columns=columns, filters=filters,
+                                           as_arrow=as_arrow)
+
     def s3_key_exist(self):
         """
         The s3_key_exist() method is used to validate if an specific s3 key already exist in the s3
@@ -201,8 +583,7 @@ class ProjectIngest:
         """
         
         try:
-            _aws_session.resource('s3').Object(bucket_name=_BUCKET_NAME,
-                                               key=str(self.__s3_key)).load()
+            _get_s3_client().head_object(Bucket=_bucket_name(), Key=str(self.__s3_key))
 
         except botocore.exceptions.ClientError as error:
 
@@ -217,36 +598,504 @@ class ProjectIngest:
             # The object does exist
             return True
 
-    def remote_upload(self):
+    def remote_upload(self, incremental=False):
         """
         The remote_upload() method will upload your local project data file to the S3 bucket. Should
         be only used when the data model is ready for test and validation by another team member.
 
+        Every call checks the key with its own request, use remote_batch_upload() to publish a
+        batch of files with one listing per folder.
+
         Properties:
         -----------
-            No additional properties required
+            incremental : boolean (optional)
+                When False, the upload is skipped if the key already exist. When True, the
+                local file is compared with the s3 object (size and ETag) and uploaded when
+                they differ, the ETag reported by s3 is verified after the upload.
+                Defaults to False.
         
         Return
         ------
             S3 object / data file (e.g., raw.csv)        
         """
-        if self.s3_key_exist():
+        if incremental:
+            __manifest = _folder_manifest(self.__sub_folder)
+
+            if _local_is_current(__manifest, self.__s3_key, self.__local_file_path,
+                                 _head_entry(str(self.__s3_key))):
+                print('The {} file is up to date in the S3 bucket under the key {}'.format(
+                    self.__file, self.__s3_key))
+            else:
+                __etag = _upload_with_etag(self.__local_file_path, str(self.__s3_key))
+                __entry = _head_entry(str(self.__s3_key))
+
+                if __entry is None or __entry['etag'] != __etag:
+                    raise IOError('Integrity check failed for {}: the uploaded object does not '\
+                                  'match the local file'.format(self.__s3_key))
+                __manifest.record_local(self.__s3_key, self.__local_file_path, __etag)
+            __manifest.save()
+
+        elif self.s3_key_exist():
             # return message that a file with that name exist
             print('The {} file already exist in the S3 bucket under the key {}'.format(
                 self.__file, self.__s3_key))
         else:
             # create the session and upload the file
             try:
-                _aws_session.resource('s3').meta.client.upload_file(Filename=str(self.__local_file_path),
-                                                                    Bucket=_BUCKET_NAME,
-                                                                    Key=str(self.__s3_key))
+                _get_s3_client().upload_file(Filename=str(self.__local_file_path),
+                                             Bucket=_bucket_name(),
+                                             Key=str(self.__s3_key))
             except botocore.exceptions.ClientError as error:
                 raise
 
+class _TransferProgress:
+    """
+    Thread safe progress tracker shared by the worker threads of a folder
+    sync. The byte counter is fed by the boto3 transfer callbacks and the
+    object counter by the sync loop once each transfer finishes.
+    """
+
+    def __init__(self, total_objects, total_bytes, progress):
+        self.total_objects = total_objects
+        self.total_bytes = total_bytes
+        self.done_objects = 0
+        self.done_bytes = 0
+        self.__progress = progress
+        self.__lock = threading.Lock()
+
+    def add_bytes(self, amount):
+        with self.__lock:
+            self.done_bytes += amount
+
+    def object_done(self, key, status):
+        with self.__lock:
+            self.done_objects += 1
+            done_objects = self.done_objects
+            done_bytes = self.done_bytes
+
+        if callable(self.__progress):
+            self.__progress(key, status, done_objects, self.total_objects,
+                            done_bytes, self.total_bytes)
+        elif self.__progress:
+            print('[{}/{}] {} {} ({:,.1f} of {:,.1f} MB)'.format(
+                done_objects, self.total_objects, status, key,
+                done_bytes / 2**20, self.total_bytes / 2**20))
+
+
+class ProjectSync:
+
+    def __init__(self, sub_folder, max_workers=8, multipart_chunksize=8 * 2**20,
+                 multipart_concurrency=4, progress=True, client=None):
+        """
+        A class created to download or upload a complete project data folder with the
+        remote s3 bucket. Every transfer shares one pooled client and the objects are
+        moved concurrently by a thread pool, large objects are split in multipart
+        transfers.
+
+        Parameters
+        ----------
+            sub_folder : string (mandatory)
+                The string will represent one of the 6 data folders defined in the project
+                structure (i.e., 01_raw, 02_intermediate, 03_processed, 04_models,
+                05_model_input, 06_reporting)
+
+            max_workers : int (optional)
+                Number of objects transferred at the same time. Defaults to 8.
+
+            multipart_chunksize : int (optional)
+                Part size in bytes used for multipart transfers, objects larger than
+                this size are transferred in parts. Defaults to 8 MB.
+
+            multipart_concurrency : int (optional)
+                Number of parts of a single object transferred at the same time.
+                Defaults to 4.
+
+            progress : boolean or callable (optional)
+                True prints one line per finished object, False is silent. A callable
+                is called as progress(key, status, done_objects, total_objects,
+                done_bytes, total_bytes) after each object. Defaults to True.
+
+            client : boto3 S3 client (optional)
+                Client used instead of the shared project client. Useful to run the
+                sync against a local S3 stand-in.
+
+        Methods
+        -------
+            remote_download(overwrite=False, incremental=False)
+            remote_upload(overwrite=False, incremental=False)
+        """
+
+        if type(sub_folder) is not str: # Validate input 'folder' as string type
+            raise TypeError("Instance Creation: Please enter a string value for the folder attribute.")
+
+        if sub_folder not in _valid_folders: # Validate folder exist
+            raise TypeError("Instance Creation: Please check your folder selection. Valid options are "\
+                            "01_raw, 02_intermediate, 03_processed, 04_models, "\
+                            "05_model_input, and 06_reporting")
+
+        if type(max_workers) is not int or max_workers < 1:
+            raise TypeError("Instance Creation: Please enter a positive integer for max_workers.")
+
+        self.__sub_folder = sub_folder
+        self.__max_workers = max_workers
+        self.__progress = progress
+        self.__client = client
+        self.__local_folder = _local_folder_path(sub_folder)
+        self.__part_size = multipart_chunksize
+        _import_aws()
+        from boto3.s3.transfer import TransferConfig
+
+        self.__transfer_config = TransferConfig(multipart_threshold=multipart_chunksize,
+                                                multipart_chunksize=multipart_chunksize,
+                                                max_concurrency=multipart_concurrency)
+
+    def _client(self):
+        if self.__client is None:
+            return _get_s3_client()
+        return self.__client
+
+    def _remote_objects(self):
+        """
+        Return the manifest entries ({key: {'size', 'etag', 'last_modified'}}) of every object
+        stored under the folder. A sync always lists the folder completely, which also
+        refreshes the local manifest.
+        """
+        for _ in _list_folder(self.__sub_folder, refresh='full', client=self._client()):
+            pass
+
+        return dict(_folder_manifest(self.__sub_folder).entries)
+
+    def _local_files(self):
+        """
+        Return a {key: path} dictionary with every local data file of the folder.
+        """
+        __files = dict()
+
+        for path in sorted(self.__local_folder.rglob('*')):
+            __relative = path.relative_to(self.__local_folder)
+            if any(part.startswith('.') for part in __relative.parts[:-1]):
+                continue # Local caches (e.g., .cache folders) are never synced
+            if path.is_file() and path.suffix in _valid_file_extension:
+                __key = self.__sub_folder + '/' + __relative.as_posix()
+                __files[__key] = path
+
+        return __files
+
+    def _local_path(self, key):
+        return self.__local_folder.joinpath(*key[len(self.__sub_folder) + 1:].split('/'))
+
+    def _run(self, jobs, total_bytes, transfer):
+        """
+        Run transfer(key, tracker) for every key in jobs on the thread pool and
+        collect the per object outcome. A failed object never stops the others.
+        The values returned by transfer are returned in a {key: value} dictionary.
+        """
+        __result = {'transferred': [], 'skipped': [], 'failed': {}}
+        __values = dict()
+        __tracker = _TransferProgress(len(jobs), total_bytes, self.__progress)
+
+        with ThreadPoolExecutor(max_workers=self.__max_workers) as __pool:
+            __futures = {__pool.submit(transfer, key, __tracker): key for key in jobs}
+
+            for __future in as_completed(__futures):
+                __key = __futures[__future]
+                try:
+                    __values[__key] = __future.result()
+                except Exception as error:
+                    # Any error of one object (botocore, boto3 S3UploadFailedError,
+                    # s3transfer, local IO) is recorded against its key
+                    __result['failed'][__key] = str(error)
+                    __tracker.object_done(__key, 'FAILED')
+                else:
+                    __result['transferred'].append(__key)
+                    __tracker.object_done(__key, 'OK')
+
+        __result['transferred'].sort()
+        return __result, __values
+
+    def remote_download(self, overwrite=False, incremental=False):
+        """
+        The remote_download() method downloads every object stored in the s3 folder into
+        the matching local project data folder.
+
+        Properties:
+        -----------
+            overwrite : boolean (optional)
+                When False, objects that already exist locally are skipped.
+                Defaults to False.
+
+            incremental : boolean (optional)
+                When True, only the objects whose size or ETag differ from the local file
+                are downloaded (overwrite is ignored). Each object is streamed to a
+                temporary file, verified against its ETag while it is written and then
+                moved into place. Defaults to False.
+
+        Return
+        ------
+            Dictionary : {'transferred': [keys], 'skipped': [keys], 'failed': {key: error}}
+        """
+        __objects = self._remote_objects()
+        __manifest = _folder_manifest(self.__sub_folder)
+        __jobs = dict()
+        __skipped = list()
+
+        for key, entry in __objects.items():
+            __path = self._local_path(key)
+
+            if incremental:
+                __current = _local_is_current(__manifest, key, __path, entry, self.__part_size)
+            else:
+                __current = not overwrite and __path.exists()
+
+            if __current:
+                __skipped.append(key)
+            else:
+                __jobs[key] = entry
+
+        def __download(key, tracker):
+            __path = self._local_path(key)
+
+            if incremental:
+                return _download_verified(key, __path, __jobs[key], self.__part_size,
+                                          callback=tracker.add_bytes, client=self._client())
+
+            __path.parent.mkdir(parents=True, exist_ok=True)
+            self._client().download_file(Bucket=_bucket_name(),
+                                         Key=key,
+                                         Filename=str(__path),
+                                         Config=self.__transfer_config,
+                                         Callback=tracker.add_bytes)
+
+        __result, __etags = self._run(__jobs, sum(entry['size'] for entry in __jobs.values()),
+                                      __download)
+
+        if incremental:
+            for key, etag in __etags.items():
+                __manifest.record_local(key, self._local_path(key), etag)
+            __manifest.save()
+
+        __result['skipped'] = sorted(__skipped)
+        return __result
+
+    def _selected_files(self, files):
+        """
+        Return the {key: path} dictionary of the requested local files (all data files
+        of the folder when files is None).
+        """
+        __files = self._local_files()
+        if files is None:
+            return __files
+
+        __selected = {self.__sub_folder + '/' + Path(file).as_posix(): None for file in files}
+        __missing = [key for key in __selected if key not in __files]
+        if __missing:
+            raise ValueError('The following files do not exist in your local {} folder: {}'.format(
+                self.__sub_folder, ', '.join(__missing)))
+
+        return {key: __files[key] for key in __selected}
+
+    def remote_diff(self, files=None):
+        """
+        The remote_diff() method answers which local files already exist in the s3 folder
+        and whether they match, using one paginated listing of the folder instead of one
+        HEAD request per file. Existing objects are compared by size and ETag.
+
+        Properties:
+        -----------
+            files : list of strings (optional)
+                File names relative to the local data folder
+                (e.g., ['20210301-ans-patients.parquet']). Defaults to every data file
+                of the local folder.
+
+        Return
+        ------
+            Dictionary : {'missing': [keys], 'changed': [keys], 'current': [keys]}
+        """
+        __files = self._selected_files(files)
+        __objects = self._remote_objects()
+        __manifest = _folder_manifest(self.__sub_folder)
+        __diff = {'missing': [], 'changed': [], 'current': []}
+
+        for key, path in __files.items():
+            if key not in __objects:
+                __diff['missing'].append(key)
+            elif _local_is_current(__manifest, key, path, __objects[key], self.__part_size):
+                __diff['current'].append(key)
+            else:
+                __diff['changed'].append(key)
+
+        __manifest.save()
+        return __diff
+
+    def remote_upload(self, files=None, overwrite=False, incremental=False):
+        """
+        The remote_upload() method uploads the data files of the local project folder to
+        the matching s3 folder. Only files with a valid project extension are uploaded.
+
+        Properties:
+        -----------
+            files : list of strings (optional)
+                File names relative to the local data folder. Defaults to every data file
+                of the local folder.
+
+            overwrite : boolean (optional)
+                When False, files whose key already exist in the s3 bucket are skipped.
+                Defaults to False.
+
+            incremental : boolean (optional)
+                When True, only the files whose size or ETag differ from the s3 object are
+                uploaded (overwrite is ignored), see remote_diff(). The ETags reported by
+                s3 are verified against the local files after the upload. Defaults to False.
+
+        Return
+        ------
+            Dictionary : {'transferred': [keys], 'skipped': [keys], 'failed': {key: error}}
+        """
+        __files = self._selected_files(files)
+
+        if incremental:
+            __diff = self.remote_diff(files)
+            __skipped = __diff['current']
+        else:
+            __objects = self._remote_objects()
+            __skipped = [key for key in __files if not overwrite and key in __objects]
+
+        __skipped = set(__skipped)
+        __jobs = {key: path for key, path in __files.items() if key not in __skipped}
+
+        def __upload(key, tracker):
+            if incremental:
+                return _upload_with_etag(__jobs[key], key, self.__transfer_config,
+                                         callback=tracker.add_bytes, client=self._client())
+
+            self._client().upload_file(Filename=str(__jobs[key]),
+                                       Bucket=_bucket_name(),
+                                       Key=key,
+                                       Config=self.__transfer_config,
+                                       Callback=tracker.add_bytes)
+
+        __result, __etags = self._run(__jobs, sum(path.stat().st_size for path in __jobs.values()),
+                                      __upload)
+
+        if incremental and __etags:
+            # One listing verifies every uploaded object
+            __objects = self._remote_objects()
+            __manifest = _folder_manifest(self.__sub_folder)
+
+            for key, etag in __etags.items():
+                if key in __objects and __objects[key]['etag'] == etag:
+                    __manifest.record_local(key, __jobs[key], etag)
+                else:
+                    __result['transferred'].remove(key)
+                    __result['failed'][key] = 'Integrity check failed: the uploaded object '\
+                                              'does not match the local file'
+            __manifest.save()
+
+        __result['skipped'] = sorted(__skipped)
+        return __result
+
+def _group_keys(keys):
+    """
+    Split '<folder>/<file>' keys into a {folder: [files]} dictionary, validating the
+    folder and the file extension of each key.
+    """
+    __groups = dict()
+
+    for key in keys:
+        __sub_folder, _, __file = str(key).partition('/')
+
+        if __sub_folder not in _valid_folders or not __file:
+            raise TypeError("Please check the key '{}'. Keys must start with one of the folders "\
+                            "01_raw, 02_intermediate, 03_processed, 04_models, "\
+                            "05_model_input, and 06_reporting".format(key))
+
+        if Path(__file).suffix not in _valid_file_extension:
+            raise TypeError("Please validate that '{}' have a valid file extension".format(key))
+
+        __groups.setdefault(__sub_folder, list()).append(__file)
+
+    return __groups
+
+
+def remote_batch_diff(keys, client=None):
+    """
+    The remote_batch_diff() function answers "which of these keys already exist in the s3
+    bucket, and do they match the local files?" for a batch of keys. Each data folder is
+    listed once (paginated), so the number of requests grows with the number of folders
+    and not with the number of files.
+
+    Properties:
+    -----------
+        keys : list of strings (mandatory)
+            S3 keys of local project files (e.g., ['02_intermediate/dfPatients_dedup.parquet']).
+
+        client : boto3 S3 client (optional)
+            Defaults to the shared project client.
+
+    Return
+    ------
+        Dictionary : {'missing': [keys], 'changed': [keys], 'current': [keys]}
+    """
+    __diff = {'missing': [], 'changed': [], 'current': []}
+
+    for sub_folder, files in _group_keys(keys).items():
+        __folder_diff = ProjectSync(sub_folder, progress=False, client=client).remote_diff(files)
+        for status in __diff:
+            __diff[status].extend(__folder_diff[status])
+
+    return __diff
+
+
+def remote_batch_upload(keys, incremental=True, overwrite=False, max_workers=8,
+                        progress=True, client=None):
+    """
+    The remote_batch_upload() function publishes a batch of local project files. The
+    existing keys are found with one listing per data folder (see remote_batch_diff())
+    and the remaining files are uploaded concurrently.
+
+    Properties:
+    -----------
+        keys : list of strings (mandatory)
+            S3 keys of local project files (e.g., ['02_intermediate/dfPatients_dedup.parquet']).
+
+        incremental : boolean (optional)
+            When True, new and changed files are uploaded and verified. When False, only
+            the keys that do not exist yet are uploaded unless overwrite is True.
+            Defaults to True.
+
+        overwrite : boolean (optional)
+            Upload existing keys again when incremental is False. Defaults to False.
+
+        max_workers : int (optional)
+            Number of files uploaded at the same time. Defaults to 8.
+
+        progress : boolean or callable (optional)
+            See ProjectSync. Defaults to True.
+
+        client : boto3 S3 client (optional)
+            Defaults to the shared project client.
+
+    Return
+    ------
+        Dictionary : {'transferred': [keys], 'skipped': [keys], 'failed': {key: error}}
+    """
+    __result = {'transferred': [], 'skipped': [], 'failed': {}}
+
+    for sub_folder, files in _group_keys(keys).items():
+        __folder_result = ProjectSync(sub_folder, max_workers=max_workers, progress=progress,
+                                      client=client).remote_upload(files=files,
+                                                                   overwrite=overwrite,
+                                                                   incremental=incremental)
+        __result['transferred'].extend(__folder_result['transferred'])
+        __result['skipped'].extend(__folder_result['skipped'])
+        __result['failed'].update(__folder_result['failed'])
+
+    return __result
+
 """
     FUTURE WORK:
-        Considering the idea of creating unique raw ingest files that takes the raw .xlsx file and:
-        1. split each workshee of the work book in its separate csv modules
-        2. validate each of the data modules created for proper dtype for each column
-        3. Ingest the validated dtype columns and data module to the 01_raw folder 
+        The raw .xlsx workbook is split by worksheet and validated against a declared dtype
+        schema by src/d01_data/convert_raw.py, which writes year partitioned parquet
+        datasets next to the workbook in the 01_raw folder. Still to do: ingest the
+        converted datasets instead of the workbook.
 """
@@ -0,0 +1,170 @@
+from pathlib import Path
+import json
+import datetime
+
+from src.d00_utils import proj_utils
+
+## LOCAL MANIFEST INDEX
+##
+## A manifest is a small JSON index stored next to the local copy of a
+## data folder (e.g., data/01_raw/.s3_manifest.json). It records the
+## key, size, ETag and last modified date of every object found in the
+## matching S3 folder, so listings and lookups can be answered locally
+## instead of listing the bucket again.
+##
+## A full refresh lists the complete folder and replaces the index. An
+## incremental refresh (opt-in) only lists the keys after the last key
+## in the manifest, which finds the new drops named with a leading date
+## (YYYYMMDD) but misses keys that sort earlier and overwritten or
+## deleted objects. The manifest records the time of the last full
+## listing, and an incremental refresh falls back to a full listing once
+## it is older than FULL_LISTING_MAX_AGE.
+##
+## The manifest also keeps a record of the local files that are known
+## to match an ETag (size and modification time at the moment they were
+## checked). An incremental sync trusts the record while the file stat
+## is unchanged, so local files are only hashed again after they change.
+
+MANIFEST_FILE_NAME = '.s3_manifest.json'
+
+FULL_LISTING_MAX_AGE = datetime.timedelta(hours=24)
+
+
+class FolderManifest:
+
+    def __init__(self, local_folder, sub_folder):
+        """
+        A class created to keep the local index of the objects stored in one remote s3
+        data folder.
+
+        Parameters
+        ----------
+            local_folder : Path (mandatory)
+                The local project data folder where the manifest is stored.
+
+            sub_folder : string (mandatory)
+                The s3 logical folder indexed by the manifest (e.g., 01_raw).
+
+        Methods
+        -------
+            get(key)
+            keys()
+            full_listing_due(max_age=FULL_LISTING_MAX_AGE)
+            update(objects, complete=False)
+            local_etag(key, path)
+            record_local(key, path, etag)
+            save()
+        """
+        self.__path = Path(local_folder).joinpath(MANIFEST_FILE_NAME)
+        self.sub_folder = sub_folder
+        self.listed_at = None
+        self.full_listed_at = None
+        self.entries = dict()
+        self.local = dict()
+
+        if self.__path.exists():
+            with open(self.__path, 'r') as file:
+                __content = json.load(file)
+            self.listed_at = __content.get('listed_at')
+            self.full_listed_at = __content.get('full_listed_at')
+            self.entries = __content.get('objects', dict())
+            self.local = __content.get('local', dict())
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def is_empty(self):
+        return self.listed_at is None
+
+    @property
+    def last_key(self):
+        """
+        The last key in lexicographic order, used as StartAfter for an incremental refresh.
+        """
+        if not self.entries:
+            return None
+        return max(self.entries)
+
+    def full_listing_due(self, max_age=FULL_LISTING_MAX_AGE):
+        """
+        True when the folder has never been listed completely or the last full listing is
+        older than max_age.
+        """
+        if self.full_listed_at is None:
+            return True
+        __age = datetime.datetime.now(datetime.timezone.utc) - datetime.datetime.fromisoformat(self.full_listed_at)
+        return __age > max_age
+
+    def get(self, key):
+        """
+        Return the {'size', 'etag', 'last_modified'} entry of a key or None when unknown.
+        """
+        return self.entries.get(key)
+
+    def keys(self):
+        return sorted(self.entries)
+
+    def update(self, objects, complete=False):
+        """
+        Merge listing results into the manifest.
+
+        Properties:
+        -----------
+            objects : iterable of dict (mandatory)
+                Listing items with the Key, Size, ETag and LastModified fields returned
+                by the S3 list_objects_v2 call.
+
+            complete : boolean (optional)
+                True when objects is a full listing of the folder, keys missing from it
+                are removed from the manifest. Defaults to False.
+        """
+        __entries = dict() if complete else self.entries
+
+        for item in objects:
+            __entries[item['Key']] = {
+                'size': item['Size'],
+                'etag': item['ETag'].strip('"'),
+                'last_modified': proj_utils.datetime_converter_for_json_dumps(item['LastModified'])
+            }
+
+        self.entries = __entries
+        self.listed_at = str(datetime.datetime.now(datetime.timezone.utc))
+        if complete:
+            self.full_listed_at = self.listed_at
+
+    def local_etag(self, key, path):
+        """
+        Return the ETag recorded for a local file, or None when there is no record or the
+        file has been modified since it was recorded.
+        """
+        __record = self.local.get(key)
+        if __record is None:
+            return None
+
+        __stat = Path(path).stat()
+        if __record['size'] != __stat.st_size or __record['mtime_ns'] != __stat.st_mtime_ns:
+            return None
+        return __record['etag']
+
+    def record_local(self, key, path, etag):
+        """
+        Record that the local file currently holds the content identified by etag.
+        """
+        __stat = Path(path).stat()
+        self.local[key] = {'etag': etag.strip('"'),
+                           'size': __stat.st_size,
+                           'mtime_ns': __stat.st_mtime_ns}
+
+    def save(self):
+        """
+        Write the manifest through a temporary file so a reader never sees a partial index.
+        """
+        with proj_utils.atomic_path(self.__path) as __tmp_path, open(__tmp_path, 'w') as file:
+            json.dump({'sub_folder': self.sub_folder,
+                       'listed_at': self.listed_at,
+                       'full_listed_at': self.full_listed_at,
+                       'objects': self.entries,
+                       'local': self.local},
+                      file, indent=1, sort_keys=True)
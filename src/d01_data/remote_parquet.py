@@ -0,0 +1,278 @@
+import io
+import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+## REMOTE PARQUET READS
+##
+## A parquet file keeps its schema and the statistics (min, max, null
+## count) of every column chunk in a footer at the end of the file.
+## Reading through S3RangeFile lets pyarrow fetch only the footer and
+## the byte ranges of the requested column chunks with HTTP range
+## requests, so a query that needs 5 of the 12 Patients columns does
+## not download the other 7. Row groups whose statistics cannot match
+## the filters are skipped before any of their bytes are fetched.
+##
+## Filters follow the pandas/pyarrow convention: a list of
+## (column, operator, value) tuples that must all be true, e.g.
+##
+##      [('DispatchTime', '>=', '2020-01-01'),
+##       ('DispatchTime', '<', '2021-01-01'),
+##       ('FireStation', 'in', [401, 402])]
+
+_valid_operators = ['==', '=', '!=', '<', '<=', '>', '>=', 'in', 'not in']
+
+FOOTER_PREFETCH = 64 * 2**10
+
+
+class S3RangeFile(io.RawIOBase):
+
+    def __init__(self, client, bucket, key, size, etag=None, footer_prefetch=FOOTER_PREFETCH):
+        """
+        A read only, seekable file object backed by HTTP range requests on one s3 object.
+
+        Parameters
+        ----------
+            client : boto3 S3 client (mandatory)
+            bucket : string (mandatory)
+            key : string (mandatory)
+            size : int (mandatory)
+                Object size in bytes (from a HEAD request or the folder manifest).
+            etag : string (optional)
+                When provided every range request is conditional on the ETag, so the
+                object cannot change in the middle of a read.
+            footer_prefetch : int (optional)
+                Number of bytes fetched from the end of the object when the file is
+                opened. It covers the parquet footer in a single request.
+        """
+        super().__init__()
+        self.__client = client
+        self.__bucket = bucket
+        self.__key = key
+        self.__etag = etag
+        self.__size = size
+        self.__position = 0
+
+        self.requests = 0
+        self.bytes_fetched = 0
+
+        self.__tail_start = max(0, size - footer_prefetch)
+        self.__tail = self._fetch(self.__tail_start, size) if size else b''
+
+    def _fetch(self, start, end):
+        """
+        Return the bytes in [start, end) with one range request.
+        """
+        __args = {'Bucket': self.__bucket, 'Key': self.__key,
+                  'Range': 'bytes={}-{}'.format(start, end - 1)}
+        if self.__etag is not None:
+            __args['IfMatch'] = '"{}"'.format(self.__etag.strip('"'))
+
+        __data = self.__client.get_object(**__args)['Body'].read()
+        self.requests += 1
+        self.bytes_fetched += len(__data)
+        return __data
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.__position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.__position = offset
+        elif whence == io.SEEK_CUR:
+            self.__position += offset
+        elif whence == io.SEEK_END:
+            self.__position = self.__size + offset
+        else:
+            raise ValueError('Invalid whence value: {}'.format(whence))
+        return self.__position
+
+    def readinto(self, buffer):
+        __start = self.__position
+        __end = min(self.__size, __start + len(buffer))
+        if __start >= __end:
+            return 0
+
+        if __start >= self.__tail_start:
+            __data = self.__tail[__start - self.__tail_start:__end - self.__tail_start]
+        else:
+            __data = self._fetch(__start, __end)
+
+        buffer[:len(__data)] = __data
+        self.__position += len(__data)
+        return len(__data)
+
+
+def _comparable(value, sample):
+    """
+    Convert a filter value to the type of a statistics value (e.g., '2020-01-01' to a
+    Timestamp when the column holds timestamps).
+    """
+    if isinstance(sample, (datetime.datetime, pd.Timestamp)):
+        timestamp = pd.Timestamp(value)
+        if timestamp.tzinfo is not None and getattr(sample, 'tzinfo', None) is None:
+            timestamp = timestamp.tz_convert(None)
+        return timestamp
+    if isinstance(sample, datetime.date):
+        return pd.Timestamp(value).date()
+    return value
+
+
+def _statistics_match(statistics, operator, value):
+    """
+    Decide from the min/max statistics of a column chunk whether any row could satisfy
+    the filter. Returns True whenever the statistics cannot rule the row group out.
+    """
+    if statistics is None or not statistics.has_min_max:
+        return True
+
+    low, high = statistics.min, statistics.max
+    if isinstance(low, datetime.datetime):
+        low, high = pd.Timestamp(low), pd.Timestamp(high)
+
+    try:
+        if operator in ('==', '='):
+            comparable = _comparable(value, low)
+            return low <= comparable <= high
+        if operator == '!=':
+            comparable = _comparable(value, low)
+            return not (low == high == comparable)
+        if operator == '<':
+            return low < _comparable(value, low)
+        if operator == '<=':
+            return low <= _comparable(value, low)
+        if operator == '>':
+            return high > _comparable(value, high)
+        if operator == '>=':
+            return high >= _comparable(value, high)
+        if operator == 'in':
+            return any(low <= _comparable(item, low) <= high for item in value)
+    except TypeError:
+        # Statistics and filter value are not comparable (e.g., dictionary encoded
+        # values), keep the row group and let the row filter decide.
+        return True
+
+    return True
+
+
+def _matching_row_groups(metadata, filters):
+    """
+    Return the indices of the row groups whose statistics can satisfy every filter.
+    """
+    column_index = {metadata.schema.column(i).path: i for i in range(metadata.num_columns)}
+    groups = list()
+
+    for group in range(metadata.num_row_groups):
+        row_group = metadata.row_group(group)
+        keep = True
+
+        for column, operator, value in filters:
+            if column in column_index:
+                statistics = row_group.column(column_index[column]).statistics
+                if not _statistics_match(statistics, operator, value):
+                    keep = False
+                    break
+
+        if keep:
+            groups.append(group)
+
+    return groups
+
+
+def _filter_mask(column, operator, value):
+    """
+    Return the boolean mask of one filter over an arrow column.
+    """
+    if pa.types.is_dictionary(column.type):
+        column = column.cast(column.type.value_type)
+
+    if operator in ('in', 'not in'):
+        mask = pc.is_in(column, value_set=pa.array(list(value), type=column.type))
+        return pc.invert(mask) if operator == 'not in' else mask
+
+    if pa.types.is_timestamp(column.type) or pa.types.is_date(column.type):
+        value = pd.Timestamp(value)
+        if pa.types.is_date(column.type):
+            value = value.date()
+
+    scalar = pa.scalar(value, type=column.type)
+    function = {'==': pc.equal, '=': pc.equal, '!=': pc.not_equal,
+                '<': pc.less, '<=': pc.less_equal,
+                '>': pc.greater, '>=': pc.greater_equal}[operator]
+    return function(column, scalar)
+
+
+def read_parquet(source, columns=None, filters=None, as_arrow=False):
+    """
+    The read_parquet() function reads the selected columns of a parquet file, skipping the
+    row groups whose statistics do not match the filters, and applies the filters to the
+    remaining rows.
+
+    Properties:
+    -----------
+        source : file path or file object (mandatory)
+            A local parquet file or an S3RangeFile.
+
+        columns : list of strings (optional)
+            Columns to return. Defaults to every column.
+
+        filters : list of tuples (optional)
+            [(column, operator, value), ...] combined with AND. Valid operators are
+            ==, !=, <, <=, >, >=, in, and not in.
+
+        as_arrow : boolean (optional)
+            Return a pyarrow Table instead of a pandas DataFrame. Defaults to False.
+
+    Return
+    ------
+        pandas DataFrame or pyarrow Table
+    """
+    filters = list(filters or [])
+    for condition in filters:
+        if len(condition) != 3 or condition[1] not in _valid_operators:
+            raise ValueError('Please check the filter {}. Valid operators are '\
+                             '==, !=, <, <=, >, >=, in, and not in'.format(condition))
+
+    parquet_file = pq.ParquetFile(source)
+    columns = list(columns) if columns is not None else None
+    read_columns = columns
+    if columns is not None:
+        read_columns = columns + [column for column, _, _ in filters
+                                  if column not in columns]
+        read_columns = list(dict.fromkeys(read_columns))
+
+    groups = _matching_row_groups(parquet_file.metadata, filters)
+
+    if groups:
+        arrow_table = parquet_file.read_row_groups(groups, columns=read_columns,
+                                                   use_pandas_metadata=True)
+    else:
+        arrow_table = parquet_file.schema_arrow.empty_table()
+        if read_columns is not None:
+            arrow_table = arrow_table.drop([name for name in arrow_table.column_names
+                                            if name not in read_columns])
+
+    if filters and arrow_table.num_rows:
+        mask = None
+        for column, operator, value in filters:
+            column_mask = _filter_mask(arrow_table.column(column), operator, value)
+            mask = column_mask if mask is None else pc.and_(mask, column_mask)
+        arrow_table = arrow_table.filter(mask)
+
+    if columns is not None:
+        extra = [name for name in read_columns if name not in columns]
+        if extra:
+            arrow_table = arrow_table.drop(extra)
+
+    if as_arrow:
+        return arrow_table
+    return arrow_table.to_pandas()
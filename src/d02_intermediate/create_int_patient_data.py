@@ -0,0 +1,257 @@
+from pathlib import Path
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.d00_utils import proj_utils
+from src.d00_utils import schema
+from src.d00_utils import id_registry
+
+## PATIENTS INTERMEDIATE DATASET
+##
+## Builds the Patients intermediate dataset (dfPatients_dedup) from the
+## Patients sheet of the raw extract, as the IntermediateDataset-Patients
+## notebook does:
+##
+##      * drop the records without FRDPersonnelStartDate
+##      * drop the duplicate records
+##      * consolidate the records created by multi-entry (instead of
+##        multi-select) of the provider roles: the CrewMemberRoles of a
+##        PatientId and FRDPersonnelID pair are joined with ', ' in the
+##        order they appear, for any number of roles
+##      * add TenureMonths, the months between the provider start date
+##        and the dispatch date
+##      * add the ShiftCode, UnitIdCode, PatientOutcomeCode,
+##        PatientGenderCode and ProviderGenderCode factorized columns
+##        (1, 2, ... in order of appearance) and the Shift_A, Shift_B
+##        and Shift_C one hot columns
+##
+## The role consolidation works on the int64 (PatientId, provider code)
+## composite key of the ID registry (src/d00_utils/id_registry.py) with
+## one grouped aggregate, instead of string keys, cumcount/unstack and
+## merges. Null roles are left out of the joined roles.
+##
+## The dataset is written as typed parquet (and csv for the modules that
+## still read it) to the 02_intermediate folder. Every step is timed.
+##
+## Usage (from the project root):
+##      python -m src.d02_intermediate.create_int_patient_data --csv
+
+RAW_WORKBOOK = '01_raw/20210225-ems-raw-v04.xlsx'
+
+OUTPUT_FILE = '02_intermediate/dfPatients_dedup'
+
+## Factorized code columns and their source column
+CODE_COLUMNS = {
+    'ShiftCode': 'Shift',
+    'UnitIdCode': 'UnitId',
+    'PatientOutcomeCode': 'PatientOutcome',
+    'PatientGenderCode': 'PatientGender',
+    'ProviderGenderCode': 'FRDPersonnelGender'
+}
+
+SHIFT_DUMMIES = {'A - Shift': 'Shift_A', 'B - Shift': 'Shift_B', 'C - Shift': 'Shift_C'}
+
+## np.timedelta64(1, 'M') is the mean Gregorian month
+MONTH_SECONDS = 2629746
+
+ROLE_SEPARATOR = ', '
+
+_data_folder = Path(__file__).resolve().parents[2].joinpath('data')
+
+
+def load_raw_sheet(sheet, source=None):
+    """
+    Read one sheet of the raw extract (Patients, Procedures or Medications) with the
+    registered dtypes.
+
+    Properties:
+    -----------
+        sheet : string (mandatory)
+
+        source : string or Path (optional)
+            The raw workbook (.xlsx) or the parquet conversion of the sheet (see
+            src/d01_data/convert_raw.py). Defaults to the parquet conversion of the
+            project workbook when it exists, the workbook otherwise.
+
+    Return
+    ------
+        DataFrame
+    """
+    table = sheet.lower()
+    if source is None:
+        workbook = _data_folder.joinpath(RAW_WORKBOOK)
+        converted = workbook.with_suffix('').joinpath(table)
+        source = converted if converted.exists() else workbook
+
+    source = Path(source)
+    if source.suffix.lower() in ('.xlsx', '.xls'):
+        df = pd.read_excel(source, sheet_name=sheet, na_values=['NA'])
+        return schema.apply_schema(df[schema.TABLES[table]], table=table)
+
+    return schema.read_parquet(source, table=table, columns=schema.TABLES[table])
+
+
+def load_raw_patients(source=None):
+    """
+    Read the Patients sheet of the raw extract (see load_raw_sheet()).
+    """
+    return load_raw_sheet('Patients', source)
+
+
+def consolidate_crew_roles(df):
+    """
+    Return the records of df with one row per distinct record once CrewMemberRoles is left
+    out, and the CrewMemberRoles of every PatientId and FRDPersonnelID pair joined with ', '
+    in order of appearance. The CrewMemberRoles column is moved to the end, as in the
+    notebook output.
+    """
+    providers = id_registry.get_registry('FRDPersonnelID').encode(df['FRDPersonnelID'])
+    patients = df['PatientId'].to_numpy(dtype=np.int64, na_value=-1)
+    groups, _ = pd.factorize(id_registry.composite_key(patients, providers))
+
+    # Most pairs have a single role, only the pairs with several rows are
+    # aggregated
+    crew_roles = np.asarray(df['CrewMemberRoles'].astype(object).where(df['CrewMemberRoles'].notna(), None))
+    sizes = np.bincount(groups)
+    multi = sizes[groups] > 1
+
+    joined = crew_roles.copy()
+    if multi.any():
+        aggregated = pd.Series(crew_roles[multi]).groupby(groups[multi], sort=False) \
+            .agg(lambda roles: ROLE_SEPARATOR.join(roles.dropna()) or None)
+        joined[multi] = aggregated.reindex(groups[multi]).values
+
+    records = df.drop(columns='CrewMemberRoles')
+    keep = ~records.duplicated().values
+
+    records = records[keep].copy()
+    records['CrewMemberRoles'] = pd.Categorical(joined[keep])
+    return records
+
+
+def tenure_days(dispatch_time, start_date):
+    """
+    Return the days between the start date and the dispatch date (both truncated to the day)
+    as an int64 array, and the mask of the records where both dates are known. The days of
+    the other records are 0.
+    """
+    dispatch = np.asarray(dispatch_time, dtype='datetime64[ns]').astype('datetime64[D]')
+    start = np.asarray(start_date, dtype='datetime64[ns]').astype('datetime64[D]')
+    mask = ~(np.isnat(dispatch) | np.isnat(start))
+
+    days = np.zeros(len(dispatch), dtype=np.int64)
+    days[mask] = (dispatch[mask] - start[mask]).astype(np.int64)
+    return days, mask
+
+
+def tenure_months(dispatch_time, start_date, days=None):
+    """
+    Return the whole months between the start date and the dispatch date (both truncated to
+    the day), as ((DispatchTime.dt.date - FRDPersonnelStartDate.dt.date) /
+    np.timedelta64(1, 'M')).astype(int) computes them. Nulls give a null tenure. days is the
+    (days, mask) result of tenure_days() when it is already computed.
+    """
+    elapsed_days, mask = days if days is not None else tenure_days(dispatch_time, start_date)
+    months = np.trunc(elapsed_days * 86400 / MONTH_SECONDS).astype(np.int64)
+
+    return pd.Series(pd.arrays.IntegerArray(months.astype(np.int16), ~mask),
+                     index=getattr(dispatch_time, 'index', None), name='TenureMonths')
+
+
+def add_derived_columns(df):
+    """
+    Add TenureMonths, the factorized code columns and the Shift one hot columns in place.
+    """
+    df['TenureMonths'] = tenure_months(df['DispatchTime'], df['FRDPersonnelStartDate']).values
+    df['ShiftCode'] = pd.factorize(df['Shift'])[0] + 1
+
+    # The shift labels are compared without surrounding spaces
+    shift = df['Shift'].astype('category')
+    labels = shift.cat.categories.astype(str).str.strip()
+    for label, column in SHIFT_DUMMIES.items():
+        match = np.append(labels == label, False)
+        df[column] = match[shift.cat.codes.values].astype(np.uint8)
+
+    for column, source in CODE_COLUMNS.items():
+        if column != 'ShiftCode':
+            df[column] = pd.factorize(df[source])[0] + 1
+
+    return schema.apply_schema(df, table='patients_intermediate')
+
+
+def write_parquet(df, path):
+    """
+    Write a frame to a parquet file through a temporary file.
+    """
+    with proj_utils.atomic_path(path) as tmp_path:
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), str(tmp_path))
+
+
+def build_patients_intermediate(source=None, out_path=None, csv=False):
+    """
+    The build_patients_intermediate() function builds the Patients intermediate dataset and
+    writes it to parquet.
+
+    Properties:
+    -----------
+        source : string or Path (optional)
+            The raw workbook or its parquet conversion (see load_raw_patients()).
+
+        out_path : string or Path (optional)
+            Output file without suffix. Defaults to data/02_intermediate/dfPatients_dedup.
+
+        csv : boolean (optional)
+            Also write the csv file. Defaults to False.
+
+    Return
+    ------
+        Dictionary : {'rows', 'raw_rows', 'files', 'seconds': {step: seconds}}
+    """
+    out_path = Path(out_path) if out_path is not None else _data_folder.joinpath(OUTPUT_FILE)
+    seconds = dict()
+
+    def timed(step, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        seconds[step] = round(time.perf_counter() - start, 2)
+        return result
+
+    raw = timed('load', load_raw_patients, source)
+
+    def dedup(df):
+        df = df[df['FRDPersonnelStartDate'].notnull()]
+        return consolidate_crew_roles(df.drop_duplicates())
+
+    patients = timed('dedup_roles', dedup, raw)
+    patients = timed('derive', add_derived_columns, patients)
+    patients = patients.reset_index(drop=True)
+
+    files = [out_path.with_suffix('.parquet')]
+    timed('write_parquet', write_parquet, patients, files[0])
+
+    if csv:
+        files.append(out_path.with_suffix('.csv'))
+        timed('write_csv', lambda: patients.to_csv(files[-1], index=False))
+
+    id_registry.get_registry('FRDPersonnelID').save()
+
+    return {'rows': len(patients), 'raw_rows': len(raw), 'files': [str(file) for file in files],
+            'seconds': seconds}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the Patients intermediate dataset.')
+    parser.add_argument('--source', default=None)
+    parser.add_argument('--out-path', default=None)
+    parser.add_argument('--csv', action='store_true')
+    args = parser.parse_args()
+
+    result = build_patients_intermediate(args.source, args.out_path, args.csv)
+    print('{raw_rows:,} raw rows, {rows:,} intermediate rows'.format(**result))
+    for step, seconds in result['seconds'].items():
+        print('{:<15}{:>8.2f}s'.format(step, seconds))
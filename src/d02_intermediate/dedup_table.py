@@ -0,0 +1,346 @@
+from pathlib import Path
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.d00_utils import schema
+from src.d00_utils import row_hash
+
+## STREAMING DEDUPLICATION
+##
+## Drops the duplicate rows of a table (csv file, parquet file or folder
+## of partitions) as df.drop_duplicates() does (the first copy of every
+## row is kept, in the original order), without loading the table. Every
+## row is reduced to a 64-bit (or 128-bit) fingerprint of its values (see
+## src/d00_utils/row_hash.py), and only the fingerprints are kept:
+##
+##      in memory (partitions=1)  the table is read once. The sorted set
+##                                of the fingerprints seen so far (8 or
+##                                16 bytes per distinct row) decides which
+##                                rows of a chunk are new, and the new
+##                                rows are streamed to the parquet output.
+##
+##      partitioned (partitions>1) when the fingerprint set does not fit
+##                                in memory. The row numbers and
+##                                fingerprints are spilled to partitions
+##                                files by fingerprint, each file finds
+##                                the first copy of its rows on its own
+##                                (1/partitions of the set in memory),
+##                                and a second read of the table writes
+##                                the rows marked in a one bit per row
+##                                bitmap.
+##
+## Two different rows share a 64-bit fingerprint with a probability of
+## about n^2 / 2^65 for n distinct rows (1e-8 for a million rows); use
+## bits=128 to make it negligible for any table size.
+##
+## The parquet output has the schema of the source (registered dtypes of
+## table, parquet file schema, csv dtypes over every chunk), so a column
+## that is all null in the first chunks keeps its type. The csv chunks
+## are read with these dtypes too, so a column of numeric-looking text
+## is text (and fingerprinted as text) in every chunk.
+##
+## The result also holds the duplicate counts the notebooks compute by
+## hand (number and percentage of duplicate rows, distinct rows with
+## copies and the largest number of copies of a row).
+##
+## Usage (from the project root):
+##      python -m src.d02_intermediate.dedup_table data/01_raw/20210225-ems-raw-v04/medications \
+##          data/02_intermediate/Medications_dedup.parquet --table medications
+
+DEFAULT_CHUNK_SIZE = 100000
+
+
+def _first_copies(fingerprints):
+    """
+    Return the distinct fingerprints (sorted), the index of their first row and their number
+    of rows.
+    """
+    return np.unique(fingerprints, return_index=True, return_counts=True)
+
+
+def _is_in(sorted_values, values):
+    """
+    Return the position of values in sorted_values and whether they are found.
+    """
+    position = np.searchsorted(sorted_values, values)
+    found = np.zeros(len(values), dtype=bool)
+    if len(sorted_values):
+        inside = position < len(sorted_values)
+        found[inside] = sorted_values[position[inside]] == values[inside]
+    return position, found
+
+
+def _arrow_type(dtype, source_type=None):
+    """
+    Return the arrow type of a registered dtype. Categories keep the value type of the
+    source column (source_type), text otherwise.
+    """
+    if dtype == 'category':
+        values = source_type.value_type if pa.types.is_dictionary(source_type or pa.null()) else source_type
+        return pa.dictionary(pa.int32(), pa.string() if values is None or pa.types.is_null(values) else values)
+    if dtype.startswith('datetime64'):
+        return pa.timestamp('ns')
+    return pa.from_numpy_dtype(np.dtype(dtype.lower()))
+
+
+def _csv_type(dtype):
+    """
+    Return the arrow type of a csv_dtypes() dtype (see src/d00_utils/row_hash.py).
+    """
+    return pa.string() if dtype is str else pa.from_numpy_dtype(np.dtype(dtype))
+
+
+def _source_schema(source, table, csv_dtypes):
+    """
+    Return the arrow schema of the deduplicated table, from the source files instead of the
+    first chunk (whose all-null columns have no type): the registered dtypes of table, the
+    file schema of the parquet files and the dtypes the csv chunks are read with.
+    """
+    files = row_hash.source_files(source)
+    schemas = list()
+
+    csv = [path for path in files if path.suffix == '.csv']
+    if csv:
+        header = list(pd.read_csv(csv[0], nrows=0).columns)
+        dtypes = schema.table_dtypes(table, header) if table is not None else dict()
+        schemas.append(pa.schema([(column, _arrow_type(dtypes[column]) if column in dtypes
+                                   else _csv_type(csv_dtypes[column])) for column in header]))
+
+    for path in files:
+        if path.suffix == '.csv':
+            continue
+        file_schema = pq.ParquetFile(str(path)).schema_arrow
+        dtypes = schema.table_dtypes(table, file_schema.names) if table is not None else dict()
+        schemas.append(pa.schema([(field.name, _arrow_type(dtypes[field.name], field.type)
+                                   if field.name in dtypes else field.type) for field in file_schema]))
+
+    if not schemas:
+        raise ValueError('No rows found in {}'.format(source))
+    return pa.unify_schemas(schemas)
+
+
+def _arrow_column(column, arrow_type):
+    array = pa.array(column, from_pandas=True)
+    if array.type == arrow_type:
+        return array
+    if array.null_count == len(array):
+        return pa.nulls(len(array), arrow_type)
+    if pa.types.is_dictionary(arrow_type):
+        if not pa.types.is_dictionary(array.type):
+            array = array.dictionary_encode()
+        return pa.DictionaryArray.from_arrays(array.indices.cast(arrow_type.index_type),
+                                              array.dictionary.cast(arrow_type.value_type))
+    return array.cast(arrow_type)
+
+
+class _ParquetOutput:
+    """
+    Parquet file written a chunk at a time through a temporary file, with a fixed schema every
+    chunk is cast to.
+    """
+
+    def __init__(self, path, arrow_schema):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.__tmp_path = self.path.with_name(self.path.name + '.tmp')
+        self.__schema = arrow_schema
+        self.__writer = None
+
+    def write(self, df):
+        if self.__writer is None:
+            # The pandas metadata of the first chunk restores the nullable and categorical dtypes
+            __metadata = pa.Table.from_pandas(df.iloc[:0], preserve_index=False).schema.metadata
+            self.__schema = self.__schema.with_metadata(__metadata)
+            self.__writer = pq.ParquetWriter(str(self.__tmp_path), self.__schema)
+
+        __columns = [_arrow_column(df[field.name], field.type) for field in self.__schema]
+        self.__writer.write_table(pa.Table.from_arrays(__columns, schema=self.__schema))
+
+    def close(self, empty):
+        """
+        Close the file, or write the empty frame when no row was written.
+        """
+        if self.__writer is None:
+            self.write(empty)
+        self.__writer.close()
+        os.replace(self.__tmp_path, self.path)
+
+    def abort(self):
+        """
+        Close and delete the temporary file after an error.
+        """
+        if self.__writer is not None:
+            self.__writer.close()
+        if self.__tmp_path.exists():
+            self.__tmp_path.unlink()
+
+
+def _dedup_in_memory(source, output, chunk_size, table, csv_dtypes, bits):
+    seen = np.zeros(0, dtype=np.uint64 if bits == 64 else row_hash.FINGERPRINT_128)
+    copies = np.zeros(0, dtype=np.int64)
+    rows = 0
+    empty = None
+
+    for chunk in row_hash.frame_chunks(source, chunk_size, table, csv_dtypes):
+        fingerprints, first, counts = _first_copies(row_hash.row_fingerprints(chunk, bits))
+        position, found = _is_in(seen, fingerprints)
+
+        # Rows seen in an earlier chunk only add to the copies
+        np.add.at(copies, position[found], counts[found])
+
+        new = ~found
+        output.write(chunk.iloc[np.sort(first[new])])
+
+        # The new fingerprints are sorted, so inserting them at their searchsorted position
+        # keeps the set sorted in one linear pass
+        seen = np.insert(seen, position[new], fingerprints[new])
+        copies = np.insert(copies, position[new], counts[new])
+
+        rows += len(chunk)
+        empty = chunk.iloc[:0] if empty is None else empty
+
+    return rows, copies, empty
+
+
+def _dedup_partitioned(source, output, chunk_size, table, csv_dtypes, bits, partitions, spill_dir):
+    record = np.dtype([('row', '<i8'), ('hash', '<u8')]) if bits == 64 else \
+        np.dtype([('row', '<i8'), ('hi', '<u8'), ('lo', '<u8')])
+    key = ['hash'] if bits == 64 else ['hi', 'lo']
+    copies = list()
+    rows = 0
+
+    with tempfile.TemporaryDirectory(prefix='dedup-', dir=spill_dir) as folder:
+        spill_file = lambda partition: Path(folder).joinpath('{}.fp'.format(partition))
+
+        # First read: spill the row numbers and fingerprints by partition
+        for chunk in row_hash.frame_chunks(source, chunk_size, table, csv_dtypes):
+            fingerprints = row_hash.row_fingerprints(chunk, bits)
+            records = np.empty(len(chunk), dtype=record)
+            records['row'] = np.arange(rows, rows + len(chunk))
+            if bits == 64:
+                records['hash'] = fingerprints
+            else:
+                records['hi'], records['lo'] = fingerprints['hi'], fingerprints['lo']
+
+            partition_of = (records[key[0]] % np.uint64(partitions)).astype(np.int64)
+            for partition in np.unique(partition_of):
+                with open(spill_file(partition), 'ab') as file:
+                    records[partition_of == partition].tofile(file)
+            rows += len(chunk)
+
+        # Each partition marks the first copy of its rows
+        keep = np.zeros((rows + 7) // 8, dtype=np.uint8)
+        for partition in range(partitions):
+            if not spill_file(partition).exists():
+                continue
+            records = np.fromfile(str(spill_file(partition)), dtype=record)
+            _, first, counts = _first_copies(records[key])
+            first_rows = records['row'][first]
+            np.bitwise_or.at(keep, first_rows >> 3, (1 << (first_rows & 7)).astype(np.uint8))
+            copies.append(counts)
+
+    # Second read: write the marked rows
+    offset = 0
+    empty = None
+    for chunk in row_hash.frame_chunks(source, chunk_size, table, csv_dtypes):
+        row = np.arange(offset, offset + len(chunk))
+        mask = (keep[row >> 3] >> (row & 7)) & 1
+        output.write(chunk.iloc[np.flatnonzero(mask)])
+        offset += len(chunk)
+        empty = chunk.iloc[:0] if empty is None else empty
+
+    return rows, np.concatenate(copies) if copies else np.zeros(0, dtype=np.int64), empty
+
+
+def dedup_table(source, out_path, table=None, chunk_size=DEFAULT_CHUNK_SIZE, partitions=1, bits=64,
+                spill_dir=None):
+    """
+    The dedup_table() function writes the rows of a table without their duplicates to a
+    parquet file, reading the table a chunk at a time.
+
+    Properties:
+    -----------
+        source : string, Path or list (mandatory)
+            A csv file, a parquet file, a folder of partition files or a list of those.
+
+        out_path : string or Path (mandatory)
+            The parquet file written.
+
+        table : string (optional)
+            Registered table of src/d00_utils/schema.py, whose dtypes are applied to the
+            chunks. The other csv columns are read with their dtype over the whole file.
+
+        chunk_size : int (optional)
+            Rows read at a time. Defaults to 100,000.
+
+        partitions : int (optional)
+            Number of fingerprint spill files. Defaults to 1 (fingerprint set in memory).
+
+        bits : int (optional)
+            64 or 128 bit fingerprints. Defaults to 64.
+
+        spill_dir : string or Path (optional)
+            Folder of the spill files. Defaults to the system temporary folder.
+
+    Return
+    ------
+        Dictionary : {'rows', 'unique_rows', 'duplicates', 'percent_duplicates',
+        'duplicated_rows', 'max_copies', 'seconds'}
+    """
+    if bits not in (64, 128):
+        raise ValueError('Fingerprints have 64 or 128 bits, not {}'.format(bits))
+    if table is not None and table not in schema.TABLES:
+        raise ValueError('Unknown table {}. Registered tables are: {}'.format(table, ', '.join(schema.TABLES)))
+
+    start = time.perf_counter()
+    # The csv chunks are read (and fingerprinted) with the dtypes of the whole file
+    csv_dtypes = row_hash.source_csv_dtypes(source, table, chunk_size)
+    output = _ParquetOutput(out_path, _source_schema(source, table, csv_dtypes))
+
+    try:
+        if partitions > 1:
+            rows, copies, empty = _dedup_partitioned(source, output, chunk_size, table, csv_dtypes,
+                                                     bits, partitions, spill_dir)
+        else:
+            rows, copies, empty = _dedup_in_memory(source, output, chunk_size, table, csv_dtypes,
+                                                   bits)
+
+        if empty is None:
+            raise ValueError('No rows found in {}'.format(source))
+        output.close(empty)
+    except BaseException:
+        output.abort()
+        raise
+
+    duplicates = rows - len(copies)
+    return {'rows': rows,
+            'unique_rows': len(copies),
+            'duplicates': duplicates,
+            'percent_duplicates': round(duplicates / rows * 100, 4) if rows else 0.0,
+            'duplicated_rows': int((copies > 1).sum()),
+            'max_copies': int(copies.max()) if len(copies) else 0,
+            'seconds': round(time.perf_counter() - start, 2)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a table without its duplicate rows to parquet.')
+    parser.add_argument('source', nargs='+')
+    parser.add_argument('out_path')
+    parser.add_argument('--table', default=None, choices=list(schema.TABLES))
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--partitions', type=int, default=1)
+    parser.add_argument('--bits', type=int, default=64, choices=[64, 128])
+    parser.add_argument('--spill-dir', default=None)
+    args = parser.parse_args()
+
+    result = dedup_table(args.source if len(args.source) > 1 else args.source[0], args.out_path,
+                         args.table, args.chunk_size, args.partitions, args.bits, args.spill_dir)
+    print('{rows:,} rows, {unique_rows:,} unique rows, {duplicates:,} duplicates ({percent_duplicates}%), '
+          '{duplicated_rows:,} rows with copies (up to {max_copies}) in {seconds}s'.format(**result))
@@ -0,0 +1,307 @@
+from pathlib import Path
+import argparse
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.d00_utils import schema
+from src.d00_utils import id_registry
+from src.d02_intermediate import create_int_patient_data
+
+## MASTER TABLES
+##
+## Joins the Procedures and Medications records with the patient and
+## provider attributes of the Patients records, as the
+## IntermediateDataset-Procedures-Pat and -Medications-Pat notebooks do:
+##
+##      * the event records (without their date column) and the patient
+##        attributes (PatientId, FRDPersonnelID, PatientOutcome,
+##        PatientGender, DispatchTime, FRDPersonnelGender and
+##        FRDPersonnelStartDate, without null provider gender) are
+##        deduplicated and joined on the PatientId and FRDPersonnelID pair
+##      * the events of pairs that are not found get the provider
+##        attributes of the FRDPersonnelID and the patient attributes of
+##        the PatientId from the Patients records ("orphans")
+##      * TenureMonths is added
+##
+## The pair is the int64 composite key of the ID registry
+## (src/d00_utils/id_registry.py), so the joins are hash joins on
+## integers instead of merges on 'PatientId_FRDPersonnelID' strings.
+##
+## Each master table is a parquet dataset partitioned by dispatch month
+## (e.g., 03_processed/ProceduresPatients/dispatch_month=2019-07/). The
+## rows of a partition are sorted by PatientId and provider, and written
+## in row groups with min/max statistics, so a reader filtering on the
+## month or on PatientId only reads the matching files and row groups.
+## Records without a dispatch time are written to dispatch_month=0.
+##
+## A build only writes the months that are not in the dataset yet, plus
+## the most recent month already written (a data drop may complete it)
+## and dispatch_month=0. The history is never rebuilt unless rebuild=True.
+##
+## The factorized code columns (PatientOutcomeCode, PatientGenderCode,
+## ProviderGenderCode) and the PatientGender one hot columns depend on
+## the rows read, they are added by read_master_table().
+##
+## Usage (from the project root):
+##      python -m src.d03_processing.create_master_table --tables procedures medications
+
+MASTER_TABLES = {
+    'procedures': {'sheet': 'Procedures',
+                   'date_column': 'Procedure_Performed_Date_Time',
+                   'folder': '03_processed/ProceduresPatients'},
+    'medications': {'sheet': 'Medications',
+                    'date_column': 'Medication_Administered_Date_Time',
+                    'folder': '03_processed/MedicationsPatients'}
+}
+
+PATIENT_COLUMNS = ['PatientId', 'FRDPersonnelID', 'PatientOutcome', 'PatientGender', 'DispatchTime',
+                   'FRDPersonnelGender', 'FRDPersonnelStartDate']
+
+PROVIDER_COLUMNS = ['FRDPersonnelID', 'FRDPersonnelGender', 'FRDPersonnelStartDate']
+
+VISIT_COLUMNS = ['PatientId', 'PatientOutcome', 'PatientGender', 'DispatchTime']
+
+PARTITION_COLUMN = 'dispatch_month'
+
+NULL_PARTITION = '0'
+
+ROW_GROUP_SIZE = 50000
+
+_data_folder = Path(__file__).resolve().parents[2].joinpath('data')
+
+
+def _pair_keys(df):
+    """
+    Return the int64 (PatientId, provider code) key of every record.
+    """
+    providers = id_registry.get_registry('FRDPersonnelID').encode(df['FRDPersonnelID'])
+    patients = df['PatientId'].to_numpy(dtype=np.int64, na_value=-1)
+    return id_registry.composite_key(patients, providers)
+
+
+def _dispatch_months(dispatch_time):
+    """
+    Return the dispatch month partition (YYYY-MM) of every record.
+    """
+    months = np.asarray(dispatch_time, dtype='datetime64[ns]').astype('datetime64[M]')
+    labels = np.where(np.isnat(months), NULL_PARTITION, months.astype(str))
+    return pd.Series(labels, index=getattr(dispatch_time, 'index', None))
+
+
+def join_patients(events, patients, date_column, providers=None):
+    """
+    The join_patients() function joins event records (Procedures or Medications) with the
+    patient and provider attributes of the Patients records.
+
+    Properties:
+    -----------
+        events : DataFrame (mandatory)
+            Procedures or Medications records.
+
+        patients : DataFrame (mandatory)
+            Patients records.
+
+        date_column : string (mandatory)
+            The date column of the events, left out as in the notebooks.
+
+        providers : DataFrame (optional)
+            Patients records the orphan provider attributes are taken from. Defaults to
+            patients.
+
+    Return
+    ------
+        DataFrame : the joined records followed by the orphan records, with TenureMonths
+    """
+    unique_events = events.drop(columns=date_column).drop_duplicates()
+    event_columns = [column for column in unique_events.columns if column not in ('PatientId', 'FRDPersonnelID')]
+    event_keys = _pair_keys(unique_events)
+
+    attributes = patients[PATIENT_COLUMNS].drop_duplicates()
+    attributes = attributes[attributes['FRDPersonnelGender'].notnull()]
+    attribute_keys = _pair_keys(attributes)
+
+    # Events of the pairs found in the patient attributes
+    joined = attributes.assign(_key=attribute_keys) \
+        .merge(unique_events[event_columns].assign(_key=event_keys), on='_key')
+
+    # Orphans: provider attributes by provider and patient attributes by PatientId
+    orphans = unique_events[~np.isin(event_keys, attribute_keys)]
+    provider_attributes = (patients if providers is None else providers)[PROVIDER_COLUMNS].dropna().drop_duplicates()
+    visits = patients[VISIT_COLUMNS].dropna().drop_duplicates()
+    registry = id_registry.get_registry('FRDPersonnelID')
+
+    orphans = orphans.assign(_provider=registry.encode(orphans['FRDPersonnelID'])) \
+        .merge(provider_attributes.drop(columns='FRDPersonnelID')
+               .assign(_provider=registry.encode(provider_attributes['FRDPersonnelID'])), on='_provider') \
+        .merge(visits, on='PatientId')
+    orphans['_key'] = _pair_keys(orphans)
+
+    df = pd.concat([joined, orphans[joined.columns]], ignore_index=True)
+    for column in df.columns:
+        if pd.api.types.is_categorical_dtype(joined[column]) or \
+                pd.api.types.is_categorical_dtype(orphans[column]):
+            df[column] = df[column].astype('category')
+
+    df['TenureMonths'] = create_int_patient_data.tenure_months(df['DispatchTime'],
+                                                               df['FRDPersonnelStartDate']).values
+    return df
+
+
+def _written_months(folder):
+    prefix = PARTITION_COLUMN + '='
+    if not folder.exists():
+        return []
+    return sorted(path.name[len(prefix):] for path in folder.iterdir()
+                  if path.is_dir() and path.name.startswith(prefix))
+
+
+def _write_partition(df, folder, month):
+    """
+    Write one month sorted by key, replacing the previous files of the month.
+    """
+    partition_df = df.sort_values('_key', kind='mergesort').drop(columns='_key').reset_index(drop=True)
+
+    partition = folder.joinpath('{}={}'.format(PARTITION_COLUMN, month))
+    tmp_dir = partition.with_name(partition.name + '.tmp')
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    pq.write_table(pa.Table.from_pandas(partition_df, preserve_index=False),
+                   str(tmp_dir.joinpath('part-0.parquet')),
+                   row_group_size=ROW_GROUP_SIZE, write_statistics=True)
+
+    if partition.exists():
+        shutil.rmtree(partition)
+    os.replace(tmp_dir, partition)
+    return len(partition_df)
+
+
+def build_master_table(table, patients=None, events=None, out_dir=None, rebuild=False):
+    """
+    The build_master_table() function joins an event table with the Patients records and
+    writes the new dispatch months of the master table.
+
+    Properties:
+    -----------
+        table : string (mandatory)
+            procedures or medications.
+
+        patients, events : DataFrame (optional)
+            The raw Patients and event records. Default to the raw extract (see
+            create_int_patient_data.load_raw_sheet()).
+
+        out_dir : string or Path (optional)
+            The master table folder. Defaults to the MASTER_TABLES folder of the table in
+            the data folder.
+
+        rebuild : boolean (optional)
+            Write every month again. Defaults to False.
+
+    Return
+    ------
+        Dictionary : {'written': [months], 'kept': [months], 'rows', 'seconds'}
+    """
+    if table not in MASTER_TABLES:
+        raise ValueError('Unknown master table {}. Valid options are {}'.format(table, ', '.join(MASTER_TABLES)))
+
+    start = time.perf_counter()
+    spec = MASTER_TABLES[table]
+    folder = Path(out_dir) if out_dir is not None else _data_folder.joinpath(spec['folder'])
+
+    if patients is None:
+        patients = create_int_patient_data.load_raw_sheet('Patients')
+    if events is None:
+        events = create_int_patient_data.load_raw_sheet(spec['sheet'])
+
+    # Months to write: the new ones, the last one already written and the
+    # records without dispatch time
+    patient_months = _dispatch_months(patients['DispatchTime'])
+    written = [] if rebuild else [month for month in _written_months(folder) if month != NULL_PARTITION]
+    kept = written[:-1]
+    months = sorted(set(patient_months.unique()) - set(kept))
+
+    # Only the patients and events of those months are joined
+    month_patients = patients[patient_months.isin(months).values]
+    month_events = events[events['PatientId'].isin(month_patients['PatientId'].dropna().unique()).values]
+
+    df = join_patients(month_events, month_patients, spec['date_column'], providers=patients)
+    df_months = _dispatch_months(df['DispatchTime'])
+
+    if rebuild and folder.exists():
+        shutil.rmtree(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+
+    rows = 0
+    written_now = list()
+    for month, index in df.groupby(df_months.values).indices.items():
+        rows += _write_partition(df.iloc[index], folder, month)
+        written_now.append(month)
+
+    id_registry.get_registry('FRDPersonnelID').save()
+
+    return {'written': sorted(written_now), 'kept': kept, 'rows': rows,
+            'seconds': round(time.perf_counter() - start, 2)}
+
+
+def read_master_table(table, months=None, columns=None, data_folder=None):
+    """
+    Read a master table with the registered dtypes and add the PatientOutcomeCode,
+    PatientGenderCode, PatientGender one hot and ProviderGenderCode columns, as the
+    intermediate dataset notebooks do.
+
+    Properties:
+    -----------
+        table : string (mandatory)
+            procedures or medications.
+
+        months : list of strings (optional)
+            Dispatch months to read (e.g., ['2020-01', '2020-02']). Defaults to every month.
+
+        columns : list of strings (optional)
+            Stored columns to read. The code columns are only added when their source
+            column is read.
+
+        data_folder : string or Path (optional)
+
+    Return
+    ------
+        DataFrame
+    """
+    folder = Path(data_folder) if data_folder is not None else _data_folder
+    folder = folder.joinpath(MASTER_TABLES[table]['folder'])
+
+    filters = [(PARTITION_COLUMN, 'in', list(months))] if months is not None else None
+    dataset = pq.ParquetDataset(str(folder), filters=filters, use_legacy_dataset=False) \
+        .read(columns=columns)
+    df = dataset.to_pandas().drop(columns=PARTITION_COLUMN, errors='ignore')
+    df = schema.apply_schema(df, table='{}_intermediate'.format(table))
+
+    if 'PatientOutcome' in df.columns:
+        df['PatientOutcomeCode'] = pd.factorize(df['PatientOutcome'])[0] + 1
+    if 'PatientGender' in df.columns:
+        df['PatientGenderCode'] = pd.factorize(df['PatientGender'])[0] + 1
+        df = pd.concat([df, pd.get_dummies(df['PatientGender'], prefix='PatientGender')], axis=1)
+    if 'FRDPersonnelGender' in df.columns:
+        df['ProviderGenderCode'] = pd.factorize(df['FRDPersonnelGender'])[0] + 1
+
+    return schema.apply_schema(df, table='{}_intermediate'.format(table))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the procedures and medications master tables.')
+    parser.add_argument('--tables', nargs='+', default=list(MASTER_TABLES), choices=list(MASTER_TABLES))
+    parser.add_argument('--rebuild', action='store_true')
+    args = parser.parse_args()
+
+    patients = create_int_patient_data.load_raw_sheet('Patients')
+    for table in args.tables:
+        result = build_master_table(table, patients=patients, rebuild=args.rebuild)
+        print('{:<12} {:>9,} rows {:>3} months written {:>3} kept {:>7}s'.format(
+            table, result['rows'], len(result['written']), len(result['kept']), result['seconds']))
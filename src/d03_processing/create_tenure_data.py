@@ -0,0 +1,165 @@
+from pathlib import Path
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.d00_utils import schema
+from src.d02_intermediate import create_int_patient_data
+
+## PROVIDER TENURE AND TIME TRAVELERS
+##
+## Adds the provider tenure to the Patients intermediate dataset once, so
+## the analyses read it instead of recomputing it from DispatchTime and
+## FRDPersonnelStartDate with .dt.date (one Python date object per row):
+##
+##      TenureMonths    whole months between the start date and the
+##                      dispatch date (see create_int_patient_data)
+##      TenureYears     floor(TenureMonths / 12), as the
+##                      UnderlyingDistPlots notebook computes it
+##      TimeTraveler    the dispatch date is before the provider start
+##                      date, the "time traveler" records of the
+##                      UnderlyingDistPlots notebook
+##
+## The three columns come from one datetime64[D] difference. Note that
+## TenureMonths truncates toward zero, so a record less than a month
+## before the start date has TenureMonths 0 and TimeTraveler True: filter
+## on TimeTraveler, not on TenureMonths >= 0, to drop them.
+##
+## The time traveler summary has one row per provider and start date
+## with time traveler records (the list the notebook builds for the
+## partner to vet), computed with a single groupby:
+##
+##      Records, TimeTravelerRecords, FirstDispatchTime and
+##      MaxDaysBeforeStart (days between the earliest time traveler
+##      dispatch and the start date)
+##
+## Both are written with their registered dtypes (patients_tenure and
+## time_travelers tables of src/d00_utils/schema.py) to 03_processed.
+##
+## Usage (from the project root):
+##      python -m src.d03_processing.create_tenure_data
+##
+##      dfPatients = schema.read_parquet('../data/03_processed/dfPatients_tenure.parquet',
+##                                       table='patients_tenure')
+##      dfGood = dfPatients[~dfPatients['TimeTraveler']]
+
+SOURCE_FILE = '02_intermediate/dfPatients_dedup.parquet'
+
+OUTPUT_FILE = '03_processed/dfPatients_tenure.parquet'
+
+SUMMARY_FILE = '03_processed/TimeTravelers'
+
+_data_folder = Path(__file__).resolve().parents[2].joinpath('data')
+
+
+def add_tenure_columns(df):
+    """
+    Add TenureMonths, TenureYears and TimeTraveler to df in place. Records without a dispatch
+    time or a start date get null tenures and are not time travelers.
+
+    Return
+    ------
+        The same DataFrame
+    """
+    days, mask = create_int_patient_data.tenure_days(df['DispatchTime'], df['FRDPersonnelStartDate'])
+    months = create_int_patient_data.tenure_months(df['DispatchTime'], df['FRDPersonnelStartDate'],
+                                                   days=(days, mask))
+
+    df['TenureMonths'] = months.values
+    years = np.floor_divide(months.to_numpy(dtype=np.int64, na_value=0), 12)
+    df['TenureYears'] = pd.arrays.IntegerArray(years.astype(np.int8), ~mask)
+    df['TimeTraveler'] = mask & (days < 0)
+
+    return df
+
+
+def time_traveler_summary(df):
+    """
+    The time_traveler_summary() function summarizes the time traveler records per provider
+    and start date.
+
+    Properties:
+    -----------
+        df : DataFrame (mandatory)
+            Patients records with DispatchTime and FRDPersonnelStartDate.
+
+    Return
+    ------
+        DataFrame : one row per FRDPersonnelID and FRDPersonnelStartDate with time traveler
+        records, with Records, TimeTravelerRecords, FirstDispatchTime and MaxDaysBeforeStart
+    """
+    days, mask = create_int_patient_data.tenure_days(df['DispatchTime'], df['FRDPersonnelStartDate'])
+    traveler = mask & (days < 0)
+
+    summary = pd.DataFrame({'FRDPersonnelID': df['FRDPersonnelID'].values,
+                            'FRDPersonnelStartDate': df['FRDPersonnelStartDate'].values,
+                            'DispatchTime': df['DispatchTime'].values,
+                            'Traveler': traveler,
+                            'DaysBefore': np.where(traveler, -days, 0)}) \
+        .groupby(['FRDPersonnelID', 'FRDPersonnelStartDate'], observed=True) \
+        .agg(Records=('Traveler', 'size'),
+             TimeTravelerRecords=('Traveler', 'sum'),
+             FirstDispatchTime=('DispatchTime', 'min'),
+             MaxDaysBeforeStart=('DaysBefore', 'max'))
+
+    summary = summary[summary['TimeTravelerRecords'] > 0].reset_index()
+    return schema.apply_schema(summary, table='time_travelers')
+
+
+def build_tenure_data(source=None, out_path=None, summary_path=None):
+    """
+    The build_tenure_data() function adds the tenure columns to the Patients intermediate
+    dataset and writes it with the time traveler summary.
+
+    Properties:
+    -----------
+        source : string or Path (optional)
+            The Patients intermediate dataset (.parquet or .csv). Defaults to
+            data/02_intermediate/dfPatients_dedup.parquet.
+
+        out_path : string or Path (optional)
+            Defaults to data/03_processed/dfPatients_tenure.parquet.
+
+        summary_path : string or Path (optional)
+            Summary file without suffix, written as parquet and csv. Defaults to
+            data/03_processed/TimeTravelers.
+
+    Return
+    ------
+        Dictionary : {'rows', 'time_traveler_rows', 'providers', 'files', 'seconds'}
+    """
+    start = time.perf_counter()
+    source = Path(source) if source is not None else _data_folder.joinpath(SOURCE_FILE)
+    out_path = Path(out_path) if out_path is not None else _data_folder.joinpath(OUTPUT_FILE)
+    summary_path = Path(summary_path) if summary_path is not None else _data_folder.joinpath(SUMMARY_FILE)
+
+    if source.suffix.lower() == '.csv':
+        df = schema.read_csv(source, table='patients_intermediate')
+    else:
+        df = schema.read_parquet(source, table='patients_intermediate')
+
+    df = schema.apply_schema(add_tenure_columns(df), table='patients_tenure')
+    summary = time_traveler_summary(df)
+
+    files = [out_path, summary_path.with_suffix('.parquet'), summary_path.with_suffix('.csv')]
+    create_int_patient_data.write_parquet(df, files[0])
+    create_int_patient_data.write_parquet(summary, files[1])
+    summary.to_csv(files[2], index=False)
+
+    return {'rows': len(df), 'time_traveler_rows': int(df['TimeTraveler'].sum()),
+            'providers': len(summary), 'files': [str(file) for file in files],
+            'seconds': round(time.perf_counter() - start, 2)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Add the provider tenure and the time traveler flag.')
+    parser.add_argument('--source', default=None)
+    parser.add_argument('--out-path', default=None)
+    parser.add_argument('--summary-path', default=None)
+    args = parser.parse_args()
+
+    result = build_tenure_data(args.source, args.out_path, args.summary_path)
+    print('{rows:,} rows, {time_traveler_rows:,} time traveler rows from {providers:,} providers '
+          '({seconds}s)'.format(**result))
@@ -0,0 +1,398 @@
+from pathlib import Path
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+import pandas as pd
+from pandas import DataFrame
+
+from src.d00_utils import proj_utils
+from src.d00_utils import schema
+from src.d00_utils import row_hash
+from src.d00_utils import pipeline
+from src.d06_reporting.VennAnalysisReport import HyperLogLog
+
+## DATA QUALITY PROFILE
+##
+## Profiles a table (csv file, parquet file or folder of partitions) in
+## one chunked pass, with the measures of the data quality assessment
+## notebook:
+##
+##      Duplicates      rows equal to an earlier row (df.duplicated())
+##      Nulls           null values per column (df.isnull().sum())
+##      Unique          distinct values per column, null counted as a
+##                      value (df.nunique(dropna=False))
+##      Category        Numerical, Date, Text (Unique) or Categorical
+##                      (get_var_category() of the intermediate dataset
+##                      notebooks)
+##
+## Every value is reduced to a 64-bit hash and every row to the
+## combination of its column hashes (see src/d00_utils/row_hash.py).
+## Memory grows with the number of distinct values (8 bytes each) in
+## exact mode, or is fixed to one HyperLogLog sketch per column (16 KB by
+## default) in approximate mode, never with the number of rows.
+## In approximate mode the duplicates are the rows less the estimated
+## distinct rows, within about 1% of the rows.
+##
+## Note that the notebook reports the percentage of nulls of the
+## deduplicated rows, the profile reports it of all rows.
+##
+## The profile also holds the content hash of the table (sha1 of its
+## column names and row hashes), which tells whether the data changed
+## whatever the file name, format or modification time.
+##
+## The report is written to data/06_reporting as DataQuality-<name>.csv
+## (one row per column) and .json (the full profile). When the content
+## hash differs from the last report, the last report is kept as
+## DataQuality-<name>-previous.json and the changes between both are
+## written to DataQuality-<name>-diff.csv. The drop label of a profile is
+## the --drop argument, the YYYYMMDD date of the source path or the start
+## of the content hash.
+##
+## The default sources are the sheets of the latest converted raw drop
+## (the last dated folder of 01_raw with a patients sheet) and the
+## Patients intermediate dataset.
+##
+## Usage (from the project root):
+##      python -m src.d06_reporting.DataQualityReport --drop 20210225
+##      python -m src.d06_reporting.DataQualityReport data/01_raw/new.csv --name new
+
+RAW_SHEETS = ['patients', 'procedures', 'medications']
+
+DEFAULT_SOURCES = {
+    'patients_intermediate': ('02_intermediate/dfPatients_dedup.parquet', 'patients_intermediate')
+}
+
+_data_folder = Path(__file__).resolve().parents[2].joinpath('data')
+_reporting_folder = _data_folder.joinpath('06_reporting')
+
+
+def _var_category(numeric, date, unique, rows):
+    """
+    get_var_category() of the notebooks, from the profile of a column.
+    """
+    if numeric:
+        return 'Numerical'
+    elif date:
+        return 'Date'
+    elif unique == rows:
+        return 'Text (Unique)'
+    else:
+        return 'Categorical'
+
+
+def _drop_label(source):
+    """
+    Return the YYYYMMDD date that starts the file or folder names of a source (the project
+    naming convention of the data drops), or None.
+    """
+    path = Path(source[0] if isinstance(source, (list, tuple)) else source)
+    for part in reversed(path.parts):
+        match = re.match(r'(\d{8})', part)
+        if match:
+            return match.group(1)
+    return None
+
+
+def _latest_raw_folder(data_folder=None):
+    """
+    Return the relative path of the last raw drop folder (in name order, so in date order)
+    holding converted sheets, or the pipeline raw folder when there is none.
+    """
+    raw = Path(data_folder or _data_folder).joinpath('01_raw')
+    folders = sorted(folder.name for folder in raw.iterdir()
+                     if folder.is_dir() and folder.joinpath(RAW_SHEETS[0]).exists()) \
+        if raw.is_dir() else []
+    return '01_raw/' + folders[-1] if folders else pipeline.RAW_FOLDER
+
+
+def default_sources(data_folder=None):
+    """
+    Return the {name: (path, registered table)} default sources: the sheets of the latest
+    raw drop and DEFAULT_SOURCES, under the data folder.
+    """
+    data_folder = Path(data_folder or _data_folder)
+    raw_folder = _latest_raw_folder(data_folder)
+    sources = {sheet: (data_folder.joinpath(raw_folder, sheet), sheet) for sheet in RAW_SHEETS}
+    sources.update({name: (data_folder.joinpath(path), table)
+                    for name, (path, table) in DEFAULT_SOURCES.items()})
+    return sources
+
+
+class DataQualityProfile:
+
+    def __init__(self, source, name=None, table=None, chunk_size=100000, approximate=False,
+                 precision=14, drop=None):
+        """
+        A class created to profile the duplicates, nulls, distinct values and variable
+        category of every column of a table in one chunked pass.
+
+        Parameters
+        ----------
+            source : string, Path or list (mandatory)
+                A csv file, a parquet file, a folder of partition files or a list of those.
+
+            name : string (optional)
+                Report name. Defaults to the source file or folder name.
+
+            table : string (optional)
+                Registered table of src/d00_utils/schema.py, whose dtypes are applied to
+                the chunks. Defaults to the dtypes of the file.
+
+            chunk_size : int (optional)
+                Rows read at a time. Defaults to 100,000.
+
+            approximate : boolean (optional)
+                Estimate the distinct values and rows with HyperLogLog sketches. Defaults
+                to False.
+
+            precision : int (optional)
+                HyperLogLog precision (register index bits). Defaults to 14.
+
+            drop : string (optional)
+                Data drop label of the source. Defaults to the YYYYMMDD date of its path,
+                or the first 12 characters of the content hash.
+
+        Methods
+        -------
+            summary()
+            columns()
+            to_dict()
+            diff(previous)
+        """
+        __first = source[0] if isinstance(source, (list, tuple)) else source
+        self.name = name or Path(__first).stem
+        self.source = [str(item) for item in source] if isinstance(source, (list, tuple)) else str(source)
+        self.table = table
+        self.approximate = approximate
+
+        __new = (lambda: HyperLogLog(precision)) if approximate else row_hash.UniqueHashes
+        __rows = __new()
+        __columns = dict()
+        __content = hashlib.sha1()
+        self.rows = 0
+
+        for chunk in row_hash.frame_chunks(source, chunk_size, table):
+            __row_hashes = np.zeros(len(chunk), dtype=np.uint64)
+
+            for column in chunk.columns:
+                if column not in __columns:
+                    __content.update(column.encode() + b'\0')
+                    __columns[column] = {'distinct': __new(), 'nulls': 0, 'numeric': True, 'date': True,
+                                         'dtype': str(chunk[column].dtype)}
+                __stats = __columns[column]
+
+                __hashes, __nulls = row_hash.column_hashes(chunk[column])
+                __stats['distinct'].add(__hashes)
+                __stats['nulls'] += int(__nulls.sum())
+                __stats['numeric'] &= bool(pd.api.types.is_numeric_dtype(chunk[column]))
+                __stats['date'] &= bool(pd.api.types.is_datetime64_dtype(chunk[column]))
+
+                __row_hashes = row_hash.combine_hashes(__row_hashes, __hashes)
+
+            __rows.add(__row_hashes)
+            __content.update(__row_hashes.tobytes())
+            self.rows += len(chunk)
+
+        self.content_hash = __content.hexdigest()
+        self.drop = drop or _drop_label(source) or self.content_hash[:12]
+
+        self.distinct_rows = self.__count(__rows)
+        self.__columns = [{'Column': column,
+                           'Dtype': stats['dtype'],
+                           'Category': None,
+                           'Nulls': stats['nulls'],
+                           'Unique': self.__count(stats['distinct']),
+                           'numeric': stats['numeric'],
+                           'date': stats['date']}
+                          for column, stats in __columns.items()]
+
+        for column in self.__columns:
+            column['Category'] = _var_category(column.pop('numeric'), column.pop('date'),
+                                               column['Unique'], self.rows)
+            column['Percent Null'] = round(column['Nulls'] / self.rows * 100, 2) if self.rows else 0.0
+
+    def __count(self, distinct):
+        if self.approximate:
+            return min(int(round(distinct.estimate())), self.rows)
+        return len(distinct.flush())
+
+    def summary(self):
+        """
+        Return {'name', 'drop', 'content_hash', 'source', 'rows', 'columns', 'duplicates',
+        'percent_duplicates', 'approximate'}.
+        """
+        __duplicates = self.rows - self.distinct_rows
+        return {'name': self.name,
+                'drop': self.drop,
+                'content_hash': self.content_hash,
+                'source': self.source,
+                'rows': self.rows,
+                'columns': len(self.__columns),
+                'duplicates': __duplicates,
+                'percent_duplicates': round(__duplicates / self.rows * 100, 4) if self.rows else 0.0,
+                'approximate': self.approximate}
+
+    def columns(self):
+        """
+        Return one row per column with its Dtype, Category, Nulls, Percent Null and Unique.
+        """
+        return DataFrame(self.__columns, columns=['Column', 'Dtype', 'Category', 'Nulls', 'Percent Null',
+                                                  'Unique'])
+
+    def to_dict(self):
+        return dict(self.summary(), profiled=datetime.datetime.now().isoformat(timespec='seconds'),
+                    column_profiles=self.__columns)
+
+    def diff(self, previous):
+        """
+        Return the changes from a previous profile (to_dict() of the previous drop): one row
+        per column of either profile, plus a (rows) and a (duplicates) row.
+
+        Return
+        ------
+            DataFrame : Column, Change (added, removed, changed or unchanged), previous and
+            current Dtype, Category, Nulls, Percent Null and Unique, and their deltas
+        """
+        __current = self.columns().set_index('Column')
+        __previous = DataFrame(previous['column_profiles'],
+                               columns=['Column', 'Dtype', 'Category', 'Nulls', 'Percent Null',
+                                        'Unique']).set_index('Column')
+
+        __summary = self.summary()
+        for label, key in (('(rows)', 'rows'), ('(duplicates)', 'duplicates')):
+            __current.loc[label, 'Nulls'] = np.nan
+            __current.loc[label, 'Unique'] = __summary[key]
+            __previous.loc[label, 'Unique'] = previous[key]
+
+        __diff = __previous.join(__current, how='outer', lsuffix=' Previous', rsuffix=' Current')
+        __diff = __diff.reindex(list(__current.index) + [column for column in __previous.index
+                                                         if column not in __current.index])
+
+        for measure in ('Nulls', 'Percent Null', 'Unique'):
+            __diff[measure + ' Delta'] = __diff[measure + ' Current'] - __diff[measure + ' Previous']
+
+        __labels = __diff[['Dtype Previous', 'Dtype Current', 'Category Previous', 'Category Current']].fillna('')
+        __changed = (__labels['Dtype Previous'] != __labels['Dtype Current']) | \
+            (__labels['Category Previous'] != __labels['Category Current']) | \
+            (__diff[['Nulls Delta', 'Unique Delta']].fillna(0) != 0).any(axis=1)
+        __diff['Change'] = np.select([__diff.index.isin(__previous.index) & ~__diff.index.isin(__current.index),
+                                      __diff.index.isin(__current.index) & ~__diff.index.isin(__previous.index),
+                                      __changed],
+                                     ['removed', 'added', 'changed'], default='unchanged')
+
+        return __diff.reset_index().rename(columns={'index': 'Column'})
+
+
+def write_report(profile, out_dir=None):
+    """
+    The write_report() function writes a profile to the reporting folder and compares it with
+    the profile of the previous content of the source.
+
+    Properties:
+    -----------
+        profile : DataQualityProfile (mandatory)
+
+        out_dir : string or Path (optional)
+            Defaults to data/06_reporting.
+
+    Return
+    ------
+        List of the files written
+    """
+    out_dir = Path(out_dir) if out_dir is not None else _reporting_folder
+    out_dir.mkdir(parents=True, exist_ok=True)
+    prefix = 'DataQuality-{}'.format(profile.name)
+
+    json_path = out_dir.joinpath(prefix + '.json')
+    previous_path = out_dir.joinpath(prefix + '-previous.json')
+    diff_path = out_dir.joinpath(prefix + '-diff.csv')
+
+    # The last report becomes the previous one when the content changed
+    if json_path.exists():
+        last = json.loads(json_path.read_text())
+        if last.get('content_hash') != profile.content_hash:
+            os.replace(json_path, previous_path)
+
+    files = [out_dir.joinpath(prefix + '.csv'), json_path]
+    proj_utils.write_text_atomic(files[0], profile.columns().to_csv(index=False))
+    proj_utils.write_text_atomic(files[1], json.dumps(profile.to_dict(), indent=1, default=str))
+
+    if previous_path.exists():
+        previous = json.loads(previous_path.read_text())
+        proj_utils.write_text_atomic(diff_path, profile.diff(previous).to_csv(index=False))
+        files.append(diff_path)
+
+    return [str(file) for file in files]
+
+
+def data_quality_report(sources=None, out_dir=None, chunk_size=100000, approximate=False, drop=None):
+    """
+    The data_quality_report() function profiles the project tables and writes their reports.
+
+    Properties:
+    -----------
+        sources : dictionary (optional)
+            {name: (path, registered table or None)}. Defaults to default_sources(), the
+            sheets of the latest raw drop and the Patients intermediate dataset. Missing
+            sources are skipped.
+
+        out_dir : string or Path (optional)
+            Defaults to data/06_reporting.
+
+        chunk_size : int (optional)
+            Rows read at a time. Defaults to 100,000.
+
+        approximate : boolean (optional)
+            Estimate the distinct counts with HyperLogLog sketches. Defaults to False.
+
+        drop : string (optional)
+            Data drop label of every profile. Defaults to the label of each source (see
+            DataQualityProfile).
+
+    Return
+    ------
+        A pandas DataFrame with the summary of every profiled source.
+    """
+    sources = sources if sources is not None else default_sources()
+    rows = list()
+
+    for name, (path, table) in sources.items():
+        if not all(Path(item).exists() for item in (path if isinstance(path, (list, tuple)) else [path])):
+            print('Skipping {}: {} not found'.format(name, path))
+            continue
+
+        profile = DataQualityProfile(path, name=name, table=table, chunk_size=chunk_size,
+                                     approximate=approximate, drop=drop)
+        write_report(profile, out_dir)
+        rows.append(profile.summary())
+
+    return DataFrame(rows, columns=['name', 'drop', 'rows', 'columns', 'duplicates',
+                                    'percent_duplicates'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Profile the data quality of the project tables.')
+    parser.add_argument('sources', nargs='*', help='csv/parquet files or folders, defaults to the '
+                                                     'raw sheets and the Patients intermediate dataset')
+    parser.add_argument('--name', default=None)
+    parser.add_argument('--table', default=None, choices=list(schema.TABLES))
+    parser.add_argument('--out-dir', default=None)
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    parser.add_argument('--approximate', action='store_true')
+    parser.add_argument('--drop', default=None, help='data drop label, defaults to the YYYYMMDD '
+                                                       'date of the source or its content hash')
+    args = parser.parse_args()
+
+    sources = None
+    if args.sources:
+        name = args.name or Path(args.sources[0]).stem
+        sources = {name: (args.sources if len(args.sources) > 1 else args.sources[0], args.table)}
+
+    print(data_quality_report(sources, args.out_dir, args.chunk_size, args.approximate, args.drop)
+          .to_string(index=False))
@@ -1,11 +1,505 @@
+from pathlib import Path
+import tempfile
+
 import numpy as np
 
 import pandas as pd
 from pandas import Series, DataFrame
 
-from matplotlib_venn import venn3_unweighted
+from matplotlib_venn import venn2_unweighted, venn3_unweighted
 from matplotlib import pyplot as plt
 
+from src.d00_utils import row_hash
+
+
+_key_labels = {'PatientId': 'Patients',
+               'FRDPersonnelID': 'Providers',
+               'comp_idx': 'Compound IDs: Patient & Provider'}
+
+_default_sources = ('Patients', 'Procedures', 'Medications')
+
+# Observations of the three dataset analysis, in region (bitmask) order
+_default_observations = [
+    '{} that only exist in Patients',
+    '{} that only exist in the Procedures but not in Patients (?)',
+    '{} that exist in Patients and Procedures',
+    '{} that only exists in the Medications but not in Patients (?)',
+    '{} that exists in Patients and Medications',
+    '{} that exists in Procedures and Medications only but not in Patients (?)',
+    '{} that exists in all datasets'
+]
+
+MAX_SOURCES = 16
+
+
+def _key_label(key_id):
+    return _key_labels.get(key_id, key_id)
+
+
+def _region_observation(key_label, names, region):
+    """
+    Describe the region (bitmask over names) of an N dataset analysis. The first dataset is
+    the reference every other dataset is compared to.
+    """
+    __members = [name for bit, name in enumerate(names) if region >> bit & 1]
+    __reference = names[0]
+
+    if len(__members) == len(names):
+        return '{} that exist in all datasets'.format(key_label)
+    if __members == [__reference]:
+        return '{} that only exist in {}'.format(key_label, __reference)
+    if len(__members) == 1:
+        return '{} that only exist in the {} but not in {} (?)'.format(key_label, __members[0],
+                                                                     __reference)
+
+    __joined = ', '.join(__members[:-1]) + ' and ' + __members[-1]
+    if __reference in __members:
+        return '{} that exist in {}{}'.format(key_label, __joined,
+                                             ' only' if len(names) > 3 else '')
+    return '{} that exist in {} only but not in {} (?)'.format(key_label, __joined, __reference)
+
+
+def _observations_frame(key_id, names, counts):
+    """
+    Build the observations DataFrame from the region counts (index 1 to 2^N-1, in bitmask
+    order) of an analysis over the names datasets.
+    """
+    __key_label = _key_label(key_id)
+
+    if tuple(names) == _default_sources:
+        __observations = [observation.format(__key_label) for observation in _default_observations]
+    else:
+        __observations = [_region_observation(__key_label, names, region)
+                          for region in range(1, 2**len(names))]
+
+    return DataFrame({
+        'Observations': __observations,
+        'Count': [int(count) for count in counts[1:]]
+    }).set_index('Observations')
+
+
+class VennAnalysis:
+
+    def __init__(self, key_id, sources):
+        """
+        A class created to compute the Venn regions of one key across several datasets in a
+        single vectorized pass. Every distinct ID gets a membership bitmask (bit i is set when
+        the ID exists in the i-th dataset), so the count and the IDs of every region come
+        from the same computation and are shared by the table, the diagram and the missing
+        IDs outputs. Null IDs are ignored.
+
+        Parameters
+        ----------
+            key_id : string (mandatory)
+                The ID/Column used for the analysis (i.e., PatientId, FRDPersonnelID, comp_idx).
+
+            sources : dictionary (mandatory)
+                {dataset name: pandas Series of IDs}, the first dataset is the reference
+                (e.g., {'Patients': ..., 'Procedures': ..., 'Medications': ...}). Up to 16
+                datasets (e.g., adding a billing or dispatch table).
+
+        Methods
+        -------
+            region_counts()
+            region_ids(*names)
+            missing_ids(reference=None)
+            observations()
+            diagram()
+        """
+        if not 0 < len(sources) <= MAX_SOURCES:
+            raise ValueError('The Venn analysis needs between 1 and {} datasets'.format(MAX_SOURCES))
+
+        self.key_id = key_id
+        self.names = list(sources)
+
+        __columns = [Series(column) for column in sources.values()]
+        __codes, self.ids = pd.factorize(pd.concat(__columns, ignore_index=True))
+
+        self.masks = np.zeros(len(self.ids), dtype=np.int64)
+        __start = 0
+        for bit, column in enumerate(__columns):
+            __source_codes = __codes[__start:__start + len(column)]
+            self.masks[__source_codes[__source_codes >= 0]] |= 1 << bit
+            __start += len(column)
+
+        self.__counts = np.bincount(self.masks, minlength=2**len(self.names))
+
+    def _region(self, names):
+        __unknown = [name for name in names if name not in self.names]
+        if __unknown:
+            raise ValueError('Unknown datasets: {}. Valid options are {}'.format(
+                ', '.join(__unknown), ', '.join(self.names)))
+        return sum(1 << self.names.index(name) for name in names)
+
+    def region_counts(self):
+        """
+        Return the counts of the 2^N-1 regions as a Series indexed by region bitmask.
+        """
+        return Series(self.__counts[1:], index=pd.RangeIndex(1, 2**len(self.names), name='Region'),
+                      name='Count')
+
+    def region_ids(self, *names):
+        """
+        Return the IDs that exist in exactly the named datasets
+        (e.g., region_ids('Procedures', 'Medications')).
+        """
+        return self.ids[self.masks == self._region(names)]
+
+    def missing_ids(self, reference=None):
+        """
+        Return the IDs that do not exist in the reference dataset (defaults to the first one).
+        """
+        __bit = self._region([reference if reference is not None else self.names[0]])
+        return self.ids[(self.masks & __bit) == 0]
+
+    def observations(self):
+        """
+        Return the observations DataFrame (one row per region, in bitmask order).
+        """
+        return _observations_frame(self.key_id, self.names, self.__counts)
+
+    def diagram(self):
+        """
+        Return the unweighted Venn diagram of a two or three dataset analysis.
+        """
+        if len(self.names) == 3:
+            return venn3_unweighted(subsets=tuple(int(count) for count in self.__counts[1:]),
+                                    set_labels=tuple(self.names),
+                                    set_colors=('#d7191c', '#abdda4', '#2b83ba'),
+                                    alpha=0.8)
+        if len(self.names) == 2:
+            return venn2_unweighted(subsets=tuple(int(count) for count in self.__counts[1:]),
+                                    set_labels=tuple(self.names),
+                                    set_colors=('#d7191c', '#abdda4'),
+                                    alpha=0.8)
+        raise ValueError('Venn diagrams are available for 2 or 3 datasets, use observations() '\
+                         'for {} datasets'.format(len(self.names)))
+
+
+
+def _key_chunks(source, key_id, chunk_size):
+    """
+    Yield the key column of a csv file, a parquet file, a folder of parquet/csv partitions or
+    a list of those, chunk_size rows at a time.
+    """
+    if isinstance(source, (list, tuple)):
+        for item in source:
+            yield from _key_chunks(item, key_id, chunk_size)
+        return
+
+    __path = Path(source)
+    if __path.is_dir():
+        for item in sorted(__path.rglob('*')):
+            if item.suffix in ('.parquet', '.csv') and item.is_file():
+                yield from _key_chunks(item, key_id, chunk_size)
+        return
+
+    if __path.suffix == '.csv':
+        for chunk in pd.read_csv(__path, usecols=[key_id], chunksize=chunk_size):
+            yield chunk[key_id]
+    else:
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(str(__path)).iter_batches(batch_size=chunk_size, columns=[key_id]):
+            yield Series(np.asarray(batch.column(0).to_pandas()))
+
+
+def _hash_keys(keys):
+    """
+    Return the uint64 hashes of the non null keys of a chunk. Numbers are hashed as int64
+    and everything else as strings, so the same ID hashes the same in every file format.
+    """
+    __keys = Series(keys).dropna()
+    if pd.api.types.is_numeric_dtype(__keys):
+        __values = __keys.values.astype(np.int64)
+    else:
+        __values = __keys.astype(str).values.astype(object)
+    return pd.util.hash_array(__values)
+
+
+def _combine_unique_hashes(hashes_per_source):
+    """
+    Return the bitmask of every distinct hash, given the sorted unique hashes of each source.
+    """
+    __hashes = np.concatenate(hashes_per_source)
+    __bits = np.concatenate([np.full(len(hashes), 1 << bit, dtype=np.int64)
+                             for bit, hashes in enumerate(hashes_per_source)])
+    if not len(__hashes):
+        return np.zeros(0, dtype=np.int64)
+
+    __order = np.argsort(__hashes, kind='stable')
+    __hashes, __bits = __hashes[__order], __bits[__order]
+    __starts = np.flatnonzero(np.r_[True, __hashes[1:] != __hashes[:-1]])
+    return np.bitwise_or.reduceat(__bits, __starts)
+
+
+class HyperLogLog:
+
+    def __init__(self, precision=14):
+        """
+        A class created to estimate the number of distinct uint64 hashes with 2^precision
+        one byte registers. The relative standard error is 1.04 / sqrt(2^precision)
+        (0.81% with the default precision of 14, in 16 KB).
+
+        Parameters
+        ----------
+            precision : int (optional)
+                Number of index bits, between 4 and 18. Defaults to 14.
+        """
+        if not 4 <= precision <= 18:
+            raise ValueError('The HyperLogLog precision must be between 4 and 18')
+
+        self.precision = precision
+        self.registers = np.zeros(2**precision, dtype=np.uint8)
+
+    @property
+    def relative_error(self):
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def add(self, hashes):
+        """
+        Add an array of uint64 hashes. The first precision bits select the register, which
+        keeps the longest run of leading zeros (plus one) seen in the remaining bits.
+        """
+        if not len(hashes):
+            return
+
+        __width = 64 - self.precision
+        __index = (hashes >> np.uint64(__width)).astype(np.int64)
+        __rest = hashes & np.uint64((1 << __width) - 1)
+
+        # Bit length of the remaining bits from the float64 exponent
+        __bit_length = np.frexp(__rest.astype(np.float64))[1]
+        __rank = (__width - __bit_length + 1).astype(np.uint8)
+
+        __max_rank = Series(__rank).groupby(__index).max()
+        self.registers[__max_rank.index.values] = np.maximum(
+            self.registers[__max_rank.index.values], __max_rank.values)
+
+    def merge(self, other):
+        """
+        Return the sketch of the union of two sketches.
+        """
+        __union = HyperLogLog(self.precision)
+        __union.registers = np.maximum(self.registers, other.registers)
+        return __union
+
+    def estimate(self):
+        """
+        Return the estimated number of distinct hashes.
+        """
+        __m = len(self.registers)
+        __alpha = 0.7213 / (1 + 1.079 / __m)
+        __estimate = __alpha * __m * __m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+
+        __zeros = np.count_nonzero(self.registers == 0)
+        if __estimate <= 2.5 * __m and __zeros:
+            __estimate = __m * np.log(__m / __zeros) # Linear counting for small cardinalities
+        return float(__estimate)
+
+
+class StreamingVennAnalysis:
+
+    def __init__(self, key_id, sources, chunk_size=1000000, partitions=1,
+                 approximate=False, precision=14):
+        """
+        A class created to run the Venn analysis of one key over csv/parquet files that do not
+        fit in memory. The key column is read chunk by chunk and every ID is reduced to a
+        64-bit hash, so memory grows with the number of distinct IDs (8 bytes each) instead
+        of the number of rows.
+
+        Exact mode keeps the sorted unique hashes of every dataset. With partitions > 1 the
+        hashes are first spilled to disk in partitions buckets and each bucket is combined on
+        its own, which bounds memory to roughly 1/partitions of the distinct IDs. The counts
+        match the in memory analysis unless two IDs share a 64-bit hash (probability of about
+        n^2 / 2^65 for n IDs).
+
+        Approximate mode keeps one HyperLogLog sketch per dataset (16 KB each by default),
+        estimates the union of every combination of datasets and derives the regions by
+        inclusion-exclusion. Every union has a relative standard error of 1.04 / sqrt(2^precision);
+        error_bounds() reports the resulting standard error of each region.
+
+        Parameters
+        ----------
+            key_id : string (mandatory)
+                The key column (i.e., PatientId, FRDPersonnelID, comp_idx).
+
+            sources : dictionary (mandatory)
+                {dataset name: path}, where a path is a csv file, a parquet file, a folder
+                of partition files or a list of those. The first dataset is the reference.
+
+            chunk_size : int (optional)
+                Rows read at a time. Defaults to 1,000,000.
+
+            partitions : int (optional)
+                Number of on disk hash partitions in exact mode. Defaults to 1 (in memory).
+
+            approximate : boolean (optional)
+                Use HyperLogLog sketches. Defaults to False.
+
+            precision : int (optional)
+                HyperLogLog precision (register index bits). Defaults to 14.
+
+        Methods
+        -------
+            region_counts()
+            observations()
+            error_bounds()
+        """
+        if not 0 < len(sources) <= MAX_SOURCES:
+            raise ValueError('The Venn analysis needs between 1 and {} datasets'.format(MAX_SOURCES))
+
+        self.key_id = key_id
+        self.names = list(sources)
+        self.approximate = approximate
+        self.__errors = np.zeros(2**len(self.names))
+
+        if approximate:
+            self.__counts = self._approximate_counts(sources, chunk_size, precision)
+        elif partitions > 1:
+            self.__counts = self._partitioned_counts(sources, chunk_size, partitions)
+        else:
+            __unique = list()
+            for name in self.names:
+                __hashes = row_hash.UniqueHashes()
+                for keys in _key_chunks(sources[name], key_id, chunk_size):
+                    __hashes.add(_hash_keys(keys))
+                __unique.append(__hashes.flush())
+
+            self.__counts = np.bincount(_combine_unique_hashes(__unique),
+                                        minlength=2**len(self.names))
+
+    def _partitioned_counts(self, sources, chunk_size, partitions):
+        """
+        Spill the hashes of every dataset to partitions bucket files and combine the buckets
+        one at a time.
+        """
+        __counts = np.zeros(2**len(self.names), dtype=np.int64)
+
+        with tempfile.TemporaryDirectory(prefix='venn-') as folder:
+            __folder = Path(folder)
+            __file = lambda source, bucket: __folder.joinpath('{}-{}.u64'.format(source, bucket))
+
+            for source, name in enumerate(self.names):
+                for keys in _key_chunks(sources[name], self.key_id, chunk_size):
+                    __hashes = np.unique(_hash_keys(keys))
+                    __buckets = (__hashes % np.uint64(partitions)).astype(np.int64)
+                    for bucket in np.unique(__buckets):
+                        with open(__file(source, bucket), 'ab') as file:
+                            __hashes[__buckets == bucket].tofile(file)
+
+            for bucket in range(partitions):
+                __unique = list()
+                for source in range(len(self.names)):
+                    __path = __file(source, bucket)
+                    __hashes = np.fromfile(str(__path), dtype=np.uint64) if __path.exists() \
+                        else np.zeros(0, dtype=np.uint64)
+                    __unique.append(np.unique(__hashes))
+                __counts += np.bincount(_combine_unique_hashes(__unique), minlength=len(__counts))
+
+        return __counts
+
+    def _approximate_counts(self, sources, chunk_size, precision):
+        """
+        Estimate the region counts from one HyperLogLog sketch per dataset.
+        """
+        __sketches = list()
+        for name in self.names:
+            __sketch = HyperLogLog(precision)
+            for keys in _key_chunks(sources[name], self.key_id, chunk_size):
+                __sketch.add(_hash_keys(keys))
+            __sketches.append(__sketch)
+
+        __n = len(self.names)
+        __full = 2**__n - 1
+
+        # Estimated union size of every combination of datasets (bitmask)
+        __union = np.zeros(2**__n)
+        for subset in range(1, 2**__n):
+            __sketch = None
+            for bit in range(__n):
+                if subset >> bit & 1:
+                    __sketch = __sketches[bit] if __sketch is None else __sketch.merge(__sketches[bit])
+            __union[subset] = __sketch.estimate()
+
+        # IDs whose datasets are all within subset, then Mobius inversion over the subsets
+        __within = __union[__full] - __union[__full ^ np.arange(2**__n)]
+        __sigma = __sketches[0].relative_error
+        __counts = np.zeros(2**__n)
+
+        for region in range(1, 2**__n):
+            __subsets = [subset for subset in range(region + 1) if subset & region == subset]
+            __counts[region] = sum((-1)**(bin(region ^ subset).count('1')) * __within[subset]
+                                   for subset in __subsets)
+            self.__errors[region] = __sigma * np.sqrt(sum(__union[__full]**2 + __union[__full ^ subset]**2
+                                                          for subset in __subsets if subset))
+
+        return np.clip(np.round(__counts), 0, None).astype(np.int64)
+
+    def region_counts(self):
+        """
+        Return the counts of the 2^N-1 regions as a Series indexed by region bitmask.
+        """
+        return Series(self.__counts[1:], index=pd.RangeIndex(1, 2**len(self.names), name='Region'),
+                      name='Count')
+
+    def observations(self):
+        """
+        Return the observations DataFrame, in the same layout as the in memory analysis.
+        """
+        return _observations_frame(self.key_id, self.names, self.__counts)
+
+    def error_bounds(self):
+        """
+        Return the observations with the approximate standard error of every count (zero in
+        exact mode). Two standard errors give a ~95% interval.
+        """
+        __bounds = self.observations()
+        __bounds['Std Error'] = np.round(self.__errors[1:]).astype(np.int64)
+        return __bounds
+
+
+def venn_analysis_table_streaming(key_id,
+                                  patients_path,
+                                  procedures_path,
+                                  medications_path,
+                                  approximate=False,
+                                  partitions=1,
+                                  chunk_size=1000000):
+    """
+    The utility function venn_analysis_table_streaming returns the same observations
+    DataFrame as venn_analysis_table, reading the key column from csv/parquet files chunk
+    by chunk instead of in memory Series (see StreamingVennAnalysis).
+
+    Properties:
+    -----------
+        key_id : string (mandatory)
+            The key column (i.e., PatientId, FRDPersonnelID, comp_idx).
+
+        patients_path, procedures_path, medications_path : string or Path (mandatory)
+            A csv file, parquet file or folder of partitions of each dataset.
+
+        approximate : boolean (optional)
+            Estimate the counts with HyperLogLog sketches. Defaults to False.
+
+        partitions : int (optional)
+            Number of on disk hash partitions of the exact mode. Defaults to 1.
+
+        chunk_size : int (optional)
+            Rows read at a time. Defaults to 1,000,000.
+
+    Return
+    ------
+        A pandas DataFrame that will show the results of the Venn Analysis performed.
+    """
+    return StreamingVennAnalysis(key_id,
+                                 dict(zip(_default_sources, [patients_path,
+                                                             procedures_path,
+                                                             medications_path])),
+                                 chunk_size=chunk_size,
+                                 partitions=partitions,
+                                 approximate=approximate).observations()
+
 
 def venn_analysis_table(key_id,
                         col_from_patients, 
@@ -20,6 +514,9 @@ def venn_analysis_table(key_id,
     
     Cautions: you need to understand that the context is associated to the analysis we
     are creating for the Fairfax County Fire and Rescue Department.
+
+    The regions are computed by VennAnalysis, use it directly to get the table, the diagram
+    and the missing IDs from a single computation or to add more datasets.
     
     Properties:
     -----------
@@ -94,61 +591,15 @@ def venn_analysis_table(key_id,
         boolean, please read the function information available at 
         /src/d06_reporting folder'''
             
-    a = set(col_from_patients)
-    b = set(col_from_procedures)
-    c = set(col_from_medications)
-            
-    """
-        REMINDER! set operators for Python are:
-            | for union
-            & for intersection
-            - for difference
-            ^ for symmetric difference
-    """
-    if key_id == 'PatientId':
-        key_id = 'Patients'
-    
-    if key_id == 'FRDPersonnelID':
-        key_id = 'Providers'
-    
-    if key_id == 'comp_idx':
-        key_id = 'Compound IDs: Patient & Provider'
-        
-    observations_df = DataFrame({
-        'Observations':[
-            '{} that only exist in Patients'.format(key_id),
-            '{} that only exist in the Procedures but not in Patients (?)'.format(key_id),
-            '{} that exist in Patients and Procedures'.format(key_id),
-            '{} that only exists in the Medications but not in Patients (?)'.format(key_id),
-            '{} that exists in Patients and Medications'.format(key_id),
-            '{} that exists in Procedures and Medications only but not in Patients (?)'.format(key_id),
-            '{} that exists in all datasets'.format(key_id)
-        ],
-        'Count':[
-            len(a-(b|c)),
-            len(b-(a|c)),
-            len((a&b)-c),
-            len(c-(a|b)),
-            len((a&c)-b),
-            len((b&c)-a),
-            len(a&b&c)
-        ]
-    }).set_index('Observations')
-    
-    key_id_in_pro_not_pat = b-(a|c)
-    key_id_in_med_not_pat = c-(a|b)
-    key_id_in_pro_med_not_pat = (b&c)-a
-    
-    all_miss_id_from_pat = (key_id_in_pro_not_pat | 
-                            key_id_in_med_not_pat |
-                            key_id_in_pro_med_not_pat)
-    missing_df = DataFrame({
-        'Missing IDs': list(all_miss_id_from_pat)
-    })
-    
+    venn = VennAnalysis(key_id, dict(zip(_default_sources, [col_from_patients,
+                                                            col_from_procedures,
+                                                            col_from_medications])))
+
     if out_flag == False:
-        return missing_df
-    return observations_df
+        return DataFrame({
+            'Missing IDs': venn.missing_ids()
+        })
+    return venn.observations()
 
 def venn_analysis_diagram(key_id,
                           col_from_patients, 
@@ -162,6 +613,9 @@ def venn_analysis_diagram(key_id,
     
     Cautions: you need to understand that the context is associated to the analysis we
     are creating for the Fairfax County Fire and Rescue Department.
+
+    The regions are computed by VennAnalysis, use it directly to get the table, the diagram
+    and the missing IDs from a single computation or to add more datasets.
     
     Properties:
     -----------
@@ -219,26 +673,18 @@ def venn_analysis_diagram(key_id,
     
     
     
-    vd3 = venn3_unweighted([set(col_from_patients),
-                            set(col_from_procedures),
-                            set(col_from_medications)],
-                            set_labels=('Patients','Procedures', 'Medications'),
-                            set_colors=('#d7191c','#abdda4', '#2b83ba'),
-                            alpha = 0.8)
+    venn = VennAnalysis(key_id, dict(zip(_default_sources, [col_from_patients,
+                                                            col_from_procedures,
+                                                            col_from_medications])))
+    vd3 = venn.diagram()
 
     for text in vd3.set_labels: # Change Label Size
         text.set_fontsize(16)
     for text in vd3.subset_labels: # Change number size
-        text.set_fontsize(12)
-        
-    if key_id == 'PatientId':
-        key_id = 'Patients'
-    
-    if key_id == 'FRDPersonnelID':
-        key_id = 'Providers'
-    
-    if key_id == 'comp_idx':
-        key_id = 'Compound IDs: Patient & Provider'
+        if text is not None:
+            text.set_fontsize(12)
+
+    key_id = _key_label(key_id)
 
     plt.title('Venn Diagram for {} Across All Datasets'.format(key_id),
               fontname = 'Times New Roman',
@@ -253,7 +699,9 @@ def venn_analysis_short_test(key_id, pat_df_raw, miss_id_df):
                           
     """
     The utility function venn_analysis_short_test was created to provide a visual
-    validation of the Venn analysis results.
+    validation of the Venn analysis results. Every missing ID is looked up in the table with
+    a single hash based pass, an ID passes when no row of the table holds it. Any key
+    column and table (e.g., Procedures or Medications) can be validated.
           
     Properties:
     -----------
@@ -265,7 +713,8 @@ def venn_analysis_short_test(key_id, pat_df_raw, miss_id_df):
                              comp_idx (Concatenation of PatientId with FRDPersonnelID))
                              
         pat_df_raw: DataFrame (mandatory)
-            The DataFrame object needs to be the raw patients data frame.
+            The DataFrame object needs to be the raw patients data frame, or the table the
+            missing IDs were computed against.
             
             Caution: In order to maintain the proper context for this analysis this pandas
                      DataFrame should come from the *Patients* dataset. Otherwise
@@ -293,28 +742,25 @@ def venn_analysis_short_test(key_id, pat_df_raw, miss_id_df):
         a string, please read the function information available at 
         /src/d06_reporting folder'''
     
-    ### Start Test Script ### 
-    test_dict = {"PatientId": [],
-                 "Raw Shape": [],
-                 "Logical Index Shape": [],
-                 "Pass/Fail": []}
-
-    for missId in np.nditer(miss_id_df.values.astype('str')):
+    ### Start Test Script ###
+    __ids = Series(miss_id_df.iloc[:, 0].values)
+    __key_column = pat_df_raw[key_id]
 
-        idx = pat_df_raw[key_id] == missId
-
-        if pat_df_raw[idx].shape == (0,12):
-            tst_cri = 'PASS'
-        else:
-            tst_cri = 'FAIL'
+    # Compare as strings when one side is numeric and the other is not
+    # (e.g., missing IDs read back from a csv file)
+    if pd.api.types.is_numeric_dtype(__key_column) != pd.api.types.is_numeric_dtype(__ids):
+        __ids_lookup = __ids.astype(str)
+        __key_column = __key_column.astype(str)
+    else:
+        __ids_lookup = __ids
 
-        # Update Dictionary
-        test_dict["PatientId"].append(missId)
-        test_dict["Raw Shape"].append(pat_df_raw.shape)
-        test_dict["Logical Index Shape"].append(pat_df_raw[idx].shape)
-        test_dict["Pass/Fail"].append(tst_cri)
+    # One hash based pass over the table counts the rows of every missing ID
+    __matches = __key_column.value_counts().reindex(__ids_lookup.values, fill_value=0).values
 
-    test_df=DataFrame(test_dict)
+    test_df = DataFrame({"PatientId": __ids,
+                         "Raw Shape": [pat_df_raw.shape] * len(__ids),
+                         "Logical Index Shape": [(int(count), pat_df_raw.shape[1]) for count in __matches],
+                         "Pass/Fail": np.where(__matches == 0, 'PASS', 'FAIL')})
 
     print('The total number patient IDs with failed status is {}'\
           .format(test_df[test_df['Pass/Fail']=='FAIL'].shape[0]))
@@ -0,0 +1,254 @@
+import colorsys
+
+import numpy as np
+
+import seaborn as sns
+import matplotlib as mpl
+import matplotlib.pyplot as plt
+
+## PRE-BINNED VIOLIN PLOTS
+##
+## The project violin plots show the distribution of the integer outcome
+## codes per fire station (and shift). sns.violinplot fits a gaussian KDE
+## on every row of every group, so the cost grows with the number of
+## records. The values only take a handful of integer levels, which
+## means the KDE is the same when each level is weighted by its count:
+##
+##      density(y) = sum_k count_k * N(y; k, bw) / n
+##
+## with the Scott bandwidth bw = std(ddof=1) * n ** (-1/5) computed from
+## the counts as well. The box statistics (quartiles and whiskers) are
+## read from the cumulative counts. The plot therefore works on the
+## (group x hue x value) count array and its cost depends on the number
+## of categories, not on the number of rows.
+##
+## The shapes, scaling, colors and inner box follow sns.violinplot with
+## a numeric value axis (orient='v', dodge=True, split=False).
+##
+## Usage:
+##      counts = binned_violin.violin_counts(x_codes, y_codes, n_x, n_y)
+##      binned_violin.binned_violinplot(counts, ax=ax, scale='count', inner='box', cut=0)
+
+
+def violin_counts(x_codes, y_codes, n_x, n_y, hue_codes=None, n_hue=1):
+    """
+    Count the records per group, hue level and value code in one pass.
+
+    Properties:
+    -----------
+        x_codes : array of int (mandatory)
+            Group code of every record (0 to n_x - 1). Negative codes are ignored.
+
+        y_codes : array of int (mandatory)
+            Value code of every record (0 to n_y - 1). Negative codes are ignored.
+
+        n_x, n_y : int (mandatory)
+            Number of groups and of values.
+
+        hue_codes : array of int (optional)
+            Hue level code of every record (0 to n_hue - 1).
+
+        n_hue : int (optional)
+            Number of hue levels. Defaults to 1 (no hue).
+
+    Return
+    ------
+        numpy int64 array of shape (n_x, n_hue, n_y)
+    """
+    x = np.asarray(x_codes, dtype=np.int64)
+    y = np.asarray(y_codes, dtype=np.int64)
+    hue = np.zeros(len(x), dtype=np.int64) if hue_codes is None \
+        else np.asarray(hue_codes, dtype=np.int64)
+
+    mask = (x >= 0) & (y >= 0) & (hue >= 0)
+    flat = np.ravel_multi_index((x[mask], hue[mask], y[mask]), (n_x, n_hue, n_y))
+
+    return np.bincount(flat, minlength=n_x * n_hue * n_y).reshape(n_x, n_hue, n_y)
+
+
+def _weighted_percentiles(values, weights, q):
+    """
+    np.percentile (linear interpolation) of the data holding weights[i] copies of values[i].
+    """
+    cumulative = np.cumsum(weights)
+    position = np.asarray(q, dtype=float) / 100 * (cumulative[-1] - 1)
+    low = np.floor(position)
+    high = np.minimum(low + 1, cumulative[-1] - 1)
+
+    v_low = values[np.searchsorted(cumulative, low, side='right')]
+    v_high = values[np.searchsorted(cumulative, high, side='right')]
+    return v_low + (v_high - v_low) * (position - low)
+
+
+def _density(values, weights, gridsize, cut):
+    """
+    Return the support, density and count of one violin, as sns.violinplot estimates them.
+    """
+    present = weights > 0
+    present_values = values[present]
+    present_weights = weights[present].astype(float)
+    n = present_weights.sum()
+
+    if n == 0:
+        return np.array([]), np.array([1.]), 0
+    if len(present_values) == 1:
+        # A single unique value is drawn as a line and counted once
+        return present_values, np.array([1.]), 1
+
+    mean = (present_values * present_weights).sum() / n
+    std = np.sqrt((present_weights * (present_values - mean) ** 2).sum() / (n - 1))
+    bw = std * n ** (-1 / 5)
+
+    support = np.linspace(present_values.min() - bw * cut, present_values.max() + bw * cut, gridsize)
+    z = (support[:, None] - present_values[None, :]) / bw
+    density = (np.exp(-0.5 * z ** 2) * present_weights).sum(axis=1) / (n * bw * np.sqrt(2 * np.pi))
+
+    return support, density, n
+
+
+def _colors(palette, n_colors, saturation):
+    colors = sns.color_palette(palette, n_colors)
+    if saturation < 1:
+        colors = sns.color_palette(colors, desat=saturation)
+    colors = sns.color_palette(colors)
+
+    lum = min(colorsys.rgb_to_hls(*color)[1] for color in colors) * .6
+    return colors, mpl.colors.rgb2hex((lum, lum, lum))
+
+
+def binned_violinplot(counts, ax=None, values=None, group_names=None, hue_names=None,
+                      palette=None, width=.8, gridsize=100, cut=0, scale='count', scale_hue=True,
+                      inner='box', saturation=.75, linewidth=None, xlabel=None, ylabel=None,
+                      hue_title=None):
+    """
+    Draw vertical violins from a (group x hue x value) count array.
+
+    Properties:
+    -----------
+        counts : array of shape (n_groups, n_hue, n_values) (mandatory)
+            See violin_counts(). Use n_hue = 1 without hue.
+
+        ax : matplotlib Axes (optional)
+            Defaults to the current Axes.
+
+        values : array of float (optional)
+            The value of every value code. Defaults to 0, 1, ..., n_values - 1.
+
+        group_names, hue_names : lists (optional)
+            Tick labels of the groups and legend labels of the hue levels. The violins are
+            drawn with hue when hue_names is given.
+
+        palette : palette name or list of colors (optional)
+            One color per group without hue, per hue level otherwise.
+
+        width, gridsize, cut, scale, scale_hue, inner, saturation, linewidth :
+            As in sns.violinplot. scale is count, width or area and inner is box or None.
+
+        xlabel, ylabel, hue_title : strings (optional)
+
+    Return
+    ------
+        matplotlib Axes
+    """
+    counts = np.asarray(counts)
+    n_groups, n_hue, n_values = counts.shape
+    values = np.arange(n_values, dtype=float) if values is None else np.asarray(values, dtype=float)
+    hue = hue_names is not None
+
+    if scale not in ('count', 'width', 'area'):
+        raise ValueError("scale method '{}' not recognized".format(scale))
+    if inner is not None and not inner.startswith('box'):
+        raise ValueError("Inner style '{}' not supported, use 'box' or None".format(inner))
+
+    ax = plt.gca() if ax is None else ax
+    linewidth = mpl.rcParams['lines.linewidth'] if linewidth is None else linewidth
+    colors, gray = _colors(palette, n_hue if hue else n_groups, saturation)
+
+    support = [[None] * n_hue for _ in range(n_groups)]
+    density = [[None] * n_hue for _ in range(n_groups)]
+    sizes = np.zeros((n_groups, n_hue))
+    max_density = np.zeros((n_groups, n_hue))
+
+    for i in range(n_groups):
+        for j in range(n_hue):
+            support[i][j], density[i][j], sizes[i, j] = \
+                _density(values, counts[i, j], gridsize, cut)
+            if len(support[i][j]) > 1:
+                max_density[i, j] = density[i][j].max()
+
+    # Scale the curves relative to 1, as seaborn does
+    for i in range(n_groups):
+        for j in range(n_hue):
+            d = density[i][j]
+            if scale == 'width':
+                d /= d.max()
+            elif scale == 'area':
+                scale_max = max_density[i].max() if hue and scale_hue else max_density.max()
+                if d.size > 1:
+                    d /= scale_max
+            else:
+                scale_max = sizes[i].max() if hue and scale_hue else sizes.max()
+                if scale_max > 0:
+                    d /= d.max()
+                    d *= sizes[i, j] / scale_max
+
+    if hue:
+        dwidth = width / (2 * n_hue)
+        offsets = np.linspace(0, width - width / n_hue, n_hue)
+        offsets -= offsets.mean()
+    else:
+        dwidth = width / 2
+        offsets = np.zeros(1)
+
+    for i in range(n_groups):
+        for j in range(n_hue):
+            color = colors[j] if hue else colors[i]
+            if hue and not i:
+                ax.add_patch(plt.Rectangle([0, 0], 0, 0, linewidth=linewidth / 2,
+                                           edgecolor=gray, facecolor=color,
+                                           label=hue_names[j]))
+
+            center = i + offsets[j]
+            support_ij, density_ij = support[i][j], density[i][j]
+            if support_ij.size == 0:
+                continue
+            if support_ij.size == 1:
+                half = density_ij.item() * dwidth
+                ax.plot([center - half, center + half], [support_ij.item()] * 2,
+                        color=gray, linewidth=linewidth)
+                continue
+
+            ax.fill_betweenx(support_ij,
+                             center - density_ij * dwidth,
+                             center + density_ij * dwidth,
+                             facecolor=color, edgecolor=gray, linewidth=linewidth)
+
+            if inner is None:
+                continue
+
+            present = counts[i, j] > 0
+            data, weights = values[present], counts[i, j][present]
+            q25, q50, q75 = _weighted_percentiles(data, weights, [25, 50, 75])
+            whisker_lim = 1.5 * (q75 - q25)
+            h1 = data[data >= (q25 - whisker_lim)].min()
+            h2 = data[data <= (q75 + whisker_lim)].max()
+
+            ax.plot([center, center], [h1, h2], linewidth=linewidth, color=gray)
+            ax.plot([center, center], [q25, q75], linewidth=linewidth * 3, color=gray)
+            ax.scatter(center, q50, zorder=3, color='white', edgecolor=gray,
+                       s=np.square(linewidth * 2))
+
+    if xlabel is not None:
+        ax.set_xlabel(xlabel)
+    if ylabel is not None:
+        ax.set_ylabel(ylabel)
+
+    ax.set_xticks(np.arange(n_groups))
+    ax.set_xticklabels(group_names if group_names is not None else [''] * n_groups)
+    ax.xaxis.grid(False)
+    ax.set_xlim(-.5, n_groups - .5, auto=None)
+
+    if hue:
+        ax.legend(loc='best', title=hue_title)
+
+    return ax
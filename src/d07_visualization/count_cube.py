@@ -0,0 +1,111 @@
+import numpy as np
+
+import pandas as pd
+from pandas import Series, DataFrame
+
+# The count cube keeps the number of records of every combination of
+# the plot dimensions (e.g., FireStation x Battalion x Shift x
+# PatientOutcome x dispatch month) that exists in the data. A plot
+# then sums the cells it needs instead of filtering and counting the
+# full frame: the cube has a few thousand cells where the frame has
+# hundreds of thousands of rows.
+
+
+class CountCube:
+
+    def __init__(self, cells):
+        """
+        A class created to slice and sum a table of counts.
+
+        Parameters
+        ----------
+            cells : DataFrame (mandatory)
+                One row per combination of the dimension columns with its Count. Use
+                CountCube.build() to create it from a record level frame.
+
+        Methods
+        -------
+            build(df, dimensions, time_column=None)
+            select(**filters)
+            counts(by)
+        """
+        self.cells = cells
+        self.dimensions = [column for column in cells.columns if column != 'Count']
+
+    @classmethod
+    def build(cls, df, dimensions, time_column=None):
+        """
+        Count the records of df per combination of dimensions in one pass. Null values
+        are kept as their own cell, so no record is lost when one dimension is missing.
+
+        Properties:
+        -----------
+            df : DataFrame (mandatory)
+
+            dimensions : list of strings (mandatory)
+                Categorical or low cardinality columns of df.
+
+            time_column : string (optional)
+                A datetime column added to the cube as DispatchMonth (month start).
+
+        Return
+        ------
+            CountCube
+        """
+        __codes = list()
+        __labels = list()
+
+        __columns = [df[column] for column in dimensions]
+        if time_column is not None:
+            __month = df[time_column].values.astype('datetime64[M]')
+            __columns.append(Series(__month.astype('datetime64[ns]'), name='DispatchMonth'))
+
+        for column in __columns:
+            __categorical = column.values if pd.api.types.is_categorical_dtype(column) \
+                else pd.Categorical(column)
+            __codes.append(np.asarray(__categorical.codes, dtype=np.int64) + 1) # 0 is null
+            __labels.append(__categorical)
+
+        __shape = tuple(len(labels.categories) + 1 for labels in __labels)
+        __flat = np.ravel_multi_index(__codes, __shape)
+        __cells, __counts = np.unique(__flat, return_counts=True)
+
+        __data = dict()
+        for column, labels, codes in zip(__columns, __labels,
+                                         np.unravel_index(__cells, __shape)):
+            __data[column.name] = pd.Categorical.from_codes(codes - 1, categories=labels.categories)
+        __data['Count'] = __counts
+
+        __cube = DataFrame(__data)
+        if time_column is not None:
+            __cube['DispatchMonth'] = np.asarray(__cube['DispatchMonth'], dtype='datetime64[ns]')
+        return cls(__cube)
+
+    def select(self, **filters):
+        """
+        Return the cube restricted to the cells matching every filter, given as a value or
+        a list of values per dimension (e.g., select(PatientOutcome=['No Patient Found'])).
+        """
+        __mask = np.ones(len(self.cells), dtype=bool)
+        for column, value in filters.items():
+            __values = value if isinstance(value, (list, tuple, set)) else [value]
+            __mask &= self.cells[column].isin(__values).values
+        return CountCube(self.cells[__mask])
+
+    def counts(self, by):
+        """
+        Return the counts summed per combination of the by dimensions, sorted by
+        dimension values. 'year' is derived from DispatchMonth. Cells with a null by
+        value are left out, as a count plot does.
+        """
+        __cells = self.cells
+        if 'year' in by and 'year' not in __cells.columns:
+            __cells = __cells.assign(year=__cells['DispatchMonth'].dt.year)
+
+        __counts = __cells.groupby(list(by), observed=True)['Count'].sum().sort_index()
+        __counts = __counts[__counts > 0].reset_index()
+
+        for column in by:
+            if pd.api.types.is_categorical_dtype(__counts[column]):
+                __counts[column] = __counts[column].cat.remove_unused_categories()
+        return __counts
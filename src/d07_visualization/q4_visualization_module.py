@@ -1,3 +1,7 @@
+from pathlib import Path
+import hashlib
+import json
+
 import numpy as np
 
 import pandas as pd
@@ -7,12 +11,14 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 import plotly.express as px
 import matplotlib
+import pyarrow as pa
+import pyarrow.parquet as pq
 
-# Load the patient dataset, this file needs to exist for this
-# module to function properly. If you don't have this file
-# run the patients intermediate dataset notebook before running
-# this module.
-pat_i = pd.read_csv('../data/02_intermediate/dfPatients_dedup.csv')
+from src.d00_utils import proj_utils
+from src.d00_utils import schema
+from src.d00_utils import time_buckets
+from src.d07_visualization.count_cube import CountCube
+from src.d07_visualization import binned_violin
 
 # Visualization Color Configuration
 # Change this parameter witha valid matplotlib parameter to
@@ -30,24 +36,221 @@ palette_sel_distinct_2 = 'muted'
 palette_sel_continuous = 'viridis'
 seaborn_theme = 'darkgrid'
 
-# remove the 2 patient outcomes that are null
-pat_i.drop(index=pat_i[pat_i['PatientOutcome'].isnull()].index, inplace=True)
+# seaborn 0.12 replaced ci=None with errorbar=None to draw bars without
+# error bars
+_no_error_bars = {'errorbar': None} \
+    if tuple(int(part) for part in sns.__version__.split('.')[:2]) >= (0, 12) else {'ci': None}
+
+# The patient dataset is loaded the first time df_q4 is used (not when
+# the module is imported). This file needs to exist for the plots to
+# work. If you don't have this file run the patients intermediate
+# dataset notebook before running this module.
+source_path = Path(__file__).resolve().parents[2].joinpath(
+    'data', '02_intermediate', 'dfPatients_dedup.csv')
 
-# Create dataset with the fields of interest
+# Fields of interest
 cols = ['FireStation', 'Shift', 'PatientOutcome',
         'PatientOutcomeCode', 'PatientId', 'DispatchTime']
-df_q4 = pat_i[cols].copy(deep=True)
 
-df_q4.drop_duplicates(inplace=True)
+# EMS call outcome categories combined as recommened by FCFRD
+outcome_groups = {'Canceled (Prior to Arrival)': 'Canceled',
+                  'Standby (Operational Support Provided)': 'Standby',
+                  'Standby (No Services Performed)': 'Standby',
+                  'Patient Refusal  (AMA)': 'Refused',
+                  'No Patient Found': 'No Patient',
+                  'No Treatment/Transport Required': 'No Patient',
+                  'Canceled (On Scene, No Patient Contact)': 'No Patient',
+                  'Patient Dead at Scene (EMS CPR Attempted)': 'Dead',
+                  'Patient Dead at Scene (No EMS CPR)': 'Dead',
+                  'Treated & Transported': 'Transport',
+                  'Treated, Transferred Care': 'Assist',
+                  'EMS Assist (Other Agency)': 'Assist'}
+
+# Dimensions of the count cube used by the frequency plots and the
+# sunburst. The cube also has the DispatchMonth dimension.
+cube_dimensions = ['FireStation', 'Battalion', 'Shift', 'PatientOutcome', 'OutcomeGroup']
+
+# The prepared frame is kept in memory and in a parquet file under
+# data/02_intermediate/.cache. The parquet file is reused while the
+# source csv has the same size and modification time (or the same
+# content hash). Increase the version when the preparation changes.
+CACHE_VERSION = 2
+
+_df_q4 = None
+_count_cube = None
+
+
+def _source_signature(path, with_hash=False):
+    # Size and modification time of the source file, plus the content
+    # hash when requested
+    stat = path.stat()
+    signature = {'version': CACHE_VERSION,
+                 'size': stat.st_size,
+                 'mtime_ns': stat.st_mtime_ns}
+    if with_hash:
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(2**20), b''):
+                sha1.update(chunk)
+        signature['sha1'] = sha1.hexdigest()
+    return signature
+
+
+def _cache_path(path, name='q4'):
+    return path.parent.joinpath('.cache', '{}.{}.parquet'.format(path.stem, name))
+
+
+def _read_cache(path, name='q4'):
+    # Return the cached frame when it was built from the current
+    # version of the source file, otherwise None
+    cache = _cache_path(path, name)
+    if not cache.exists():
+        return None
+
+    metadata = pq.read_schema(str(cache)).metadata or {}
+    if b'q4_source' not in metadata:
+        return None
+    cached = json.loads(metadata[b'q4_source'])
+    current = _source_signature(path)
+
+    if cached['version'] != current['version'] or cached['size'] != current['size']:
+        return None
+    if cached['mtime_ns'] != current['mtime_ns']:
+        # Same size but touched (e.g., downloaded again), compare the content
+        if cached['sha1'] != _source_signature(path, with_hash=True)['sha1']:
+            return None
+
+    # Parquet keeps numbers as plain integers, the registry restores the
+    # station categories
+    return schema.apply_schema(pq.read_table(str(cache)).to_pandas(),
+                               table='patients_intermediate')
+
+
+def _write_cache(path, df, name='q4'):
+    cache = _cache_path(path, name)
+
+    table = pa.Table.from_pandas(df)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'q4_source'] = json.dumps(_source_signature(path, with_hash=True)).encode()
+
+    with proj_utils.atomic_path(cache) as tmp:
+        pq.write_table(table.replace_schema_metadata(metadata), str(tmp))
+
+
+def _strip_categories(series):
+    # Strip the categories instead of every row. Categories that become
+    # equal once stripped are merged.
+    categories = series.cat.categories.str.strip()
+    new_categories = pd.Index(categories.unique())
+    codes = new_categories.get_indexer(categories)
+    codes = np.where(series.cat.codes.values < 0, -1, codes[series.cat.codes.values])
+    return Series(pd.Categorical.from_codes(codes, categories=new_categories),
+                  index=series.index, name=series.name)
+
+
+def _prepare(path):
+    # Battalion is only kept for the count cube, it is not part of the
+    # duplicate check
+    pat_i = schema.read_csv(path, table='patients_intermediate',
+                            columns=cols + ['Battalion'])[cols + ['Battalion']]
+
+    # remove the 2 patient outcomes that are null
+    df = pat_i[pat_i['PatientOutcome'].notnull()]
+
+    # duplicates are dropped before the strip, as the original
+    # conditioning did
+    df = df.drop_duplicates(subset=cols)
+
+    df['Shift'] = _strip_categories(df['Shift'])
+    df['PatientOutcome'] = _strip_categories(df['PatientOutcome'])
+    return df
+
+
+def _load_prepared(path, use_cache=True, refresh=False):
+    # Return the prepared frame with Battalion, from the parquet cache
+    # when it is current
+    if not path.exists():
+        raise FileNotFoundError('{} not found, run the patients intermediate dataset '
+                                'notebook first'.format(path))
+
+    df = _read_cache(path) if use_cache and not refresh else None
+    if df is None:
+        df = _prepare(path)
+        if use_cache:
+            _write_cache(path, df)
+    return df
+
+
+def load_df_q4(path=None, use_cache=True, refresh=False):
+    # Return the conditioned focus question 4 data frame (the cols
+    # fields), built once per process. The parquet cache is skipped with
+    # use_cache=False and rebuilt with refresh=True.
+    global _df_q4
+
+    if _df_q4 is not None and path is None and not refresh:
+        return _df_q4
+
+    path = Path(path) if path is not None else source_path
+    df = _load_prepared(path, use_cache=use_cache, refresh=refresh)[cols]
+
+    if path == source_path:
+        _df_q4 = df
+        _violin_frames.clear()
+    return df
+
+
+def _outcome_group(outcome):
+    # Combine the outcome categories (not the rows) with outcome_groups
+    groups = outcome.cat.categories.map(lambda category: outcome_groups.get(category, category))
+    new_categories = pd.Index(groups.unique())
+    codes = new_categories.get_indexer(groups)
+    codes = np.where(outcome.cat.codes.values < 0, -1, codes[outcome.cat.codes.values])
+    return Series(pd.Categorical.from_codes(codes, categories=new_categories),
+                  index=outcome.index, name='OutcomeGroup')
+
+
+def load_count_cube(path=None, use_cache=True, refresh=False):
+    # Return the CountCube of the focus question 4 data frame: the
+    # number of records per fire station, battalion, shift, outcome,
+    # outcome group and dispatch month. It is built once per version
+    # of the source file and kept next to the data frame cache.
+    global _count_cube
+
+    if _count_cube is not None and path is None and not refresh:
+        return _count_cube
 
-df_q4 = df_q4.astype(dtype={
-    'Shift': 'str',
-    'PatientOutcome': 'str',
-    'PatientId': 'str'
-})
+    path = Path(path) if path is not None else source_path
+    cells = _read_cache(path, 'q4cube') if use_cache and not refresh else None
+    if cells is None:
+        df = _load_prepared(path, use_cache=use_cache, refresh=refresh)
+        df = df.assign(OutcomeGroup=_outcome_group(df['PatientOutcome']))
+        cells = CountCube.build(df, cube_dimensions, time_column='DispatchTime').cells
+        if use_cache:
+            _write_cache(path, cells, 'q4cube')
+
+    cube = CountCube(cells)
+    if path == source_path:
+        _count_cube = cube
+    return cube
+
+
+def __getattr__(name):
+    # df_q4 is built on first access (e.g., q4_vis.df_q4)
+    if name == 'df_q4':
+        return load_df_q4()
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def _plain(df):
+    # Convert the categorical columns back to the dtype of their
+    # categories, for the plots that rely on the original dtypes
+    # (appearance order of text values, continuous numeric colors)
+    df = df.copy()
+    for column in df.columns:
+        if pd.api.types.is_categorical_dtype(df[column]):
+            df[column] = np.asarray(df[column])
+    return df
 
-df_q4['Shift'] = df_q4['Shift'].apply(lambda x: x.strip())
-df_q4['PatientOutcome'] = df_q4['PatientOutcome'].apply(lambda x: x.strip())
 
 #############################
 ### Question 4 DataFrames ###
@@ -57,42 +260,20 @@ df_q4['PatientOutcome'] = df_q4['PatientOutcome'].apply(lambda x: x.strip())
 def q4_data_frame():
     # Provide an easy method to return the data frame after conditioning.
     # The conditioning performed is tailored to answer focus question 4
-    return df_q4
+    return load_df_q4()
 
 
 def q4_yearly_subsets():
     # This is a helper function created to help us understand the time
-    # ranges associated with the dataset provided by FCFRD.
-    df = df_q4
-
-    df = df.astype('category')
-    df['DispatchTime'] = df['DispatchTime'].astype('datetime64')
-
-    df18 = df[df['DispatchTime'].dt.year == 2018].copy()
-    df19 = df[df['DispatchTime'].dt.year == 2019].copy()
-    df20 = df[df['DispatchTime'].dt.year == 2020].copy()
-    df21 = df[df['DispatchTime'].dt.year == 2021].copy()
+    # ranges associated with the dataset provided by FCFRD. Every year
+    # found in the data is listed (one pass over DispatchTime).
+    summary = time_buckets.time_bucket_summary(load_df_q4(), 'year')
 
     df_out = DataFrame({
-        'Year': ['2018', '2019', '2020', '2021'],
-        'Record Count': [
-            '{:,}'.format(df18.shape[0]),
-            '{:,}'.format(df19.shape[0]),
-            '{:,}'.format(df20.shape[0]),
-            '{:,}'.format(df21.shape[0])
-        ],
-        'Start Date-Time': [
-            df18['DispatchTime'].min(),
-            df19['DispatchTime'].min(),
-            df20['DispatchTime'].min(),
-            df21['DispatchTime'].min()
-        ],
-        'End Date-Time': [
-            df18['DispatchTime'].max(),
-            df19['DispatchTime'].max(),
-            df20['DispatchTime'].max(),
-            df21['DispatchTime'].max()
-        ]
+        'Year': [str(year) for year in summary.index],
+        'Record Count': ['{:,}'.format(count) for count in summary['Count']],
+        'Start Date-Time': summary['First'].values,
+        'End Date-Time': summary['Last'].values
     })
     df_out = df_out.set_index('Year')
     return df_out
@@ -107,6 +288,7 @@ def frequency_plot_station_outcome(subset, sel):
     # EMS call outcomes that are within the 140, 700, 1400, and 
     # 8000 frequency ranges. This approach was not selected for
     # final briefing and/or report.
+    cube = load_count_cube()
 
     if sel == 'station':
         y_sel = 'PatientOutcome'
@@ -121,7 +303,6 @@ def frequency_plot_station_outcome(subset, sel):
                     'Standby (Operational Support Provided)',
                     'Treated, Transferred Care',
                     'Patient Dead at Scene (EMS CPR Attempted)']
-        df = df_q4[df_q4['PatientOutcome'].isin(cat_list)]
         plt.figure(figsize=(20, 25))
 
     if subset == 700:
@@ -129,26 +310,30 @@ def frequency_plot_station_outcome(subset, sel):
                     'No Patient Found',
                     'Standby (No Services Performed)',
                     'EMS Assist (Other Agency)']
-        df = df_q4[df_q4['PatientOutcome'].isin(cat_list)]
         plt.figure(figsize=(20, 25))
 
     if subset == 1400:
         cat_list = ['Patient Refusal  (AMA)',
                     'No Treatment/Transport Required',
                     'Canceled (Prior to Arrival)']
-        df = df_q4[df_q4['PatientOutcome'].isin(cat_list)]
         plt.figure(figsize=(20, 25))
 
     if subset == 8000:
         cat_list = ['Treated & Transported']
-        df = df_q4[df_q4['PatientOutcome'].isin(cat_list)]
         plt.figure(figsize=(20, 10))
 
+    # The bars are the cube counts of the selected outcomes
+    counts = cube.select(PatientOutcome=cat_list).counts([y_sel, hue_sel])
+
     sns.set_theme(style=seaborn_theme)
-    sns.countplot(y=y_sel,
-                  data=df,
-                  hue=hue_sel,
-                  palette=palette_sel_continuous)
+    ax = sns.barplot(x='Count',
+                     y=y_sel,
+                     data=_plain(counts),
+                     hue=hue_sel,
+                     orient='h',
+                     **_no_error_bars,
+                     palette=palette_sel_continuous)
+    ax.set_xlabel('count')
 
 
 
@@ -159,65 +344,114 @@ def frequency_plot_station(hue_sel):
     # year only contains certain calls performed between January
     # and February. This visualization was not selected for 
     # final presention and/or report.
-    df = df_q4
-
-    df = df.astype('category')
-    df['DispatchTime'] = df['DispatchTime'].astype('datetime64')
-
-    if hue_sel == 'year':
-        hue_sel = df['DispatchTime'].dt.year
+    cube = load_count_cube()
 
     sns.set_theme(style=seaborn_theme)
     plt.figure(figsize=(10, 20))
-    sns.countplot(y='FireStation',
-                  data=df,
-                  palette=palette_sel_distinct_2,
-                  hue=hue_sel)
 
+    if hue_sel != 'year' and hue_sel not in cube.dimensions:
+        # Not a cube dimension, the records are counted
+        df = load_df_q4()
+        sns.countplot(y='FireStation',
+                      data=df,
+                      palette=palette_sel_distinct_2,
+                      hue=hue_sel)
+        return
+
+    ax = sns.barplot(x='Count',
+                     y='FireStation',
+                     data=_plain(cube.counts(['FireStation', hue_sel])),
+                     hue=hue_sel,
+                     orient='h',
+                     **_no_error_bars,
+                     palette=palette_sel_distinct_2)
+    ax.set_xlabel('count')
+
+
+def sunburst_figure(path_in, col_in, subset):
+    # The sunburst is drawn from the number of records per leaf of the
+    # path (e.g., Battalion, FireStation, Shift, PatientOutcome) summed
+    # from the cube and passed as values='Count'. The figure holds one
+    # entry per tree node instead of one row per record. The figure is
+    # returned so it can also be written to a file (see
+    # sunburst_html() and render_figures.py).
+    cube = load_count_cube()
+    cat_list = None
 
-def sunburst(path_in, col_in, subset):
     if subset == 140:
         cat_list = ['Patient Dead at Scene (No EMS CPR)',
                     'Standby (Operational Support Provided)',
                     'Treated, Transferred Care',
                     'Patient Dead at Scene (EMS CPR Attempted)']
-        df = df_q4[df_q4['PatientOutcome'].isin(cat_list)]
 
     if subset == 700:
         cat_list = ['Canceled (On Scene, No Patient Contact)',
                     'No Patient Found',
                     'Standby (No Services Performed)',
                     'EMS Assist (Other Agency)']
-        df = df_q4[df_q4['PatientOutcome'].isin(cat_list)]
 
     if subset == 1400:
         cat_list = ['Patient Refusal  (AMA)',
                     'No Treatment/Transport Required',
                     'Canceled (Prior to Arrival)']
-        df = df_q4[df_q4['PatientOutcome'].isin(cat_list)]
 
     if subset == 8000:
         cat_list = ['Treated & Transported']
-        df = df_q4[df_q4['PatientOutcome'].isin(cat_list)]
 
-    if subset == 0:
-        df = df_q4
+    if cat_list is not None:
+        cube = cube.select(PatientOutcome=cat_list)
+
+    # One grouped count over the cube cells, the color column is added
+    # when it is not part of the path
+    df = cube.counts(list(dict.fromkeys(list(path_in) + [col_in])))
+
+    # The outcome is shown as the hover name when it is in the path
+    hover = {}
+    if 'PatientOutcome' in path_in:
+        hover = dict(hover_name="PatientOutcome", hover_data={'PatientOutcome': False})
 
     fig = px.sunburst(
-        data_frame=df,
+        data_frame=_plain(df),
         path=path_in,
+        values='Count',
         color=col_in,
         color_discrete_sequence=px.colors.qualitative.Pastel,
         width=1500,
         height=1400,
         branchvalues="total",
-        hover_name="PatientOutcome",
-        hover_data={'PatientOutcome': False}
+        **hover
     )
     fig.update_traces(textinfo='label+percent entry')
     fig.update_layout(margin=dict(t=0, l=0, r=0, b=0))
 
-    return fig.show()
+    return fig
+
+
+def sunburst(path_in, col_in, subset):
+    return sunburst_figure(path_in, col_in, subset).show()
+
+
+def write_html(fig, file_path, max_mb=None, include_plotlyjs=True):
+    # Write a plotly figure to a stand alone html file. The plotly.js
+    # library is embedded by default (about 3.5 MB) so the file opens
+    # without a network connection; include_plotlyjs='cdn' links it
+    # instead. With max_mb the file is not written when it would be
+    # larger than max_mb megabytes.
+    html = fig.to_html(include_plotlyjs=include_plotlyjs, full_html=True)
+    size_mb = len(html.encode('utf-8')) / 2**20
+    if max_mb is not None and size_mb > max_mb:
+        raise ValueError('The html file would be {:.1f} MB, more than the {} MB limit. Use a '
+                         'shorter path or include_plotlyjs=\'cdn\''.format(size_mb, max_mb))
+
+    with proj_utils.atomic_path(file_path) as tmp:
+        tmp.write_text(html, encoding='utf-8')
+    return size_mb
+
+
+def sunburst_html(path_in, col_in, subset, file_path, max_mb=None, include_plotlyjs=True):
+    # Write the sunburst to a self contained html file (see write_html)
+    return write_html(sunburst_figure(path_in, col_in, subset), file_path,
+                      max_mb=max_mb, include_plotlyjs=include_plotlyjs)
 
 #####################
 ### PROJECT PLOTS ###
@@ -226,6 +460,83 @@ def sunburst(path_in, col_in, subset):
 # for the project. The graphics created before were exploratory options.
 
 
+# Violin plot subsets. Each subset keeps the fire station, shift and
+# outcome of the records, optionally combines the outcomes with
+# outcome_groups, leaves one outcome out and orders the outcomes
+# on the y-axis.
+cat_order_with_treated = ['Canceled (Prior to Arrival)',
+                          'Standby (Operational Support Provided)', 'Standby (No Services Performed)',
+                          'Patient Refusal  (AMA)',
+                          'No Patient Found', 'No Treatment/Transport Required', 'Canceled (On Scene, No Patient Contact)',
+                          'Patient Dead at Scene (EMS CPR Attempted)', 'Patient Dead at Scene (No EMS CPR)',
+                          'Treated & Transported',
+                          'Treated, Transferred Care', 'EMS Assist (Other Agency)']
+
+new_cat_order_with_treated = ['Canceled', 'Standby', 'Refused',
+                              'No Patient', 'Dead', 'Transport', 'Assist']
+
+violin_subsets = {
+    'withTreated': {'grouped': False, 'exclude': None,
+                    'order': cat_order_with_treated},
+    'withoutTreated': {'grouped': False, 'exclude': 'Treated & Transported',
+                       'order': [c for c in cat_order_with_treated if c != 'Treated & Transported']},
+    'new_cat_withTreated': {'grouped': True, 'exclude': None,
+                            'order': new_cat_order_with_treated},
+    'new_cat_withoutTreated': {'grouped': True, 'exclude': 'Transport',
+                               'order': [c for c in new_cat_order_with_treated if c != 'Transport']}
+}
+
+# Prepared violin plot frames, one per subset. Cleared when the q4
+# data frame is built again.
+_violin_frames = {}
+
+
+def _violin_frame(subset):
+    # Return the prepared frame of a violin plot subset. Only the three
+    # plotted columns are taken from df_q4 and the outcomes are recoded
+    # on their categories, the full frame is never copied.
+    if subset in _violin_frames:
+        return _violin_frames[subset]
+    if subset not in violin_subsets:
+        raise ValueError('Please check the subset {}. Valid options are {}'.format(
+            subset, ', '.join(violin_subsets)))
+
+    spec = violin_subsets[subset]
+    df_q4 = load_df_q4()
+
+    outcome = df_q4['PatientOutcome']
+    if spec['grouped']:
+        outcome = _outcome_group(outcome).rename('PatientOutcome')
+
+    columns = [df_q4['FireStation'], df_q4['Shift'], outcome]
+    if spec['exclude'] is not None:
+        keep = (outcome != spec['exclude']).values
+        columns = [column[keep] for column in columns]
+
+    df = DataFrame({column.name: column.cat.remove_unused_categories() for column in columns})
+    df['PatientOutcome'] = df['PatientOutcome'].cat.reorder_categories(spec['order'])
+
+    _violin_frames[subset] = df
+    return df
+
+
+def _violin_counts(df, hue_order=None):
+    # Number of records per fire station, shift (in hue_order) and
+    # outcome of a prepared violin plot frame
+    x_codes = df['FireStation'].cat.codes.values
+    y_codes = df['PatientOutcome'].cat.codes.values
+    n_x = len(df['FireStation'].cat.categories)
+    n_y = len(df['PatientOutcome'].cat.categories)
+
+    if hue_order is None:
+        return binned_violin.violin_counts(x_codes, y_codes, n_x, n_y)
+
+    shift_codes = df['Shift'].cat.codes.values
+    hue_codes = pd.Index(hue_order).get_indexer(df['Shift'].cat.categories)
+    hue_codes = np.where(shift_codes < 0, -1, hue_codes[shift_codes])
+    return binned_violin.violin_counts(x_codes, y_codes, n_x, n_y, hue_codes, len(hue_order))
+
+
 def violinplot(version, subset):
     # This function method attemps to generate all the violin plots created to
     # analyze the EMS call outcome distribution across fire station and shift.
@@ -234,6 +545,8 @@ def violinplot(version, subset):
     # is intended to:
     #   * Adjust the order of the EMS call outcome displayed on the y-axis.
     #   * Combine EMS call outcome categories as recommened by FCFRD
+    # The conditioning of each subset is declared in violin_subsets and
+    # the prepared frame is reused by the following calls.
 
     # The method uses the version attribute the data frame for the plot. One
     # data frame (i.e., withTreated) contains all records and the other
@@ -248,134 +561,25 @@ def violinplot(version, subset):
 
     # The fire station and patient outcome dictionary is created to properly
     # label the ticks for the y ans x axis.
-    df = df_q4.copy(deep=True)
-    df = df.astype('category')
-
-    cat_order_with_treated = ['Canceled (Prior to Arrival)',
-                              'Standby (Operational Support Provided)', 'Standby (No Services Performed)',
-                              'Patient Refusal  (AMA)',
-                              'No Patient Found', 'No Treatment/Transport Required', 'Canceled (On Scene, No Patient Contact)',
-                              'Patient Dead at Scene (EMS CPR Attempted)', 'Patient Dead at Scene (No EMS CPR)',
-                              'Treated & Transported',
-                              'Treated, Transferred Care', 'EMS Assist (Other Agency)']
-    
-    cat_order_without_treated = ['Canceled (Prior to Arrival)',
-                                 'Standby (Operational Support Provided)', 'Standby (No Services Performed)',
-                                 'Patient Refusal  (AMA)',
-                                 'No Patient Found', 'No Treatment/Transport Required', 'Canceled (On Scene, No Patient Contact)',
-                                 'Patient Dead at Scene (EMS CPR Attempted)', 'Patient Dead at Scene (No EMS CPR)',
-                                 'Treated, Transferred Care', 'EMS Assist (Other Agency)']
-
-    new_cats_dict = {'Canceled (Prior to Arrival)': 'Canceled',
-                     'Standby (Operational Support Provided)':'Standby',
-                     'Standby (No Services Performed)':'Standby',
-                     'Patient Refusal  (AMA)': 'Refused',
-                     'No Patient Found':'No Patient', 
-                     'No Treatment/Transport Required':'No Patient', 
-                     'Canceled (On Scene, No Patient Contact)':'No Patient',
-                     'Patient Dead at Scene (EMS CPR Attempted)':'Dead',
-                     'Patient Dead at Scene (No EMS CPR)':'Dead',
-                     'Treated & Transported':'Transport',
-                     'Treated, Transferred Care':'Assist', 
-                     'EMS Assist (Other Agency)':'Assist'}
-
-    new_cat_order_with_treated = ['Canceled', 'Standby', 'Refused', 
-                                  'No Patient', 'Dead', 'Transport', 'Assist']
-
-    new_cat_order_without_treated = ['Canceled', 'Standby', 'Refused', 
-                                     'No Patient', 'Dead', 'Assist']                                  
-
-
-    if subset == 'withoutTreated':
-        df = df[df['PatientOutcome'] != 'Treated & Transported'].copy()
-
-        df['FireStation'] = df['FireStation'].cat.remove_unused_categories()
-        df['Shift'] = df['Shift'].cat.remove_unused_categories()
-        df['PatientOutcome'] = df['PatientOutcome'].cat.remove_unused_categories()
-
-        df['PatientOutcome'] = df['PatientOutcome'].cat.reorder_categories(cat_order_without_treated)
-
-        FireStation_Dict = dict(enumerate(df['FireStation'].cat.categories))
-        FireStation_Key_List = list(FireStation_Dict.keys())
-        FireStation_Val_List = list(FireStation_Dict.values())
-
-        PatientOutcome_Dict = dict(
-            enumerate(df['PatientOutcome'].cat.categories))
-        PatientOutcome_Key_List = list(PatientOutcome_Dict.keys())
-        PatientOutcome_Val_List = list(PatientOutcome_Dict.values())
-
-    if subset == 'withTreated':
-        df = df
-
-        df['FireStation'] = df['FireStation'].cat.remove_unused_categories()
-        df['Shift'] = df['Shift'].cat.remove_unused_categories()
-        df['PatientOutcome'] = df['PatientOutcome'].cat.remove_unused_categories()
-
-        df['PatientOutcome'] = df['PatientOutcome'].cat.reorder_categories(cat_order_with_treated)
-
-        FireStation_Dict = dict(enumerate(df['FireStation'].cat.categories))
-        FireStation_Key_List = list(FireStation_Dict.keys())
-        FireStation_Val_List = list(FireStation_Dict.values())
-
-        PatientOutcome_Dict = dict(
-            enumerate(df['PatientOutcome'].cat.categories))
-        PatientOutcome_Key_List = list(PatientOutcome_Dict.keys())
-        PatientOutcome_Val_List = list(PatientOutcome_Dict.values())
-
-    if subset == 'new_cat_withoutTreated':
-        
-        df = df
-        df['PatientOutcome'] = df['PatientOutcome'].replace(new_cats_dict)
-        df = df.astype('category')
-        df = df[df['PatientOutcome'] != 'Transport'].copy()
-
-
-        df['FireStation'] = df['FireStation'].cat.remove_unused_categories()
-        df['Shift'] = df['Shift'].cat.remove_unused_categories()
-        df['PatientOutcome'] = df['PatientOutcome'].cat.remove_unused_categories()
-
-        df['PatientOutcome'] = df['PatientOutcome'].cat.reorder_categories(new_cat_order_without_treated)
-
-        FireStation_Dict = dict(enumerate(df['FireStation'].cat.categories))
-        FireStation_Key_List = list(FireStation_Dict.keys())
-        FireStation_Val_List = list(FireStation_Dict.values())
-
-        PatientOutcome_Dict = dict(
-                    enumerate(df['PatientOutcome'].cat.categories))
-        PatientOutcome_Key_List = list(PatientOutcome_Dict.keys())
-        PatientOutcome_Val_List = list(PatientOutcome_Dict.values())
-    
-    if subset == 'new_cat_withTreated':
-        df = df
-        df['PatientOutcome'] = df['PatientOutcome'].replace(new_cats_dict)
-        df = df.astype('category')
-
-        df['FireStation'] = df['FireStation'].cat.remove_unused_categories()
-        df['Shift'] = df['Shift'].cat.remove_unused_categories()
-        df['PatientOutcome'] = df['PatientOutcome'].cat.remove_unused_categories()
-
-        df['PatientOutcome'] = df['PatientOutcome'].cat.reorder_categories(new_cat_order_with_treated)
-
-        FireStation_Dict = dict(enumerate(df['FireStation'].cat.categories))
-        FireStation_Key_List = list(FireStation_Dict.keys())
-        FireStation_Val_List = list(FireStation_Dict.values())
-
-        PatientOutcome_Dict = dict(
-                    enumerate(df['PatientOutcome'].cat.categories))
-        PatientOutcome_Key_List = list(PatientOutcome_Dict.keys())
-        PatientOutcome_Val_List = list(PatientOutcome_Dict.values())
+    df = _violin_frame(subset)
+
+    FireStation_Dict = dict(enumerate(df['FireStation'].cat.categories))
+    FireStation_Key_List = list(FireStation_Dict.keys())
+    FireStation_Val_List = list(FireStation_Dict.values())
+
+    PatientOutcome_Dict = dict(enumerate(df['PatientOutcome'].cat.categories))
+    PatientOutcome_Key_List = list(PatientOutcome_Dict.keys())
+    PatientOutcome_Val_List = list(PatientOutcome_Dict.values())
 
     if version == 0:
         fig, ax1 = plt.subplots(figsize=(100, 30))
-        sns.violinplot(ax=ax1,
-                       data=df,
-                       x=df['FireStation'].cat.codes,
-                       y=df['PatientOutcome'].cat.codes,
-                       scale='count',
-                       inner='box',
-                       vw=.9,
-                       cut=0,
-                       palette=palette_sel_distinct_2)
+        binned_violin.binned_violinplot(_violin_counts(df),
+                                        ax=ax1,
+                                        group_names=FireStation_Key_List,
+                                        scale='count',
+                                        inner='box',
+                                        cut=0,
+                                        palette=palette_sel_distinct_2)
         ax1.set_yticks(PatientOutcome_Key_List)
         ax1.set_yticklabels(PatientOutcome_Val_List)
         ax1.set_xticks(FireStation_Key_List)
@@ -385,17 +589,16 @@ def violinplot(version, subset):
 
     if version == 1:
         fig, ax1 = plt.subplots(figsize=(160, 40))
-        sns.violinplot(ax=ax1,
-                       data=df,
-                       x=df['FireStation'].cat.codes,
-                       y=df['PatientOutcome'].cat.codes,
-                       scale='count',
-                       inner='box',
-                       vw=.9,
-                       cut=0,
-                       palette=palette_sel_distinct,
-                       hue='Shift',
-                       hue_order=['A - Shift', 'B - Shift', 'C - Shift'])
+        hue_order = ['A - Shift', 'B - Shift', 'C - Shift']
+        binned_violin.binned_violinplot(_violin_counts(df, hue_order),
+                                        ax=ax1,
+                                        group_names=FireStation_Key_List,
+                                        hue_names=hue_order,
+                                        scale='count',
+                                        inner='box',
+                                        cut=0,
+                                        palette=palette_sel_distinct,
+                                        hue_title='Shift')
         ax1.set_yticks(PatientOutcome_Key_List)
         ax1.set_yticklabels(PatientOutcome_Val_List)
         ax1.set_xticks(FireStation_Key_List)
@@ -426,7 +629,7 @@ def presentation_frequency_plot_figures(outcome):
     #    of interest. If the EMS call outcome is properly entered as value the
     #    data frame is reduced to show only the records associated for the
     #    individual EMS call outcome across fire station and shift.
-    df = df_q4.copy(deep=True)
+    cube = load_count_cube()
 
     # Axis Labels
     x_label = 'Counts'
@@ -454,22 +657,30 @@ def presentation_frequency_plot_figures(outcome):
                     'Patient Refusal  (AMA)', 
                     'No Treatment/Transport Required', 
                     'Canceled (Prior to Arrival)']
-        df = df_q4[df_q4['PatientOutcome'].isin(out_list)].copy(deep=True)
+        cube = cube.select(PatientOutcome=out_list)
         gen_fig_size = (10,5)
         gen_font_size = 18
     else:
         title = outcome + ' Outcome Across Fire Station and Shift'
-        df = df_q4[df_q4['PatientOutcome'] == outcome].copy(deep=True)
+        cube = cube.select(PatientOutcome=outcome)
+
+    # The bars are the cube counts per y selection and shift, ordered
+    # by the y selection totals
+    df = _plain(cube.counts([y_sel, 'Shift']))
+    order = df.groupby(y_sel)['Count'].sum().sort_values(ascending=False, kind='mergesort').index
 
     #Plot
     plt.subplots(figsize=gen_fig_size)
     sns.set_theme(style=seaborn_theme)
-    ax = sns.countplot(data=df,
-                       y=y_sel,
-                       hue='Shift',
-                       palette=palette_sel_distinct,
-                       order=df[y_sel].value_counts().index,
-                       hue_order=['A - Shift', 'B - Shift', 'C - Shift'])
+    ax = sns.barplot(data=df,
+                     x='Count',
+                     y=y_sel,
+                     hue='Shift',
+                     orient='h',
+                     **_no_error_bars,
+                     palette=palette_sel_distinct,
+                     order=order,
+                     hue_order=['A - Shift', 'B - Shift', 'C - Shift'])
     ax.set_title(title, fontsize=gen_font_size)
     ax.set_xlabel(x_label, fontsize=gen_font_size)
     ax.set_ylabel(y_label, fontsize=gen_font_size)
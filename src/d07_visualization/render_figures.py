@@ -0,0 +1,259 @@
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import re
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+# The figures are rendered without a display, the backend has to be
+# selected before pyplot is imported by the visualization module
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from src.d00_utils import pipeline
+from src.d00_utils import proj_utils
+from src.d07_visualization import q4_visualization_module as q4_vis
+
+## BATCH FIGURE RENDERER
+##
+## Renders the focus question 4 figure set (violin plots, frequency
+## plots and sunbursts) to data/06_reporting without an interactive
+## session. Matplotlib figures are written as PNG (and SVG on request)
+## and plotly figures as HTML. The figures are spread across worker
+## processes.
+##
+## Every rendered figure is recorded in _figures_manifest.json with a
+## key made of the content hash of the source data, the cache version
+## and the source hash of the visualization module (with the modules it
+## imports, e.g. binned_violin and count_cube), the plot parameters and
+## the output options (dpi, html size limit). A figure whose key has not
+## changed and whose files still exist is skipped, so after a data
+## refresh the deck is rebuilt unattended and an unchanged refresh costs
+## one hash of the source file.
+##
+## The manifest also records the rendering time and memory of every
+## figure: the peak of the Python allocations while drawing (peak_mb,
+## traced by tracemalloc) and the peak resident memory of the worker
+## process so far (max_rss_mb), which also counts the Agg and pyarrow
+## buffers. A worker draws several figures, so max_rss_mb is an upper
+## bound of the figure's own peak.
+##
+## A figure that fails is reported with its error and the others are
+## still rendered.
+##
+## Usage (from the project root):
+##      python -m src.d07_visualization.render_figures --workers 4 --formats png svg
+
+MANIFEST_FILE_NAME = '_figures_manifest.json'
+
+MATPLOTLIB_FORMATS = ['png', 'svg']
+
+_reporting_folder = Path(__file__).resolve().parents[2].joinpath('data', '06_reporting')
+
+
+def _slug(text):
+    return re.sub(r'[^a-z0-9]+', '-', str(text).lower()).strip('-')
+
+
+def figure_set():
+    """
+    Return the specification of every project figure: a dictionary with the figure name,
+    the visualization function and its arguments, and whether it is a plotly figure.
+    """
+    figures = list()
+
+    for subset in q4_vis.violin_subsets:
+        for version in (0, 1):
+            figures.append({'name': 'violin-v{}-{}'.format(version, _slug(subset)),
+                            'function': 'violinplot', 'args': [version, subset], 'plotly': False})
+
+    for outcome in ['Overall', 'Outcome', 'Top 4 Outcomes'] + q4_vis.cat_order_with_treated:
+        figures.append({'name': 'frequency-{}'.format(_slug(outcome)),
+                        'function': 'presentation_frequency_plot_figures', 'args': [outcome],
+                        'plotly': False})
+
+    for subset in (140, 700, 1400, 8000):
+        for sel in ('station', 'outcome'):
+            figures.append({'name': 'frequency-{}-{}'.format(subset, sel),
+                            'function': 'frequency_plot_station_outcome', 'args': [subset, sel],
+                            'plotly': False})
+
+    for hue_sel in ('year', 'Shift'):
+        figures.append({'name': 'frequency-station-{}'.format(_slug(hue_sel)),
+                        'function': 'frequency_plot_station', 'args': [hue_sel], 'plotly': False})
+
+    for subset in (0, 140, 700, 1400, 8000):
+        figures.append({'name': 'sunburst-{}'.format(subset),
+                        'function': 'sunburst_figure',
+                        'args': [['FireStation', 'PatientOutcome', 'Shift'], 'FireStation', subset],
+                        'plotly': True})
+
+    figures.append({'name': 'sunburst-battalion',
+                    'function': 'sunburst_figure',
+                    'args': [['Battalion', 'FireStation', 'Shift', 'PatientOutcome'], 'Battalion', 0],
+                    'plotly': True})
+
+    return figures
+
+
+def _figure_formats(figure, formats):
+    return ['html'] if figure['plotly'] else [fmt for fmt in formats if fmt in MATPLOTLIB_FORMATS]
+
+
+def _figure_key(figure, formats, data_hash, source_hash, dpi=None, html_max_mb=None):
+    """
+    Hash the source data, the visualization cache version and source, the parameters of a
+    figure and the output options of its files (resolution of the raster files, size limit
+    of the html files).
+    """
+    content = {'data': data_hash,
+               'version': q4_vis.CACHE_VERSION,
+               'source': source_hash,
+               'function': figure['function'],
+               'args': figure['args'],
+               'formats': formats,
+               'dpi': dpi if any(fmt in MATPLOTLIB_FORMATS for fmt in formats) else None,
+               'html_max_mb': html_max_mb if 'html' in formats else None}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _render_figure(figure, formats, out_dir, dpi, html_max_mb=None):
+    """
+    Draw one figure and write it in every format. Runs in a worker process.
+    """
+    out_dir = Path(out_dir)
+    files = list()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = getattr(q4_vis, figure['function'])(*figure['args'])
+
+        for fmt in formats:
+            path = out_dir.joinpath('q4-{}.{}'.format(figure['name'], fmt))
+            if figure['plotly']:
+                q4_vis.write_html(result, path, max_mb=html_max_mb)
+            else:
+                plt.gcf().savefig(str(path), format=fmt, dpi=dpi)
+            files.append(path.name)
+    finally:
+        plt.close('all')
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {'status': 'rendered', 'files': files,
+            'seconds': round(time.perf_counter() - start, 2),
+            'peak_mb': round(peak / 2**20, 1),
+            'max_rss_mb': proj_utils.max_rss_mb()}
+
+
+def render_figures(out_dir=None, formats=None, names=None, max_workers=None, dpi=None,
+                   html_max_mb=None, force=False):
+    """
+    The render_figures() function renders the project figure set to files.
+
+    Properties:
+    -----------
+        out_dir : string or Path (optional)
+            Output folder. Defaults to data/06_reporting.
+
+        formats : list of strings (optional)
+            Matplotlib output formats (png, svg). Plotly figures are always written as
+            html. Defaults to png.
+
+        names : list of strings (optional)
+            Render only these figures (see figure_set()). Defaults to every figure.
+
+        max_workers : int (optional)
+            Number of worker processes. Defaults to the number of processors.
+
+        dpi : int (optional)
+            Resolution of the raster files. Defaults to the matplotlib setting.
+
+        html_max_mb : float (optional)
+            Size limit of the self contained html files. A figure over the limit fails.
+            Defaults to no limit.
+
+        force : boolean (optional)
+            Render the figures even when their key has not changed. Defaults to False.
+
+    Return
+    ------
+        Dictionary : {figure name: {'status', 'files', 'seconds', 'peak_mb', 'max_rss_mb'}}
+        with status rendered, skipped or failed (with 'error')
+    """
+    out_dir = Path(out_dir) if out_dir is not None else _reporting_folder
+    formats = list(formats or ['png'])
+    figures = [figure for figure in figure_set() if names is None or figure['name'] in names]
+
+    manifest_path = out_dir.joinpath(MANIFEST_FILE_NAME)
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else dict()
+
+    data_hash = q4_vis._source_signature(q4_vis.source_path, with_hash=True)['sha1']
+    source_hash = pipeline.module_source_hash(q4_vis.__name__)
+    results = dict()
+    pending = dict()
+
+    for figure in figures:
+        figure_formats = _figure_formats(figure, formats)
+        key = _figure_key(figure, figure_formats, data_hash, source_hash, dpi, html_max_mb)
+        entry = manifest.get(figure['name'], dict())
+
+        if not force and entry.get('key') == key and \
+                all(out_dir.joinpath(name).exists() for name in entry['files']):
+            results[figure['name']] = dict(entry, status='skipped')
+        else:
+            pending[figure['name']] = (figure, figure_formats, key)
+
+    if pending:
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+        # The data frame and count cube caches are written once here, the
+        # workers only read them
+        q4_vis.load_df_q4()
+        q4_vis.load_count_cube()
+
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {name: pool.submit(_render_figure, figure, figure_formats,
+                                         str(out_dir), dpi, html_max_mb)
+                       for name, (figure, figure_formats, _) in pending.items()}
+
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except Exception as error:
+                    # The figure is rendered again on the next run
+                    results[name] = {'status': 'failed', 'files': [], 'error': repr(error)}
+                    manifest.pop(name, None)
+                else:
+                    manifest[name] = {'key': pending[name][2],
+                                      'files': results[name]['files'],
+                                      'seconds': results[name]['seconds'],
+                                      'peak_mb': results[name]['peak_mb'],
+                                      'max_rss_mb': results[name]['max_rss_mb']}
+
+                proj_utils.write_text_atomic(manifest_path, json.dumps(manifest, indent=1, sort_keys=True))
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render the project figures to data/06_reporting.')
+    parser.add_argument('--out-dir', default=None)
+    parser.add_argument('--formats', nargs='+', default=['png'], choices=MATPLOTLIB_FORMATS)
+    parser.add_argument('--names', nargs='+', default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--dpi', type=int, default=None)
+    parser.add_argument('--html-max-mb', type=float, default=None)
+    parser.add_argument('--force', action='store_true')
+    args = parser.parse_args()
+
+    results = render_figures(args.out_dir, args.formats, args.names,
+                             args.workers, args.dpi, args.html_max_mb, args.force)
+    for name, result in results.items():
+        print('{:<45} {:<9} {:>8}s {:>9} MB {:>9} MB rss {}'.format(
+            name, result['status'], result.get('seconds', ''), result.get('peak_mb', ''),
+            result.get('max_rss_mb') or '', result.get('error', '')))
@@ -0,0 +1,53 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The tests import the project modules as src.<folder>.<module>, as the
+# notebooks do, from the project root
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """
+    Project FRDPersonnelID registry stored in the test folder instead of data/02_intermediate.
+    """
+    from src.d00_utils import id_registry
+
+    frd_registry = id_registry.IdRegistry('FRDPersonnelID', path=tmp_path.joinpath('ids-FRDPersonnelID.csv'))
+    monkeypatch.setitem(id_registry._registries, 'FRDPersonnelID', frd_registry)
+    return frd_registry
+
+
+def raw_patients(rows=400, providers=12, months=4, seed=0):
+    """
+    Raw Patients records (patients table) spread over the first months of 2020. Every
+    provider has a record in the first month.
+    """
+    random = np.random.default_rng(seed)
+    provider_ids = ['{:08x}-guid'.format(code) for code in range(providers)]
+    provider = random.integers(0, providers, rows)
+    provider[:providers] = np.arange(providers)
+    month = random.integers(0, months, rows)
+    month[:providers] = 0
+    start = pd.Timestamp('2010-01-01') + pd.to_timedelta(provider * 200, unit='D')
+
+    df = pd.DataFrame({
+        'PatientId': np.arange(1, rows + 1),
+        'FRDPersonnelID': np.array(provider_ids)[provider],
+        'Shift': random.choice(['A - Shift', 'B - Shift', 'C - Shift'], rows),
+        'UnitId': random.choice(['M401', 'M408', 'E411'], rows),
+        'FireStation': random.choice([401, 408, 411], rows),
+        'Battalion': random.choice([401, 404], rows),
+        'PatientOutcome': random.choice(['Treated & Transported', 'No Patient Found',
+                                         'Patient Refusal  (AMA)'], rows),
+        'PatientGender': random.choice(['Female', 'Male', None], rows),
+        'CrewMemberRoles': random.choice(['Lead', 'Driver'], rows),
+        'DispatchTime': pd.Timestamp('2020-01-01') + pd.to_timedelta(month * 31, unit='D')
+                      + pd.to_timedelta(random.integers(0, 28 * 24, rows), unit='h'),
+        'FRDPersonnelGender': np.where(provider % 2, 'Female', 'Male'),
+        'FRDPersonnelStartDate': start})
+    return df
@@ -0,0 +1,90 @@
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.collections import PolyCollection
+
+import numpy as np
+import pandas as pd
+import pytest
+import seaborn as sns
+
+from src.d07_visualization import binned_violin
+
+
+def _records(rows=500, seed=0):
+    random = np.random.default_rng(seed)
+    return pd.DataFrame({'group': random.integers(0, 3, rows),
+                         'hue': random.integers(0, 2, rows),
+                         'value': random.choice(np.arange(6), rows, p=[.3, .25, .2, .1, .1, .05])})
+
+
+def _violins(ax):
+    return [collection.get_paths()[0].vertices for collection in ax.collections
+            if isinstance(collection, PolyCollection)]
+
+
+def _box_lines(ax):
+    return [line.get_xydata() for line in ax.lines]
+
+
+@pytest.mark.parametrize('scale', ['count', 'width', 'area'])
+@pytest.mark.parametrize('hue', [False, True])
+def test_binned_violinplot_matches_seaborn(scale, hue):
+    df = _records()
+    counts = binned_violin.violin_counts(df['group'], df['value'], 3, 6,
+                                         hue_codes=df['hue'] if hue else None, n_hue=2 if hue else 1)
+
+    fig, (ax_sns, ax_binned) = plt.subplots(1, 2)
+    try:
+        sns.violinplot(x='group', y='value', hue='hue' if hue else None, data=df, order=[0, 1, 2],
+                       hue_order=[0, 1] if hue else None, scale=scale, inner='box', cut=0,
+                       ax=ax_sns)
+        binned_violin.binned_violinplot(counts, ax=ax_binned, group_names=[0, 1, 2],
+                                        hue_names=[0, 1] if hue else None, scale=scale,
+                                        inner='box', cut=0)
+
+        expected_violins, actual_violins = _violins(ax_sns), _violins(ax_binned)
+        assert len(actual_violins) == len(expected_violins) == (6 if hue else 3)
+        for expected, actual in zip(expected_violins, actual_violins):
+            np.testing.assert_allclose(actual, expected, rtol=1e-7, atol=1e-9)
+
+        assert len(_box_lines(ax_binned)) == len(_box_lines(ax_sns)) > 0
+        for expected, actual in zip(_box_lines(ax_sns), _box_lines(ax_binned)):
+            np.testing.assert_allclose(actual, expected, rtol=1e-7, atol=1e-9)
+    finally:
+        plt.close(fig)
+
+
+def test_violin_counts_ignore_null_codes():
+    counts = binned_violin.violin_counts([0, 1, -1, 1], [2, 0, 1, -1], 2, 3)
+    assert counts.shape == (2, 1, 3)
+    assert counts[:, 0].tolist() == [[0, 0, 1], [1, 0, 0]]
+
+
+def test_single_valued_and_empty_groups_match_seaborn():
+    # Group 1 has one value (drawn as a line) and group 2 has no record
+    df = _records(rows=200)
+    df = df[df['group'] == 0]
+    df = pd.concat([df, pd.DataFrame({'group': [1] * 4, 'hue': 0, 'value': [3] * 4})], ignore_index=True)
+    values = np.array([0., .5, 1.25, 2., 3.5, 5.])
+    df['measure'] = values[df['value']]
+    counts = binned_violin.violin_counts(df['group'], df['value'], 3, 6)
+
+    fig, (ax_sns, ax_binned) = plt.subplots(1, 2)
+    try:
+        sns.violinplot(x='group', y='measure', data=df, order=[0, 1, 2], scale='area', inner=None,
+                       cut=0, ax=ax_sns)
+        binned_violin.binned_violinplot(counts, ax=ax_binned, values=values, group_names=[0, 1, 2],
+                                        scale='area', inner=None, cut=0)
+
+        assert len(_violins(ax_binned)) == len(_violins(ax_sns)) == 1
+        np.testing.assert_allclose(_violins(ax_binned)[0], _violins(ax_sns)[0], rtol=1e-7, atol=1e-9)
+        assert len(_box_lines(ax_binned)) == len(_box_lines(ax_sns)) == 1
+        np.testing.assert_allclose(_box_lines(ax_binned)[0], _box_lines(ax_sns)[0], rtol=1e-7, atol=1e-9)
+    finally:
+        plt.close(fig)
+
+    with pytest.raises(ValueError, match='stick'):
+        binned_violin.binned_violinplot(counts, inner='stick')
+    with pytest.raises(ValueError, match='height'):
+        binned_violin.binned_violinplot(counts, scale='height')
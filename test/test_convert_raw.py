@@ -0,0 +1,95 @@
+import pandas as pd
+import pytest
+
+from src.d00_utils import schema
+from src.d01_data.convert_raw import convert_raw_workbook
+from src.d02_intermediate.create_int_patient_data import load_raw_sheet
+from conftest import raw_patients
+
+
+def test_converted_sheet_reads_back_as_the_workbook(tmp_path):
+    df = raw_patients(rows=120)
+    df.loc[:5, 'FireStation'] = None
+    xlsx_path = tmp_path.joinpath('ems-raw.xlsx')
+    with pd.ExcelWriter(xlsx_path, engine='openpyxl') as writer:
+        df.to_excel(writer, sheet_name='Patients', index=False)
+
+    results = convert_raw_workbook(xlsx_path, sheets=['Patients'], max_workers=1)
+    sheet_dir = tmp_path.joinpath('ems-raw', 'patients')
+    assert results['Patients']['rows'] == len(df)
+    assert sorted(path.name for path in sheet_dir.iterdir()) == ['year=2020']
+
+    converted = schema.read_parquet(sheet_dir, table='patients', columns=schema.TABLES['patients'])
+    loaded = load_raw_sheet('Patients', sheet_dir)
+    expected = schema.apply_schema(df.copy(), table='patients')
+
+    for column in schema.NUMERIC_CATEGORIES:
+        assert converted[column].dtype == 'category'
+        assert converted[column].cat.categories.tolist() == sorted(df[column].dropna().astype(int).unique())
+    assert converted['FRDPersonnelID'].dtype == 'category'
+
+    converted = converted.sort_values('PatientId').reset_index(drop=True)
+    loaded = loaded.sort_values('PatientId').reset_index(drop=True)
+    pd.testing.assert_frame_equal(loaded[converted.columns], converted)
+    for column in expected.columns:
+        assert converted[column].astype(object).where(converted[column].notna(), None).tolist() == \
+            expected[column].astype(object).where(expected[column].notna(), None).tolist(), column
+
+
+def _workbook(path, patients, procedures=None):
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        patients.to_excel(writer, sheet_name='Patients', index=False)
+        if procedures is not None:
+            procedures.to_excel(writer, sheet_name='Procedures', index=False)
+
+
+def test_sheets_are_partitioned_by_year_and_skipped_when_unchanged(tmp_path):
+    df = raw_patients(rows=300)
+    df.loc[:99, 'DispatchTime'] -= pd.Timedelta(days=365)
+    df.loc[100, 'DispatchTime'] = None
+    df.loc[101, 'UnitId'] = 'NA'
+    procedures = pd.DataFrame({'Dim_Procedure_PK': [1, 2], 'PatientId': [1, 2],
+                               'Procedure_Performed_Code': [1000, 1001],
+                               'Procedure_Performed_Description': ['IV', 'ECG'],
+                               'FRDPersonnelID': df['FRDPersonnelID'][:2],
+                               'Procedure_Performed_Date_Time': df['DispatchTime'][:2]})
+    xlsx_path = tmp_path.joinpath('ems-raw.xlsx')
+    _workbook(xlsx_path, df, procedures)
+
+    results = convert_raw_workbook(xlsx_path, sheets=['Patients', 'Procedures'], chunk_size=64,
+                                   max_workers=2)
+    assert results['Patients']['partitions'] == ['0', '2019', '2020']
+    assert results['Procedures']['partitions'] == ['2019']
+    assert [results[sheet]['rows'] for sheet in ('Patients', 'Procedures')] == [300, 2]
+
+    patients = pd.read_parquet(tmp_path.joinpath('ems-raw', 'patients', 'year=2019'))
+    assert len(patients) == 100 and patients['DispatchTime'].dt.year.eq(2019).all()
+    converted = schema.read_parquet(tmp_path.joinpath('ems-raw', 'patients'), table='patients',
+                                    columns=schema.TABLES['patients'])
+    assert converted['DispatchTime'].isnull().sum() == 1
+    assert converted['UnitId'].isnull().sum() == 1
+
+    results = convert_raw_workbook(xlsx_path, sheets=['Patients', 'Procedures'])
+    assert {sheet: result['status'] for sheet, result in results.items()} == \
+        {'Patients': 'skipped', 'Procedures': 'skipped'}
+    assert results['Patients']['rows'] == 300
+
+    # A new extract is converted again, force converts an unchanged one
+    _workbook(xlsx_path, df.iloc[:250], procedures)
+    results = convert_raw_workbook(xlsx_path, sheets=['Patients'])
+    assert results['Patients']['status'] == 'converted' and results['Patients']['rows'] == 250
+    assert convert_raw_workbook(xlsx_path, sheets=['Patients'], force=True)['Patients']['status'] == 'converted'
+
+
+def test_missing_columns_and_sheets_are_rejected(tmp_path):
+    xlsx_path = tmp_path.joinpath('ems-raw.xlsx')
+    _workbook(xlsx_path, raw_patients(rows=20).drop(columns='Shift'))
+
+    with pytest.raises(ValueError, match='Shift'):
+        convert_raw_workbook(xlsx_path, sheets=['Patients'], max_workers=1)
+    assert not tmp_path.joinpath('ems-raw', 'patients').exists()
+
+    with pytest.raises(ValueError, match='Vitals'):
+        convert_raw_workbook(xlsx_path, sheets=['Vitals'])
+    with pytest.raises(ValueError, match='no Procedures sheet'):
+        convert_raw_workbook(xlsx_path)
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from src.d07_visualization.count_cube import CountCube
+
+DIMENSIONS = ['FireStation', 'Shift', 'PatientOutcome']
+
+
+def _records(rows=3000, seed=0):
+    random = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'FireStation': pd.Categorical(random.choice([401, 408, 411, 420], rows)),
+        'Shift': random.choice(['A - Shift', 'B - Shift', 'C - Shift'], rows),
+        'PatientOutcome': pd.Categorical(random.choice(['Treated & Transported', 'No Patient Found',
+                                                        'Patient Refusal  (AMA)'], rows)),
+        'DispatchTime': pd.Timestamp('2019-06-01')
+                        + pd.to_timedelta(random.integers(0, 400 * 24, rows), unit='h')})
+    df.loc[::50, 'Shift'] = None
+    df.loc[::70, 'PatientOutcome'] = np.nan
+    return df
+
+
+def _pandas_counts(df, by):
+    return df.groupby(by, observed=True).size().rename('Count').sort_index().reset_index()
+
+
+def test_cube_counts_match_the_record_counts():
+    df = _records()
+    cube = CountCube.build(df, DIMENSIONS, time_column='DispatchTime')
+
+    # Every record is in one cell, null values included
+    assert cube.cells['Count'].sum() == len(df)
+    assert cube.dimensions == DIMENSIONS + ['DispatchMonth']
+    assert len(cube.cells) < len(df)
+
+    for by in (['FireStation'], ['FireStation', 'Shift'], ['Shift', 'PatientOutcome'], DIMENSIONS):
+        counts = cube.counts(by)
+        expected = _pandas_counts(df, by)
+        assert counts[by].astype(object).values.tolist() == expected[by].astype(object).values.tolist()
+        assert counts['Count'].tolist() == expected['Count'].tolist()
+
+    months = df.assign(DispatchMonth=df['DispatchTime'].dt.to_period('M').dt.to_timestamp())
+    counts = cube.counts(['DispatchMonth', 'Shift'])
+    expected = _pandas_counts(months, ['DispatchMonth', 'Shift'])
+    assert counts.values.tolist() == expected.values.tolist()
+
+    counts = cube.counts(['FireStation', 'year'])
+    expected = _pandas_counts(df.assign(year=df['DispatchTime'].dt.year), ['FireStation', 'year'])
+    assert counts.astype(object).values.tolist() == expected.astype(object).values.tolist()
+
+
+def test_selected_cells_match_the_filtered_records():
+    df = _records(seed=1)
+    cube = CountCube.build(df, DIMENSIONS)
+    outcomes = ['No Patient Found', 'Patient Refusal  (AMA)']
+
+    selected = cube.select(PatientOutcome=outcomes, Shift='A - Shift')
+    expected = df[df['PatientOutcome'].isin(outcomes) & (df['Shift'] == 'A - Shift')]
+    assert selected.cells['Count'].sum() == len(expected)
+
+    counts = selected.counts(['FireStation', 'PatientOutcome'])
+    assert counts['Count'].tolist() == _pandas_counts(expected, ['FireStation', 'PatientOutcome'])['Count'].tolist()
+    assert counts['PatientOutcome'].cat.categories.tolist() == sorted(outcomes)
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+from src.d00_utils import schema
+from src.d02_intermediate.create_int_patient_data import build_patients_intermediate, \
+    consolidate_crew_roles, tenure_months
+from conftest import raw_patients
+
+
+def _raw(rows=300):
+    # Raw records with roles entered on two and three rows, exact duplicates
+    # and providers without a start date
+    df = raw_patients(rows=rows)
+    second = df.iloc[10:40].assign(CrewMemberRoles='Attendant')
+    third = df.iloc[10:20].assign(CrewMemberRoles='Other')
+    df = pd.concat([df, second, df.iloc[50:55], third], ignore_index=True)
+    df.loc[[60, 61], 'FRDPersonnelStartDate'] = pd.NaT
+    return df.sample(frac=1, random_state=0).reset_index(drop=True)
+
+
+def _notebook_intermediate(df):
+    # The IntermediateDataset-Patients notebook steps, the role consolidation
+    # as a join of the roles of every PatientId and FRDPersonnelID pair
+    df = df.drop(df[df.FRDPersonnelStartDate.isnull()].index)
+    df = pd.DataFrame.drop_duplicates(df)
+
+    roles = df.groupby(['PatientId', 'FRDPersonnelID'], sort=False)['CrewMemberRoles'] \
+        .agg(', '.join).rename('newCrewMemberRoles').reset_index()
+    df = pd.merge(df, roles, how='left', on=['FRDPersonnelID', 'PatientId'])
+    df = df.drop(columns=['CrewMemberRoles']).rename(columns={'newCrewMemberRoles': 'CrewMemberRoles'})
+    df = pd.DataFrame.drop_duplicates(df)
+
+    df.loc[:, 'TenureMonths'] = ((df['DispatchTime'].dt.date - df['FRDPersonnelStartDate'].dt.date) /
+                                 np.timedelta64(1, 'M')).astype(int)
+    df.loc[:, 'ShiftCode'] = pd.factorize(df['Shift'])[0] + 1
+    dummies = pd.get_dummies(df['Shift']).rename(
+        columns={'A - Shift': 'Shift_A', 'B - Shift': 'Shift_B', 'C - Shift': 'Shift_C'})
+    df = pd.concat([df, dummies], axis=1)
+    df['UnitIdCode'] = pd.factorize(df['UnitId'])[0] + 1
+    df['PatientOutcomeCode'] = pd.factorize(df['PatientOutcome'])[0] + 1
+    df['PatientGenderCode'] = pd.factorize(df['PatientGender'])[0] + 1
+    df['ProviderGenderCode'] = pd.factorize(df['FRDPersonnelGender'])[0] + 1
+    return df.reset_index(drop=True)
+
+
+def _values(series):
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def test_intermediate_matches_the_notebook_steps(tmp_path, registry):
+    raw = _raw()
+    raw.to_parquet(tmp_path.joinpath('patients.parquet'), index=False)
+
+    result = build_patients_intermediate(tmp_path.joinpath('patients.parquet'),
+                                         tmp_path.joinpath('dfPatients_dedup'), csv=True)
+    expected = _notebook_intermediate(raw)
+    assert result['raw_rows'] == len(raw)
+    assert result['rows'] == len(expected)
+    assert set(result['seconds']) == {'load', 'dedup_roles', 'derive', 'write_parquet', 'write_csv'}
+
+    built = schema.read_parquet(tmp_path.joinpath('dfPatients_dedup.parquet'), table='patients_intermediate')
+    assert sorted(built.columns) == sorted(expected.columns)
+    assert built['CrewMemberRoles'].astype(str).str.count(', ').value_counts().to_dict() == \
+        {0: len(built) - 30, 1: 20, 2: 10}
+    for column in expected.columns:
+        assert _values(built[column]) == _values(expected[column]), column
+    assert built['TenureMonths'].dtype == 'Int16' and built['ShiftCode'].dtype == 'Int8'
+
+    csv = schema.read_csv(tmp_path.joinpath('dfPatients_dedup.csv'), table='patients_intermediate')
+    assert _values(csv['CrewMemberRoles']) == _values(expected['CrewMemberRoles'])
+    assert registry.path.exists()
+
+
+def test_any_number_of_roles_is_consolidated(registry):
+    df = pd.DataFrame({'PatientId': [1, 1, 1, 1, 2, 2, 3],
+                       'FRDPersonnelID': ['a', 'a', 'a', 'a', 'a', 'b', 'b'],
+                       'Shift': 'A - Shift',
+                       'CrewMemberRoles': ['Lead', 'Driver', None, 'Other', 'Lead', None, 'Driver']})
+    consolidated = consolidate_crew_roles(df)
+    assert list(consolidated.columns) == ['PatientId', 'FRDPersonnelID', 'Shift', 'CrewMemberRoles']
+    assert consolidated[['PatientId', 'FRDPersonnelID']].values.tolist() == [[1, 'a'], [2, 'a'], [2, 'b'], [3, 'b']]
+    assert _values(consolidated['CrewMemberRoles']) == ['Lead, Driver, Other', 'Lead', None, 'Driver']
+
+
+def test_tenure_months_match_the_date_arithmetic():
+    random = np.random.default_rng(0)
+    dispatch = pd.Series(pd.Timestamp('2015-01-01')
+                         + pd.to_timedelta(random.integers(0, 6 * 365 * 24 * 60, 2000), unit='min'))
+    start = pd.Series(pd.Timestamp('2000-01-01')
+                      + pd.to_timedelta(random.integers(0, 20 * 365, 2000), unit='D'))
+    dispatch[::50] = pd.NaT
+    start[::70] = pd.NaT
+
+    months = tenure_months(dispatch, start)
+    known = dispatch.notnull() & start.notnull()
+    expected = ((dispatch[known].dt.date - start[known].dt.date) / np.timedelta64(1, 'M')).astype(int)
+    assert months[known].astype(int).tolist() == expected.tolist()
+    assert months[~known].isnull().all()
+    assert (months < 0).any()
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from src.d00_utils import schema
+from src.d03_processing import create_master_table
+from conftest import raw_patients
+
+
+def _procedures(patients, seed=0):
+    """
+    Procedures records of the patients, half of them by another provider than the one of
+    the Patients record (orphans), with a few duplicates.
+    """
+    random = np.random.default_rng(seed)
+    rows = random.integers(0, len(patients), len(patients) * 2)
+    providers = patients['FRDPersonnelID'].values[rows]
+    other = patients['FRDPersonnelID'].values[random.integers(0, len(patients), len(rows))]
+
+    df = pd.DataFrame({'Dim_Procedure_PK': np.arange(len(rows)) % 50,
+                       'PatientId': patients['PatientId'].values[rows],
+                       'Procedure_Performed_Code': random.integers(1000, 1005, len(rows)),
+                       'Procedure_Performed_Description': random.choice(['IV', 'ECG', 'O2'], len(rows)),
+                       'FRDPersonnelID': np.where(random.random(len(rows)) < .5, providers, other),
+                       'Procedure_Performed_Date_Time': patients['DispatchTime'].values[rows]})
+    return schema.apply_schema(pd.concat([df, df.iloc[:20]], ignore_index=True), table='procedures')
+
+
+def _read(folder):
+    df = pq.ParquetDataset(str(folder), use_legacy_dataset=False).read().to_pandas()
+    df['dispatch_month'] = df['dispatch_month'].astype(str)
+    for column in df.columns:
+        if pd.api.types.is_categorical_dtype(df[column]):
+            df[column] = df[column].astype(object)
+    return df.sort_values(list(df.columns), kind='mergesort').reset_index(drop=True)
+
+
+def test_incremental_build_matches_full_rebuild(tmp_path, registry):
+    patients = schema.apply_schema(raw_patients(rows=400, months=4), table='patients')
+    procedures = _procedures(patients)
+
+    full = create_master_table.build_master_table('procedures', patients, procedures,
+                                                  out_dir=tmp_path.joinpath('full'), rebuild=True)
+
+    # The first drop holds the first two months, the second one every month
+    early = patients[patients['DispatchTime'] < pd.Timestamp('2020-03-01')]
+    first = create_master_table.build_master_table(
+        'procedures', early, procedures[procedures['PatientId'].isin(early['PatientId'])],
+        out_dir=tmp_path.joinpath('incremental'))
+    second = create_master_table.build_master_table('procedures', patients, procedures,
+                                                    out_dir=tmp_path.joinpath('incremental'))
+
+    assert first['written'] == ['2020-01', '2020-02']
+    assert second['kept'] == ['2020-01']
+    assert second['written'] == ['2020-02', '2020-03', '2020-04']
+    assert full['rows'] == len(_read(tmp_path.joinpath('full')))
+
+    pd.testing.assert_frame_equal(_read(tmp_path.joinpath('incremental')), _read(tmp_path.joinpath('full')))
+
+
+def _notebook_master_table(patients, procedures):
+    """
+    The IntermediateDataset-Procedures-Pat notebook join: the records of the pairs found in
+    the Patients records, then the orphans with the provider and patient lookup tables.
+    """
+    dfProcedures = pd.DataFrame.drop_duplicates(procedures.drop(['Procedure_Performed_Date_Time'], axis=1))
+    dfPatientsSub = pd.DataFrame.drop_duplicates(patients[create_master_table.PATIENT_COLUMNS])
+    dfPatientsSub = dfPatientsSub.drop(dfPatientsSub[(dfPatientsSub.FRDPersonnelGender.isnull())].index)
+    dfProcPat = dfPatientsSub.merge(dfProcedures, on=('PatientId', 'FRDPersonnelID'))
+
+    pairs = set(zip(dfProcPat['PatientId'], dfProcPat['FRDPersonnelID']))
+    dfProcLeftJoin = dfProcedures[[pair not in pairs for pair in zip(dfProcedures['PatientId'],
+                                                                      dfProcedures['FRDPersonnelID'])]]
+    luProvider = patients.groupby(['FRDPersonnelID', 'FRDPersonnelGender', 'FRDPersonnelStartDate'],
+                                  observed=True).size().reset_index(name='count').drop(['count'], axis=1)
+    luPatients = patients.groupby(['PatientId', 'PatientOutcome', 'PatientGender', 'DispatchTime'],
+                                  observed=True).size().reset_index(name='count').drop(['count'], axis=1)
+    dfProcPatSub = dfProcLeftJoin.merge(luProvider, on='FRDPersonnelID').merge(luPatients, on='PatientId')
+
+    dfProcPatAppend = pd.concat([dfProcPat, dfProcPatSub], ignore_index=True)
+    dfProcPatAppend['TenureMonths'] = ((dfProcPatAppend.loc[:, 'DispatchTime'].dt.date -
+                                        dfProcPatAppend.loc[:, 'FRDPersonnelStartDate'].dt.date) /
+                                       np.timedelta64(1, 'M')).astype(int)
+    return dfProcPatAppend
+
+
+def _rows(df, columns):
+    return sorted(zip(*[df[column].astype(object).where(df[column].notna(), None).astype(str)
+                        for column in columns]))
+
+
+def test_master_table_rows_match_the_notebook_join(tmp_path, registry):
+    patients = schema.apply_schema(raw_patients(rows=200, months=2, seed=3), table='patients')
+    patients.loc[::9, 'PatientGender'] = None
+    procedures = _procedures(patients, seed=3)
+    result = create_master_table.build_master_table('procedures', patients, procedures,
+                                                    out_dir=tmp_path.joinpath('master'), rebuild=True)
+
+    expected = _notebook_master_table(patients, procedures)
+    df = _read(tmp_path.joinpath('master'))
+    assert sorted(df.columns) == sorted(list(expected.columns) + ['dispatch_month'])
+    assert result['rows'] == len(df) == len(expected)
+    assert _rows(df, expected.columns) == _rows(expected, expected.columns)
+    assert registry.path.exists()
@@ -0,0 +1,63 @@
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from src.d00_utils import schema
+from src.d02_intermediate.create_int_patient_data import build_patients_intermediate
+from src.d03_processing.create_tenure_data import build_tenure_data
+from conftest import raw_patients
+
+
+def _intermediate(tmp_path):
+    # Two providers start within the months of their records, so some of
+    # their dispatches are before the start date
+    df = raw_patients(rows=600, months=6)
+    for provider, start in ((1, '2020-03-15'), (4, '2020-01-20 18:00')):
+        df.loc[df['FRDPersonnelID'] == '{:08x}-guid'.format(provider), 'FRDPersonnelStartDate'] = \
+            pd.Timestamp(start)
+    df.loc[7, 'DispatchTime'] = pd.NaT
+    df.to_parquet(tmp_path.joinpath('patients.parquet'), index=False)
+
+    build_patients_intermediate(tmp_path.joinpath('patients.parquet'), tmp_path.joinpath('dfPatients_dedup'))
+    return tmp_path.joinpath('dfPatients_dedup.parquet')
+
+
+def test_tenure_and_time_travelers_match_the_notebook(tmp_path, registry):
+    source = _intermediate(tmp_path)
+    result = build_tenure_data(source, tmp_path.joinpath('dfPatients_tenure.parquet'),
+                               tmp_path.joinpath('TimeTravelers'))
+
+    df = schema.read_parquet(tmp_path.joinpath('dfPatients_tenure.parquet'), table='patients_tenure')
+    patients = schema.read_parquet(source, table='patients_intermediate')
+    assert result['rows'] == len(df) == len(patients)
+    assert df['TenureYears'].dtype == 'Int8' and df['TimeTraveler'].dtype == bool
+
+    # The UnderlyingDistPlots notebook computation on the records with both dates
+    known = patients['DispatchTime'].notnull()
+    elapsed = patients['DispatchTime'][known].dt.date - patients['FRDPersonnelStartDate'][known].dt.date
+    months = (elapsed / np.timedelta64(1, 'M')).astype(int)
+    assert df['TenureMonths'][known].astype(int).tolist() == months.tolist()
+    assert df['TenureYears'][known].astype(int).tolist() == np.floor(months / 12).astype(int).tolist()
+    assert df['TenureMonths'][~known].isnull().all() and not df['TimeTraveler'][~known].any()
+
+    travelers = patients[known][(elapsed < dt.timedelta()).values]
+    assert df['TimeTraveler'].sum() == result['time_traveler_rows'] == len(travelers) > 0
+    assert df['PatientId'][df['TimeTraveler']].tolist() == travelers['PatientId'].tolist()
+    assert ((df['TenureMonths'] == 0) & df['TimeTraveler']).any()
+
+    # One summary row per provider and start date with time travelers
+    summary = pd.read_parquet(tmp_path.joinpath('TimeTravelers.parquet'))
+    expected = travelers.groupby('FRDPersonnelID', observed=True).agg(
+        TimeTravelerRecords=('PatientId', 'size'), FirstDispatchTime=('DispatchTime', 'min'),
+        FRDPersonnelStartDate=('FRDPersonnelStartDate', 'first'))
+    expected['Records'] = patients.groupby('FRDPersonnelID', observed=True).size()[expected.index]
+    expected['MaxDaysBeforeStart'] = (expected['FRDPersonnelStartDate'].dt.normalize()
+                                      - expected['FirstDispatchTime'].dt.normalize()).dt.days
+    expected = expected.reset_index()
+
+    assert result['providers'] == len(summary) == 2
+    for column in expected.columns:
+        assert summary[column].astype(str).tolist() == expected[column].astype(str).tolist(), column
+    assert pd.read_csv(tmp_path.joinpath('TimeTravelers.csv'))['TimeTravelerRecords'].tolist() == \
+        expected['TimeTravelerRecords'].tolist()
@@ -0,0 +1,122 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.d00_utils import schema
+from src.d06_reporting.DataQualityReport import DataQualityProfile, write_report
+from conftest import raw_patients
+
+
+@pytest.fixture
+def patients_csv(tmp_path):
+    df = raw_patients(rows=300)
+    df = pd.concat([df, df.iloc[:40]], ignore_index=True)
+    path = tmp_path.joinpath('patients.csv')
+    df.to_csv(path, index=False)
+    return path
+
+
+@pytest.mark.parametrize('table', [None, 'patients'])
+def test_profile_matches_pandas(patients_csv, table):
+    df = schema.read_csv(patients_csv, table=table)
+    profile = DataQualityProfile(patients_csv, table=table, chunk_size=64)
+    columns = profile.columns().set_index('Column')
+
+    assert profile.rows == len(df)
+    assert profile.summary()['duplicates'] == int(df.duplicated().sum())
+    assert list(columns.index) == list(df.columns)
+    assert columns['Nulls'].to_dict() == df.isnull().sum().to_dict()
+    assert columns['Unique'].to_dict() == df.nunique(dropna=False).to_dict()
+
+
+def test_approximate_profile_is_close(patients_csv):
+    df = pd.read_csv(patients_csv)
+    profile = DataQualityProfile(patients_csv, chunk_size=64, approximate=True)
+    unique = profile.columns().set_index('Column')['Unique']
+
+    assert np.allclose(unique, df.nunique(dropna=False)[unique.index], rtol=0.05)
+    assert abs(profile.summary()['duplicates'] - df.duplicated().sum()) <= 0.01 * len(df) + 1
+
+
+def test_report_rotates_when_the_content_changes(patients_csv, tmp_path):
+    out_dir = tmp_path.joinpath('reporting')
+    write_report(DataQualityProfile(patients_csv, name='patients'), out_dir)
+
+    # Same content: the report is replaced, there is no previous one
+    files = write_report(DataQualityProfile(patients_csv, name='patients'), out_dir)
+    assert not out_dir.joinpath('DataQuality-patients-previous.json').exists()
+    assert len(files) == 2
+
+    # New content in the same undated file: the last report becomes the previous one
+    raw_patients(rows=200, seed=1).to_csv(patients_csv, index=False)
+    profile = DataQualityProfile(patients_csv, name='patients')
+    files = write_report(profile, out_dir)
+
+    previous = json.loads(out_dir.joinpath('DataQuality-patients-previous.json').read_text())
+    assert previous['content_hash'] != profile.content_hash
+    assert profile.drop == profile.content_hash[:12]
+    assert files[-1].endswith('DataQuality-patients-diff.csv')
+
+    diff = pd.read_csv(files[-1]).set_index('Column')
+    assert diff.loc['(rows)', 'Unique Delta'] == 200 - 340
+
+
+def test_profile_numeric_looking_text_across_chunks(tmp_path):
+    # UnitId is a number in the first chunk and text in the second one
+    source = tmp_path.joinpath('units.csv')
+    pd.DataFrame({'UnitId': ['401'] * 5 + ['401', 'M401', '408', 'M401', '401'],
+                  'Shift': ['A'] * 10}).to_csv(source, index=False)
+    df = pd.read_csv(source)
+
+    profile = DataQualityProfile(source, chunk_size=5)
+    assert profile.columns().set_index('Column').loc['UnitId', 'Unique'] == df['UnitId'].nunique() == 3
+    assert profile.summary()['duplicates'] == int(df.duplicated().sum()) == 7
+
+
+def _get_var_category(series):
+    # get_var_category() of the intermediate dataset notebooks
+    unique_count = series.nunique(dropna=False)
+    total_count = len(series)
+    if pd.api.types.is_numeric_dtype(series):
+        return 'Numerical'
+    elif pd.api.types.is_datetime64_dtype(series):
+        return 'Date'
+    elif unique_count == total_count:
+        return 'Text (Unique)'
+    else:
+        return 'Categorical'
+
+
+def test_partitioned_source_profile_matches_the_notebook(tmp_path):
+    df = raw_patients(rows=500)
+    df['IncidentNumber'] = ['F{:07d}'.format(row) for row in range(len(df))]
+    unique = df.drop(columns='PatientId')
+    df = pd.concat([df, df.iloc[:25]], ignore_index=True)
+    df.loc[::13, 'FireStation'] = np.nan
+
+    folder = tmp_path.joinpath('patients')
+    folder.mkdir()
+    for part, rows in enumerate(np.array_split(np.arange(len(df)), 3)):
+        df.iloc[rows].to_parquet(folder.joinpath('part-{}.parquet'.format(part)), index=False)
+    df.to_parquet(tmp_path.joinpath('patients.parquet'), index=False)
+
+    profile = DataQualityProfile(folder, chunk_size=100)
+    columns = profile.columns().set_index('Column')
+    assert profile.name == 'patients' and profile.rows == len(df)
+    assert profile.summary()['duplicates'] == int(df.duplicated().sum()) > 0
+    assert columns['Category'].to_dict() == {column: _get_var_category(df[column]) for column in df.columns}
+    assert columns['Percent Null'].to_dict() == (df.isnull().sum() / len(df) * 100).round(2).to_dict()
+    assert columns['Unique'].to_dict() == df.nunique(dropna=False).to_dict()
+
+    # The content hash does not depend on the file layout
+    assert DataQualityProfile(tmp_path.joinpath('patients.parquet')).content_hash == profile.content_hash
+    parts = sorted(folder.iterdir())
+    assert DataQualityProfile(parts).content_hash == profile.content_hash
+    assert DataQualityProfile(parts[:2]).content_hash != profile.content_hash
+
+    # Without the duplicated records the incident numbers are unique text
+    unique.to_csv(tmp_path.joinpath('unique.csv'), index=False)
+    categories = DataQualityProfile(tmp_path.joinpath('unique.csv')).columns().set_index('Column')['Category']
+    assert categories['IncidentNumber'] == _get_var_category(unique['IncidentNumber']) == 'Text (Unique)'
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.d00_utils import schema
+from src.d02_intermediate.dedup_table import dedup_table
+
+
+def _frame(rows=60, seed=0):
+    """
+    Frame with duplicate rows, whose text and float columns are null in the first 10 rows.
+    """
+    random = np.random.default_rng(seed)
+    df = pd.DataFrame({'a': random.integers(0, 4, rows),
+                       'b': random.choice(['p', 'q', 'r'], rows).astype(object),
+                       'c': random.integers(0, 3, rows).astype(float)})
+    df.loc[:9, 'b'] = None
+    df.loc[:9, 'c'] = np.nan
+    return df
+
+
+def _medications(rows=60, seed=0):
+    """
+    Medications records whose description and date are null in the first 10 rows.
+    """
+    random = np.random.default_rng(seed)
+    df = pd.DataFrame({'Dim_Medication_PK': random.integers(1, 5, rows),
+                       'PatientId': random.integers(1, 3, rows),
+                       'Medication_Given_RXCUI_Code': random.integers(100, 102, rows),
+                       'Medication_Given_Description': random.choice(['Aspirin', 'Oxygen'], rows),
+                       'FRDPersonnelID': random.choice(['g1', 'g2'], rows),
+                       'Medication_Administered_Date_Time': '2020-01-01 10:00'})
+    df.loc[:9, ['Medication_Given_Description', 'Medication_Administered_Date_Time']] = None
+    return df
+
+
+@pytest.mark.parametrize('partitions', [1, 3])
+@pytest.mark.parametrize('bits', [64, 128])
+@pytest.mark.parametrize('suffix', ['.parquet', '.csv'])
+def test_dedup_matches_drop_duplicates(tmp_path, partitions, bits, suffix):
+    source = tmp_path.joinpath('source' + suffix)
+    if suffix == '.csv':
+        _frame().to_csv(source, index=False)
+        df = pd.read_csv(source)
+    else:
+        _frame().to_parquet(source, index=False)
+        df = pd.read_parquet(source)
+
+    out_path = tmp_path.joinpath('dedup.parquet')
+    result = dedup_table(source, out_path, chunk_size=7, partitions=partitions, bits=bits)
+
+    expected = df.drop_duplicates().reset_index(drop=True)
+    pd.testing.assert_frame_equal(pd.read_parquet(out_path), expected)
+
+    copies = df.groupby(list(df.columns), dropna=False).size()
+    assert result['rows'] == len(df)
+    assert result['unique_rows'] == len(expected)
+    assert result['duplicates'] == int(df.duplicated().sum())
+    assert result['duplicated_rows'] == int((copies > 1).sum())
+    assert result['max_copies'] == int(copies.max())
+    assert [path.name for path in tmp_path.iterdir() if path.name.endswith('.tmp')] == []
+
+
+@pytest.mark.parametrize('partitions', [1, 2])
+@pytest.mark.parametrize('suffix', ['.parquet', '.csv'])
+def test_dedup_registered_table_with_null_first_chunk(tmp_path, partitions, suffix):
+    csv_path = tmp_path.joinpath('medications.csv')
+    _medications().to_csv(csv_path, index=False)
+    df = schema.read_csv(csv_path, table='medications')
+
+    source = csv_path
+    if suffix == '.parquet':
+        source = tmp_path.joinpath('medications.parquet')
+        df.to_parquet(source, index=False)
+
+    out_path = tmp_path.joinpath('dedup.parquet')
+    dedup_table(source, out_path, table='medications', chunk_size=5, partitions=partitions)
+
+    pd.testing.assert_frame_equal(schema.read_parquet(out_path, table='medications'),
+                                  df.drop_duplicates().reset_index(drop=True), check_categorical=False)
+
+
+def test_dedup_removes_the_temporary_file_on_error(tmp_path):
+    folder = tmp_path.joinpath('source')
+    folder.mkdir()
+    pd.DataFrame({'a': [1, 1]}).to_parquet(folder.joinpath('part-0.parquet'))
+    pd.DataFrame({'b': [1, 1]}).to_parquet(folder.joinpath('part-1.parquet'))
+
+    with pytest.raises(KeyError):
+        dedup_table(folder, tmp_path.joinpath('dedup.parquet'))
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['source']
+
+
+@pytest.mark.parametrize('partitions', [1, 2])
+def test_dedup_numeric_looking_text_across_chunks(tmp_path, partitions):
+    # UnitId is a number in the first chunk and text in the second one
+    source = tmp_path.joinpath('units.csv')
+    pd.DataFrame({'UnitId': ['401'] * 5 + ['401', 'M401', '408', 'M401', '401'],
+                  'Shift': ['A'] * 10}).to_csv(source, index=False)
+    df = pd.read_csv(source)
+
+    out_path = tmp_path.joinpath('dedup.parquet')
+    result = dedup_table(source, out_path, chunk_size=5, partitions=partitions)
+
+    assert result['unique_rows'] == len(df.drop_duplicates()) == 3
+    pd.testing.assert_frame_equal(pd.read_parquet(out_path), df.drop_duplicates().reset_index(drop=True))
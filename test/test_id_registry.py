@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+from src.d00_utils import id_registry
+from src.d00_utils import schema
+from conftest import raw_patients
+
+
+def test_codes_are_dense_stable_and_persisted(tmp_path):
+    path = tmp_path.joinpath('ids-FRDPersonnelID.csv')
+    registry = id_registry.IdRegistry(path=path)
+
+    codes = registry.encode(['a1-guid', ' A1-GUID', None, 'b2-guid', np.nan, 'a1-guid'])
+    assert codes.dtype == np.int32
+    assert codes.tolist() == [0, 0, -1, 1, -1, 0]
+    assert registry.decode(codes).tolist() == ['A1-GUID', 'A1-GUID', None, 'B2-GUID', None, 'A1-GUID']
+    assert registry.encode(['c3-guid'], add=False).tolist() == [-1]
+
+    categorical = pd.Categorical(['c3-guid', None, 'a1-guid', 'c3-guid'])
+    assert registry.encode(categorical).tolist() == [2, -1, 0, 2]
+
+    # The GUIDs of a frame are normalized on a copy
+    ids = pd.Series(['c3-guid', ' b2-guid'], dtype=object)
+    assert registry.encode(ids).tolist() == [2, 1]
+    assert ids.tolist() == ['c3-guid', ' b2-guid']
+    ids = ids.astype('category')
+    assert registry.encode(ids).tolist() == [2, 1]
+    assert ids.cat.categories.tolist() == [' b2-guid', 'c3-guid']
+    registry.save()
+
+    # A new process reads the same codes and appends the new GUIDs
+    reloaded = id_registry.IdRegistry(path=path)
+    assert reloaded.values.tolist() == ['A1-GUID', 'B2-GUID', 'C3-GUID']
+    assert reloaded.encode(['d4-guid', 'b2-guid']).tolist() == [3, 1]
+    reloaded.save()
+    assert id_registry.IdRegistry(path=path).values.tolist() == ['A1-GUID', 'B2-GUID', 'C3-GUID', 'D4-GUID']
+    assert len(path.read_text().splitlines()) == 5
+
+
+def test_composite_keys_round_trip():
+    patients = np.array([1, 2**31 - 1, 123456789, 7])
+    providers = np.array([0, 5, 2**31 - 1, id_registry.NULL_CODE], dtype=np.int32)
+
+    keys = id_registry.composite_key(patients, providers)
+    assert keys.dtype == np.int64 and len(set(keys)) == 4
+    split_patients, split_providers = id_registry.split_composite_key(keys)
+    assert split_patients.tolist() == patients.tolist()
+    assert split_providers.tolist() == providers.tolist()
+
+
+def test_loaders_intern_and_decode_the_provider_ids(tmp_path, registry):
+    df = raw_patients(rows=100)
+    path = tmp_path.joinpath('patients.csv')
+    df.to_csv(path, index=False)
+
+    interned = schema.read_csv(path, table='patients', intern_ids=True)
+    assert interned['FRDPersonnelID'].dtype == np.int32
+    assert registry.path.exists()
+
+    # The same GUID has the same code in every table
+    providers = pd.DataFrame({'FRDPersonnelID': df['FRDPersonnelID'].str.upper().unique()})
+    assert id_registry.intern_ids(providers)['FRDPersonnelID'].tolist() == \
+        pd.unique(interned['FRDPersonnelID']).tolist()
+
+    decoded = id_registry.decode_ids(interned)
+    assert decoded['FRDPersonnelID'].tolist() == df['FRDPersonnelID'].str.upper().tolist()
+    pd.testing.assert_frame_equal(decoded.drop(columns='FRDPersonnelID'),
+                                  schema.read_csv(path, table='patients').drop(columns='FRDPersonnelID'))
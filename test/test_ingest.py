@@ -0,0 +1,263 @@
+import os
+from unittest.mock import ANY
+
+import boto3
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from moto import mock_s3
+
+from src.d01_data import checksum
+from src.d01_data import ingest
+from src.d01_data import remote_parquet
+from conftest import raw_patients
+
+BUCKET = 'ems-bucket'
+
+
+@pytest.fixture
+def s3(tmp_path, monkeypatch):
+    """
+    Project root in the test folder with a configuration file pointing the ingest module at
+    an in-process S3 stand-in (moto). Returns the client of the stand-in.
+    """
+    # Recent botocore versions send the parts with a trailing checksum (aws-chunked), which
+    # older moto versions hash as part of the content: only send checksums when required
+    for variable, value in [('AWS_ACCESS_KEY_ID', 'test'), ('AWS_SECRET_ACCESS_KEY', 'test'),
+                            ('AWS_DEFAULT_REGION', 'us-east-1'),
+                            ('AWS_REQUEST_CHECKSUM_CALCULATION', 'when_required')]:
+        monkeypatch.setenv(variable, value)
+
+    tmp_path.joinpath('configs').mkdir()
+    tmp_path.joinpath('configs', 'conf_local.ini').write_text(
+        '[AWS_SESSION]\nACCESS_KEY_ID = test\nSECRET_ACCESS_KEY = test\nREGION_NAME = us-east-1\n\n'
+        '[s3]\nPRI_BUCKET_NAME = {}\n'.format(BUCKET))
+    monkeypatch.setattr(ingest, '_project_root', tmp_path)
+
+    with mock_s3():
+        ingest._reset_remote_state()
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+    ingest._reset_remote_state()
+
+
+def _local_file(sub_folder, name, content):
+    path = ingest._local_folder_path(sub_folder).joinpath(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return path
+
+
+def _count_reads(monkeypatch):
+    """
+    Count the bytes read from the local data files.
+    """
+    reads = {'bytes': 0}
+    real_open = open
+
+    class _File:
+        def __init__(self, file):
+            self.__file = file
+
+        def read(self, size=-1):
+            data = self.__file.read(size)
+            reads['bytes'] += len(data)
+            return data
+
+        def __getattr__(self, name):
+            return getattr(self.__file, name)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            self.__file.close()
+
+    def _open(file, mode='r', *args, **kwargs):
+        handle = real_open(file, mode, *args, **kwargs)
+        return _File(handle) if 'b' in mode and str(file).endswith('.csv') else handle
+
+    monkeypatch.setattr('builtins.open', _open)
+    return reads
+
+
+@pytest.mark.parametrize('size', [1000, 6 * 2**20 + 123])
+def test_incremental_sync_upload_reads_each_file_once(s3, monkeypatch, size):
+    path = _local_file('02_intermediate', 'patients.csv', os.urandom(size))
+    sync = ingest.ProjectSync('02_intermediate', multipart_chunksize=5 * 2**20, progress=False, client=s3)
+
+    reads = _count_reads(monkeypatch)
+    result = sync.remote_upload(incremental=True)
+    assert result['transferred'] == ['02_intermediate/patients.csv'] and result['failed'] == {}
+    assert reads['bytes'] == size
+
+    # The ETag recorded for the file is the one S3 reports, the next sync skips it
+    etag = s3.head_object(Bucket=BUCKET, Key='02_intermediate/patients.csv')['ETag'].strip('"')
+    assert ('-' in etag) == (size > 5 * 2**20)
+    assert checksum.upload_etag(path, 5 * 2**20, 5 * 2**20) == etag
+
+    reads['bytes'] = 0
+    assert sync.remote_upload(incremental=True)['skipped'] == ['02_intermediate/patients.csv']
+    assert reads['bytes'] == 0
+
+
+def test_incremental_upload_replaces_a_changed_file(s3, monkeypatch):
+    _local_file('02_intermediate', 'patients.csv', b'a,b\n1,2\n')
+    ingest.ProjectIngest('02_intermediate', 'patients.csv').remote_upload(incremental=True)
+
+    path = _local_file('02_intermediate', 'patients.csv', b'a,b\n1,3\n')
+    reads = _count_reads(monkeypatch)
+    ingest.ProjectIngest('02_intermediate', 'patients.csv').remote_upload(incremental=True)
+
+    # Same size: hashed once to compare with S3, then read once by the upload
+    assert reads['bytes'] == 2 * path.stat().st_size
+    body = s3.get_object(Bucket=BUCKET, Key='02_intermediate/patients.csv')['Body'].read()
+    assert body == b'a,b\n1,3\n'
+
+
+def test_folder_sync_round_trip_with_one_pooled_client(s3):
+    files = {'patients.csv': os.urandom(6 * 2**20 + 7), 'procedures.parquet': b'PAR1',
+             'drops/20210301-medications.csv': b'a,b\n1,2\n'}
+    for name, content in files.items():
+        _local_file('02_intermediate', name, content)
+    _local_file('02_intermediate', '.cache/q4.parquet', b'cache')
+    _local_file('02_intermediate', 'notes.md', b'not a data file')
+
+    progress = list()
+    sync = ingest.ProjectSync('02_intermediate', max_workers=4, multipart_chunksize=5 * 2**20,
+                              progress=lambda key, status, *counts: progress.append((key, status)))
+    keys = sorted('02_intermediate/' + name for name in files)
+    assert sync.remote_upload() == {'transferred': keys, 'skipped': [], 'failed': {}}
+    assert sorted(progress) == [(key, 'OK') for key in keys]
+    assert sync.remote_upload()['skipped'] == keys
+
+    # Every transfer goes through the same client, sized for the worker threads
+    assert ingest._get_s3_client() is ingest._get_s3_client()
+    assert ingest._get_s3_client().meta.config.max_pool_connections == ingest._MAX_POOL_CONNECTIONS
+
+    folder = ingest._local_folder_path('02_intermediate')
+    for name in files:
+        folder.joinpath(name).unlink()
+    assert sync.remote_download()['transferred'] == keys
+    for name, content in files.items():
+        assert folder.joinpath(name).read_bytes() == content
+
+
+def test_folder_sync_records_a_failed_object_and_goes_on(s3, monkeypatch):
+    for name in ('a.csv', 'b.csv', 'c.csv'):
+        s3.put_object(Bucket=BUCKET, Key='01_raw/' + name, Body=name.encode())
+
+    download_verified = ingest._download_verified
+
+    def _fail_b(key, *args, **kwargs):
+        if key == '01_raw/b.csv':
+            raise IOError('connection reset')
+        return download_verified(key, *args, **kwargs)
+
+    monkeypatch.setattr(ingest, '_download_verified', _fail_b)
+    result = ingest.ProjectSync('01_raw', progress=False).remote_download(incremental=True)
+    assert result['transferred'] == ['01_raw/a.csv', '01_raw/c.csv']
+    assert result['failed'] == {'01_raw/b.csv': 'connection reset'}
+    assert not ingest._local_folder_path('01_raw').joinpath('b.csv').exists()
+
+    # The next sync only transfers the failed object
+    monkeypatch.setattr(ingest, '_download_verified', download_verified)
+    result = ingest.ProjectSync('01_raw', progress=False).remote_download(incremental=True)
+    assert result == {'transferred': ['01_raw/b.csv'], 'skipped': ['01_raw/a.csv', '01_raw/c.csv'],
+                      'failed': {}}
+
+
+def _count_calls(client, operation):
+    calls = list()
+    client.meta.events.register('provide-client-params.s3.' + operation,
+                                lambda params, **kwargs: calls.append(dict(params)))
+    return calls
+
+
+def test_listing_is_paginated_and_cached_in_the_manifest(s3):
+    keys = ['01_raw/{:04d}-ems-raw.csv'.format(number) for number in range(1005)]
+    for key in keys:
+        s3.put_object(Bucket=BUCKET, Key=key, Body=b'x')
+
+    listings = _count_calls(ingest._get_s3_client(), 'ListObjectsV2')
+    project = ingest.ProjectIngest('01_raw', '0001-ems-raw.csv')
+    assert project.remote_object_list() == keys
+    assert len(listings) == 2
+
+    # The manifest answers without listing the folder again
+    assert project.remote_object_list(refresh='none') == keys
+    assert project.remote_object_info() == dict(size=1, etag=s3.head_object(
+        Bucket=BUCKET, Key='01_raw/0001-ems-raw.csv')['ETag'].strip('"'), last_modified=ANY)
+    assert len(listings) == 2
+
+    # An incremental refresh only lists the keys after the last known one
+    s3.put_object(Bucket=BUCKET, Key='01_raw/9999-ems-raw.csv', Body=b'new drop')
+    s3.delete_object(Bucket=BUCKET, Key=keys[0])
+    assert project.remote_object_list(refresh='incremental') == keys + ['01_raw/9999-ems-raw.csv']
+    assert len(listings) == 3 and listings[-1]['StartAfter'] == keys[-1]
+
+    # A full refresh drops the deleted key
+    assert project.remote_object_list() == keys[1:] + ['01_raw/9999-ems-raw.csv']
+    assert ingest.ProjectIngest('01_raw', '0000-ems-raw.csv').remote_object_info(refresh='none') is None
+
+
+def test_batch_diff_and_upload_list_each_folder_once(s3):
+    names = ['{:02d}-patients.parquet'.format(number) for number in range(6)]
+    for name in names:
+        _local_file('02_intermediate', name, name.encode())
+    _local_file('03_processed', 'tenure.csv', b'a,b\n1,2\n')
+    s3.put_object(Bucket=BUCKET, Key='02_intermediate/' + names[0], Body=names[0].encode())
+    s3.put_object(Bucket=BUCKET, Key='02_intermediate/' + names[1], Body=b'older content')
+
+    keys = ['02_intermediate/' + name for name in names] + ['03_processed/tenure.csv']
+    listings = _count_calls(ingest._get_s3_client(), 'ListObjectsV2')
+    heads = _count_calls(ingest._get_s3_client(), 'HeadObject')
+
+    assert ingest.remote_batch_diff(keys) == {'missing': keys[2:], 'changed': keys[1:2],
+                                              'current': keys[:1]}
+    assert len(listings) == 2 and heads == []
+
+    result = ingest.remote_batch_upload(keys, progress=False)
+    assert result == {'transferred': keys[1:], 'skipped': keys[:1], 'failed': {}}
+    # One listing per folder to diff the batch and one to verify the uploads
+    assert len(listings) == 2 + 4 and heads == []
+
+    assert ingest.remote_batch_diff(keys)['current'] == keys
+    with pytest.raises(TypeError):
+        ingest.remote_batch_diff(['07_other/tenure.csv'])
+
+
+def test_remote_parquet_reads_the_selected_columns_and_row_groups(s3):
+    df = raw_patients(rows=100000, months=12).sort_values('DispatchTime', ignore_index=True)
+    path = _local_file('03_processed', 'patients.parquet', b'')
+    df.to_parquet(path, index=False, row_group_size=10000)
+    s3.upload_file(str(path), BUCKET, '03_processed/patients.parquet')
+    path.unlink()
+
+    columns = ['PatientId', 'FireStation', 'DispatchTime']
+    filters = [('DispatchTime', '>=', '2020-03-01'), ('DispatchTime', '<', '2020-05-01'),
+               ('FireStation', 'in', [401, 411])]
+    expected = df.loc[(df['DispatchTime'] >= '2020-03-01') & (df['DispatchTime'] < '2020-05-01') &
+                      df['FireStation'].isin([401, 411]), columns].reset_index(drop=True)
+
+    project = ingest.ProjectIngest('03_processed', 'patients.parquet')
+    pd.testing.assert_frame_equal(project.remote_read_parquet(columns=columns, filters=filters), expected)
+    assert project.remote_read_parquet(filters=[('FireStation', '==', 999)]).empty
+
+    # Only the footer and the column chunks of the matching row groups are fetched
+    size = s3.head_object(Bucket=BUCKET, Key='03_processed/patients.parquet')['ContentLength']
+    metadata = pq.ParquetFile(remote_parquet.S3RangeFile(s3, BUCKET, '03_processed/patients.parquet',
+                                                         size)).metadata
+    groups = remote_parquet._matching_row_groups(metadata, filters)
+    chunks = sum(metadata.row_group(group).column(index).total_compressed_size
+                 for group in groups for index in range(metadata.num_columns)
+                 if metadata.schema.column(index).path in columns)
+    assert 0 < len(groups) < metadata.num_row_groups / 2
+
+    source = remote_parquet.S3RangeFile(s3, BUCKET, '03_processed/patients.parquet', size)
+    remote_parquet.read_parquet(source, columns=columns, filters=filters)
+    assert source.bytes_fetched <= chunks + remote_parquet.FOOTER_PREFETCH < size / 2
+
+    with pytest.raises(ValueError):
+        project.remote_read_parquet(filters=[('FireStation', 'like', 401)])
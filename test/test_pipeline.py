@@ -0,0 +1,96 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.d00_utils import id_registry
+from src.d00_utils import pipeline
+from src.d02_intermediate import create_int_patient_data
+from src.d03_processing import create_master_table
+from src.d03_processing import create_tenure_data
+from src.d07_visualization import q4_visualization_module as q4_vis
+from src.d07_visualization import render_figures
+from conftest import raw_patients
+
+
+def _events(patients, prefix, seed=0):
+    random = np.random.default_rng(seed)
+    rows = random.integers(0, len(patients), len(patients))
+    return pd.DataFrame({'Dim_{}_PK'.format(prefix): np.arange(len(rows)) % 40,
+                         'PatientId': patients['PatientId'].values[rows],
+                         'Code': random.integers(1000, 1005, len(rows)),
+                         'Description': random.choice(['IV', 'ECG', 'O2'], len(rows)),
+                         'FRDPersonnelID': patients['FRDPersonnelID'].values[rows],
+                         'Time': patients['DispatchTime'].values[rows]})
+
+
+@pytest.fixture
+def data_folder(tmp_path, monkeypatch):
+    """
+    Project data folder with a small synthetic raw workbook. The stage modules are imported
+    here and run in forked worker processes, which see the test folder.
+    """
+    folder = tmp_path.joinpath('data')
+    for module in (pipeline, id_registry, create_int_patient_data, create_master_table, create_tenure_data):
+        monkeypatch.setattr(module, '_data_folder', folder)
+    monkeypatch.setattr(id_registry, '_registries', dict())
+    monkeypatch.setattr(render_figures, '_reporting_folder', folder.joinpath('06_reporting'))
+    monkeypatch.setattr(q4_vis, 'source_path', folder.joinpath('02_intermediate', 'dfPatients_dedup.csv'))
+    monkeypatch.setattr(q4_vis, '_df_q4', None)
+    monkeypatch.setattr(q4_vis, '_count_cube', None)
+
+    # One figure of each kind keeps the figures stage short
+    figures = [figure for figure in render_figures.figure_set()
+               if figure['name'] in ('violin-v0-withtreated', 'frequency-overall', 'sunburst-0')]
+    monkeypatch.setattr(render_figures, 'figure_set', lambda: figures)
+
+    random = np.random.default_rng(0)
+    patients = raw_patients(rows=600, months=12)
+    patients['PatientOutcome'] = random.choice(q4_vis.cat_order_with_treated, len(patients))
+    procedures = _events(patients, 'Procedure').rename(columns={
+        'Code': 'Procedure_Performed_Code', 'Description': 'Procedure_Performed_Description',
+        'Time': 'Procedure_Performed_Date_Time'})
+    medications = _events(patients, 'Medication', seed=1).rename(columns={
+        'Code': 'Medication_Given_RXCUI_Code', 'Description': 'Medication_Given_Description',
+        'Time': 'Medication_Administered_Date_Time'})
+
+    xlsx_path = folder.joinpath(pipeline.RAW_WORKBOOK)
+    xlsx_path.parent.mkdir(parents=True)
+    with pd.ExcelWriter(xlsx_path, engine='openpyxl') as writer:
+        patients.to_excel(writer, sheet_name='Patients', index=False)
+        procedures.to_excel(writer, sheet_name='Procedures', index=False)
+        medications.to_excel(writer, sheet_name='Medications', index=False)
+    return folder
+
+
+def test_pipeline_runs_every_stage_then_skips_them(data_folder):
+    results = pipeline.run_pipeline(max_workers=2)
+    assert {name: result['status'] for name, result in results.items()} == \
+        {stage['name']: 'ran' for stage in pipeline.STAGES}, results
+    assert results['patients_intermediate']['rows_out'] > 0
+    assert all(data_folder.joinpath(path).exists() for stage in pipeline.STAGES for path in stage['outputs'])
+
+    results = pipeline.run_pipeline(max_workers=2)
+    assert {result['status'] for result in results.values()} == {'skipped'}
+
+
+def test_failed_figures_fail_the_stage_until_they_render(data_folder, monkeypatch):
+    first = pipeline.run_pipeline(max_workers=2)
+    assert first['figures']['status'] == 'ran'
+
+    # The sunburst is drawn again and fails: the stage is not recorded as done and runs again
+    data_folder.joinpath('06_reporting', 'q4-sunburst-0.html').unlink()
+    sunburst_figure = q4_vis.sunburst_figure
+    monkeypatch.setattr(q4_vis, 'sunburst_figure', None)
+    failed = pipeline.run_pipeline(['figures'], force=True)
+    assert failed['figures']['status'] == 'failed'
+    assert 'sunburst-0' in failed['figures']['error']
+
+    state = json.loads(data_folder.joinpath(pipeline.STATE_FILE_NAME).read_text())
+    assert 'key' not in state['stages']['figures']
+
+    monkeypatch.setattr(q4_vis, 'sunburst_figure', sunburst_figure)
+    again = pipeline.run_pipeline(['figures'])
+    assert again['figures']['status'] == 'ran'
+    assert data_folder.joinpath('06_reporting', 'q4-sunburst-0.html').exists()
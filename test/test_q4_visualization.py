@@ -0,0 +1,275 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.d07_visualization import q4_visualization_module as q4_vis
+from conftest import raw_patients
+
+# The outcomes of the sunburst subsets
+SUBSET_OUTCOMES = {700: ['Canceled (On Scene, No Patient Contact)', 'No Patient Found',
+                         'Standby (No Services Performed)', 'EMS Assist (Other Agency)'],
+                   1400: ['Patient Refusal  (AMA)', 'No Treatment/Transport Required',
+                          'Canceled (Prior to Arrival)']}
+
+
+def _intermediate(rows=400, seed=0):
+    # Patients intermediate fields read by the module, with padded shift
+    # and outcome text, null outcomes and duplicated records
+    df = raw_patients(rows=rows, seed=seed)
+    df['PatientOutcomeCode'] = df['PatientOutcome'].map(
+        {outcome: code for code, outcome in enumerate(sorted(df['PatientOutcome'].unique()))})
+    df.loc[::7, 'Shift'] = df.loc[::7, 'Shift'] + '  '
+    df.loc[::11, 'PatientOutcome'] = ' ' + df.loc[::11, 'PatientOutcome']
+    df.loc[[3, 5], 'PatientOutcome'] = None
+    df = pd.concat([df, df.iloc[:20]], ignore_index=True)
+    return df[q4_vis.cols + ['Battalion']]
+
+
+def _notebook_df_q4(path):
+    # The conditioning the module did when it was imported
+    pat_i = pd.read_csv(path)
+    pat_i.drop(index=pat_i[pat_i['PatientOutcome'].isnull()].index, inplace=True)
+    df_q4 = pat_i[q4_vis.cols].copy(deep=True)
+    df_q4.drop_duplicates(inplace=True)
+    df_q4 = df_q4.astype(dtype={'Shift': 'str', 'PatientOutcome': 'str', 'PatientId': 'str'})
+    df_q4['Shift'] = df_q4['Shift'].apply(lambda x: x.strip())
+    df_q4['PatientOutcome'] = df_q4['PatientOutcome'].apply(lambda x: x.strip())
+    return df_q4
+
+
+def _rows(df):
+    # Records as sorted tuples of text values, whatever the dtypes
+    return sorted(zip(*[df[column].astype(object).astype(str).str.replace(r'\.0$', '', regex=True)
+                        for column in q4_vis.cols]))
+
+
+def _every_outcome(csv_path):
+    # Records of every outcome category, as the violin plots expect
+    df = _intermediate(rows=800)
+    df['PatientOutcome'] = np.random.default_rng(0).choice(q4_vis.cat_order_with_treated, len(df))
+    df.to_csv(csv_path, index=False)
+
+
+@pytest.fixture
+def patients_csv(tmp_path, registry, monkeypatch):
+    """
+    Patients intermediate csv the visualization module reads.
+    """
+    csv_path = tmp_path.joinpath('02_intermediate', 'dfPatients_dedup.csv')
+    csv_path.parent.mkdir()
+    _intermediate().to_csv(csv_path, index=False)
+    monkeypatch.setattr(q4_vis, 'source_path', csv_path)
+    monkeypatch.setattr(q4_vis, '_df_q4', None)
+    monkeypatch.setattr(q4_vis, '_count_cube', None)
+    monkeypatch.setattr(q4_vis, '_violin_frames', dict())
+    return csv_path
+
+
+def test_module_is_imported_without_the_data(tmp_path):
+    # Imported from another folder without a patients file
+    code = 'import sys; sys.path.insert(0, {!r}); ' \
+           'from src.d07_visualization import q4_visualization_module as q4_vis; ' \
+           'assert q4_vis._df_q4 is None'.format(str(Path(__file__).resolve().parents[1]))
+    subprocess.run([sys.executable, '-c', code], cwd=tmp_path, check=True)
+
+
+def test_df_q4_matches_the_notebook_conditioning(patients_csv):
+    df_q4 = q4_vis.load_df_q4()
+    assert list(df_q4.columns) == q4_vis.cols
+    assert df_q4['Shift'].cat.categories.tolist() == ['A - Shift', 'B - Shift', 'C - Shift']
+    assert _rows(df_q4) == _rows(_notebook_df_q4(patients_csv))
+
+    # Built once per process, and reached as the df_q4 attribute
+    assert q4_vis.load_df_q4() is df_q4
+    assert q4_vis.df_q4 is df_q4
+
+
+def test_cache_is_reused_until_the_source_changes(patients_csv, monkeypatch):
+    cache = patients_csv.parent.joinpath('.cache', 'dfPatients_dedup.q4.parquet')
+    first = q4_vis.load_df_q4()
+    assert cache.exists()
+
+    prepared = list()
+    prepare = q4_vis._prepare
+    monkeypatch.setattr(q4_vis, '_prepare', lambda path: prepared.append(path) or prepare(path))
+
+    cached = q4_vis.load_df_q4(patients_csv)
+    assert prepared == []
+    assert _rows(cached) == _rows(first)
+    assert cached['FireStation'].dtype == 'category'
+
+    # Touched with the same content: the hash keeps the cache
+    patients_csv.write_bytes(patients_csv.read_bytes())
+    q4_vis.load_df_q4(patients_csv)
+    assert prepared == []
+
+    # A new extract is prepared again, refresh and use_cache=False skip the cache
+    _intermediate(rows=300, seed=1).to_csv(patients_csv, index=False)
+    df_q4 = q4_vis.load_df_q4(patients_csv)
+    assert len(prepared) == 1
+    assert _rows(df_q4) == _rows(_notebook_df_q4(patients_csv))
+    q4_vis.load_df_q4(patients_csv)
+    assert len(prepared) == 1
+    q4_vis.load_df_q4(refresh=True)
+    q4_vis.load_df_q4(patients_csv, use_cache=False)
+    assert len(prepared) == 3
+
+def test_missing_source_is_reported(tmp_path):
+    with pytest.raises(FileNotFoundError, match='notebook'):
+        q4_vis.load_df_q4(tmp_path.joinpath('dfPatients_dedup.csv'))
+
+
+def test_stripped_categories_are_merged():
+    series = pd.Series(pd.Categorical(['A ', 'A', None, ' B', 'B', 'A ']), name='Shift')
+    stripped = q4_vis._strip_categories(series)
+    assert sorted(stripped.cat.categories) == ['A', 'B']
+    assert stripped.astype(object).where(stripped.notna(), None).tolist() == \
+        ['A', 'A', None, 'B', 'B', 'A']
+    assert np.array_equal(stripped.index, series.index) and stripped.name == 'Shift'
+
+
+def test_yearly_subsets_list_every_year_of_the_data(patients_csv):
+    df = _intermediate()
+    df.loc[::3, 'DispatchTime'] -= pd.Timedelta(days=366)
+    df.to_csv(patients_csv, index=False)
+
+    df_q4 = _notebook_df_q4(patients_csv)
+    times = pd.to_datetime(df_q4['DispatchTime'])
+    years = times.groupby(times.dt.year).agg(['size', 'min', 'max'])
+
+    subsets = q4_vis.q4_yearly_subsets()
+    assert subsets.index.tolist() == [str(year) for year in years.index] and len(years) > 1
+    assert subsets['Record Count'].tolist() == ['{:,}'.format(count) for count in years['size']]
+    assert subsets['Start Date-Time'].tolist() == years['min'].tolist()
+    assert subsets['End Date-Time'].tolist() == years['max'].tolist()
+
+
+def test_count_cube_is_built_once_per_data_version(patients_csv, monkeypatch):
+    cube = q4_vis.load_count_cube()
+    assert q4_vis.load_count_cube() is cube
+    assert patients_csv.parent.joinpath('.cache', 'dfPatients_dedup.q4cube.parquet').exists()
+
+    # The cube counts are the record counts of df_q4
+    df_q4 = q4_vis.load_df_q4()
+    by = ['FireStation', 'Shift', 'PatientOutcome']
+    counts = cube.counts(by).astype({'FireStation': int}).set_index(by)['Count']
+    expected = df_q4.astype({'FireStation': int}).groupby(by, observed=True).size()
+    assert counts.to_dict() == expected[expected > 0].to_dict()
+    groups = cube.counts(['OutcomeGroup']).set_index('OutcomeGroup')['Count']
+    assert groups.to_dict() == df_q4['PatientOutcome'].astype(str).map(q4_vis.outcome_groups).value_counts().to_dict()
+
+    # Read back from the cache file until the source changes
+    prepared = list()
+    prepare = q4_vis._prepare
+    monkeypatch.setattr(q4_vis, '_prepare', lambda path: prepared.append(path) or prepare(path))
+    cached = q4_vis.load_count_cube(patients_csv)
+    assert prepared == []
+    assert cached.cells['Count'].tolist() == cube.cells['Count'].tolist()
+
+    _intermediate(rows=300, seed=1).to_csv(patients_csv, index=False)
+    assert q4_vis.load_count_cube(patients_csv).cells['Count'].sum() == \
+        len(_notebook_df_q4(patients_csv))
+    assert len(prepared) == 1
+
+
+def _notebook_violin_frame(df_q4, subset):
+    # The conditioning of the violinplot branches before the frames were cached
+    spec = q4_vis.violin_subsets[subset]
+    df = df_q4.copy(deep=True).astype('category')
+    if spec['grouped']:
+        df['PatientOutcome'] = df['PatientOutcome'].astype(str).replace(q4_vis.outcome_groups)
+        df = df.astype('category')
+    if spec['exclude'] is not None:
+        df = df[df['PatientOutcome'] != spec['exclude']].copy()
+    for column in ('FireStation', 'Shift', 'PatientOutcome'):
+        df[column] = df[column].cat.remove_unused_categories()
+    df['PatientOutcome'] = df['PatientOutcome'].cat.reorder_categories(spec['order'])
+    return df
+
+
+def test_violin_frames_match_the_replace_recoding(patients_csv, monkeypatch):
+    import matplotlib.pyplot as plt
+
+    _every_outcome(patients_csv)
+
+    loads = list()
+    load_df_q4 = q4_vis.load_df_q4
+    monkeypatch.setattr(q4_vis, 'load_df_q4', lambda: loads.append(1) or load_df_q4())
+
+    df_q4 = load_df_q4()
+    for subset in q4_vis.violin_subsets:
+        frame = q4_vis._violin_frame(subset)
+        expected = _notebook_violin_frame(df_q4, subset)
+        assert list(frame.columns) == ['FireStation', 'Shift', 'PatientOutcome']
+        assert frame['PatientOutcome'].cat.categories.tolist() == expected['PatientOutcome'].cat.categories.tolist()
+        assert frame['FireStation'].cat.categories.tolist() == expected['FireStation'].cat.categories.tolist()
+        assert frame.index.equals(expected.index)
+        for column in frame.columns:
+            assert frame[column].astype(str).tolist() == expected[column].astype(str).tolist(), column
+
+    # Both versions of every subset reuse the four prepared frames
+    for subset in q4_vis.violin_subsets:
+        for version in (0, 1):
+            q4_vis.violinplot(version, subset)
+            plt.close('all')
+    assert len(loads) == 4
+
+    with pytest.raises(ValueError, match='Valid options'):
+        q4_vis._violin_frame('withoutDead')
+
+    # A new data frame clears the prepared frames
+    load_df_q4(refresh=True)
+    assert q4_vis._violin_frames == {}
+
+
+def _nodes(fig):
+    trace = fig.data[0]
+    colors = trace.marker.colors if trace.marker.colors is not None else [None] * len(trace.ids)
+    return {node: (parent, value, color)
+            for node, parent, value, color in zip(trace.ids, trace.parents, trace.values, colors)}
+
+
+@pytest.mark.parametrize('path_in, col_in, subset', [
+    (['FireStation', 'PatientOutcome', 'Shift'], 'FireStation', 0),
+    (['FireStation', 'PatientOutcome', 'Shift'], 'FireStation', 1400),
+    (['Battalion', 'FireStation', 'Shift', 'PatientOutcome'], 'Battalion', 0),
+    (['FireStation', 'Shift'], 'PatientOutcome', 700)])
+def test_sunburst_matches_the_figure_of_the_records(patients_csv, path_in, col_in, subset):
+    import plotly.express as px
+
+    _every_outcome(patients_csv)
+
+    # The records plotly aggregated before the counts were passed as values
+    records = q4_vis._plain(q4_vis._load_prepared(patients_csv))
+    if subset:
+        records = records[records['PatientOutcome'].isin(SUBSET_OUTCOMES[subset])]
+    expected = px.sunburst(data_frame=records, path=path_in, color=col_in)
+
+    fig = q4_vis.sunburst_figure(path_in, col_in, subset)
+    nodes, expected_nodes = _nodes(fig), _nodes(expected)
+    assert sorted(nodes) == sorted(expected_nodes)
+    for node, (parent, value, color) in expected_nodes.items():
+        assert nodes[node][:2] == (parent, value), node
+        if isinstance(color, float):
+            assert nodes[node][2] == pytest.approx(color), node
+
+    # One entry per tree node instead of one row per record
+    assert len(fig.data[0].ids) < len(records)
+    assert fig.data[0].values[fig.data[0].parents == ''].sum() == len(records)
+
+
+def test_sunburst_html_is_bounded(patients_csv, tmp_path):
+    path_in = ['FireStation', 'PatientOutcome', 'Shift']
+    html_path = tmp_path.joinpath('06_reporting', 'sunburst.html')
+
+    with pytest.raises(ValueError, match='limit'):
+        q4_vis.sunburst_html(path_in, 'FireStation', 0, html_path, max_mb=0.5)
+    assert not html_path.exists()
+
+    size_mb = q4_vis.sunburst_html(path_in, 'FireStation', 0, html_path, include_plotlyjs='cdn')
+    assert html_path.stat().st_size / 2**20 == pytest.approx(size_mb, rel=0.01)
+    assert size_mb < 0.5
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from src.d02_intermediate.create_int_patient_data import build_patients_intermediate
+from src.d07_visualization import q4_visualization_module as q4_vis
+from src.d07_visualization import render_figures
+from conftest import raw_patients
+
+NAMES = ['frequency-overall', 'sunburst-0']
+
+
+@pytest.fixture
+def patients_csv(tmp_path, registry, monkeypatch):
+    """
+    Patients intermediate csv the visualization module reads, built from synthetic records.
+    """
+    df = raw_patients(rows=600, months=12)
+    df['PatientOutcome'] = np.random.default_rng(0).choice(q4_vis.cat_order_with_treated, len(df))
+    df.to_parquet(tmp_path.joinpath('patients.parquet'), index=False)
+
+    out_path = tmp_path.joinpath('02_intermediate', 'dfPatients_dedup')
+    build_patients_intermediate(tmp_path.joinpath('patients.parquet'), out_path, csv=True)
+    monkeypatch.setattr(q4_vis, 'source_path', out_path.with_suffix('.csv'))
+    monkeypatch.setattr(q4_vis, '_df_q4', None)
+    monkeypatch.setattr(q4_vis, '_count_cube', None)
+    return out_path.with_suffix('.csv')
+
+
+def _statuses(results):
+    return {name: result['status'] for name, result in results.items()}
+
+
+def test_figures_are_rendered_again_when_their_options_change(patients_csv, tmp_path):
+    out_dir = tmp_path.joinpath('06_reporting')
+    render = lambda **kwargs: _statuses(render_figures.render_figures(out_dir, names=NAMES, max_workers=1,
+                                                                      **kwargs))
+
+    assert render(dpi=50) == {'frequency-overall': 'rendered', 'sunburst-0': 'rendered'}
+    assert out_dir.joinpath('q4-frequency-overall.png').exists()
+    assert out_dir.joinpath('q4-sunburst-0.html').exists()
+
+    assert render(dpi=50) == {'frequency-overall': 'skipped', 'sunburst-0': 'skipped'}
+    assert render(dpi=60) == {'frequency-overall': 'rendered', 'sunburst-0': 'skipped'}
+    assert render(dpi=60, html_max_mb=50) == {'frequency-overall': 'skipped', 'sunburst-0': 'rendered'}
+
+    # New source data renders every figure again
+    patients_csv.write_text(patients_csv.read_text() + patients_csv.read_text().split('\n', 1)[1])
+    assert render(dpi=60, html_max_mb=50) == {'frequency-overall': 'rendered', 'sunburst-0': 'rendered'}
+
+
+def test_a_failed_figure_is_reported_and_rendered_next_time(patients_csv, tmp_path, monkeypatch):
+    out_dir = tmp_path.joinpath('06_reporting')
+    sunburst_figure = q4_vis.sunburst_figure
+    monkeypatch.setattr(q4_vis, 'sunburst_figure', None)
+
+    results = render_figures.render_figures(out_dir, names=NAMES, max_workers=1)
+    assert _statuses(results) == {'frequency-overall': 'rendered', 'sunburst-0': 'failed'}
+    assert 'TypeError' in results['sunburst-0']['error']
+
+    monkeypatch.setattr(q4_vis, 'sunburst_figure', sunburst_figure)
+    results = render_figures.render_figures(out_dir, names=NAMES, max_workers=1)
+    assert _statuses(results) == {'frequency-overall': 'skipped', 'sunburst-0': 'rendered'}
@@ -0,0 +1,21 @@
+import pytest
+
+from src.d00_utils import startup_benchmark
+
+
+def test_boto3_is_only_imported_on_remote_use():
+    rows = {row['scenario']: row for row in startup_benchmark.startup_benchmark(repeat=2)}
+
+    assert list(rows) == list(startup_benchmark.SCENARIOS)
+    assert not rows['import src.d01_data.ingest']['boto3_loaded']
+    assert rows['ingest + remote use']['boto3_loaded']
+    assert all(row['min_ms'] <= row['median_ms'] for row in rows.values())
+
+
+def test_runs_that_disagree_are_reported(monkeypatch):
+    runs = iter([(0.1, False), (0.1, True)])
+    monkeypatch.setattr(startup_benchmark, 'SCENARIOS', {'import src': 'import src'})
+    monkeypatch.setattr(startup_benchmark, '_time_scenario', lambda code: next(runs))
+
+    with pytest.raises(RuntimeError, match='imported in 1 of them'):
+        startup_benchmark.startup_benchmark(repeat=2)
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.d00_utils import time_buckets
+
+BUCKETS = list(time_buckets.CALENDAR_BUCKETS) + time_buckets.CYCLIC_BUCKETS
+
+
+def _frame(rows=2000, seed=0):
+    # Unsorted timestamps over four years with a few nulls
+    random = np.random.default_rng(seed)
+    times = pd.Timestamp('2018-01-01') + pd.to_timedelta(random.integers(0, 4 * 365 * 24 * 60, rows), unit='min')
+    df = pd.DataFrame({'DispatchTime': times,
+                       'Shift': random.choice(['A - Shift', 'B - Shift', 'C - Shift'], rows),
+                       'FireStation': random.choice([401, 408, 411], rows)})
+    df.loc[::97, 'DispatchTime'] = pd.NaT
+    return df
+
+
+def _pandas_bucket(times, bucket):
+    if bucket == 'hour_of_day':
+        return times.dt.hour
+    if bucket == 'day_of_week':
+        return times.dt.dayofweek
+    return times.dt.to_period(time_buckets.CALENDAR_BUCKETS[bucket])
+
+
+def _pandas_summary(df, bucket, by=None):
+    df = df[df['DispatchTime'].notnull()]
+    keys = [df[key] for key in by or []] + [_pandas_bucket(df['DispatchTime'], bucket).rename(bucket)]
+    summary = df.groupby(keys)['DispatchTime'].agg(['size', 'min', 'max'])
+    summary.columns = ['Count', 'First', 'Last']
+    return summary
+
+
+@pytest.mark.parametrize('bucket', BUCKETS)
+def test_summary_matches_a_pandas_groupby(bucket):
+    df = _frame()
+    summary = time_buckets.time_bucket_summary(df, bucket)
+    expected = _pandas_summary(df, bucket)
+
+    assert summary.index.tolist() == expected.index.tolist()
+    assert summary['Count'].sum() == df['DispatchTime'].notnull().sum()
+    for column in ('Count', 'First', 'Last'):
+        assert summary[column].tolist() == expected[column].tolist(), column
+
+    by = time_buckets.time_bucket_summary(df, bucket, by=['FireStation', 'Shift'])
+    expected = _pandas_summary(df, bucket, by=['FireStation', 'Shift'])
+    assert by.index.names == ['FireStation', 'Shift', bucket]
+    assert by.index.tolist() == expected.index.tolist()
+    for column in ('Count', 'First', 'Last'):
+        assert by[column].tolist() == expected[column].tolist(), column
+
+
+def test_text_timestamps_and_new_years_are_summarized():
+    df = _frame(rows=500)
+    summary = time_buckets.time_bucket_summary(df, 'year')
+    assert [period.year for period in summary.index] == [2018, 2019, 2020, 2021]
+
+    # A later data drop adds a year, text timestamps are parsed
+    later = pd.concat([df, pd.DataFrame({'DispatchTime': [pd.Timestamp('2022-03-01 10:00')]})])
+    later['DispatchTime'] = later['DispatchTime'].astype(str).replace('NaT', '')
+    summary = time_buckets.time_bucket_summary(later, 'year')
+    assert [period.year for period in summary.index] == [2018, 2019, 2020, 2021, 2022]
+    assert summary.loc[pd.Period('2022', 'A'), 'Count'] == 1
+    assert summary['Count'].tolist() == \
+        _pandas_summary(later.assign(DispatchTime=pd.to_datetime(later['DispatchTime'])), 'year')['Count'].tolist()
+
+
+def test_bucket_labels_are_aligned_with_the_records():
+    df = _frame(rows=300)
+    labels = time_buckets.bucket_labels(df['DispatchTime'], 'year')
+    assert labels.index.equals(df.index)
+    assert labels.isnull().sum() == df['DispatchTime'].isnull().sum()
+    assert labels.dropna().astype(int).tolist() == df['DispatchTime'].dropna().dt.year.tolist()
+
+    with pytest.raises(ValueError, match='fortnight'):
+        time_buckets.bucket_codes(df['DispatchTime'], 'fortnight')
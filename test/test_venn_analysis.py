@@ -0,0 +1,160 @@
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.d06_reporting import VennAnalysisReport
+from src.d06_reporting.VennAnalysisReport import VennAnalysis
+
+
+def _ids(seed=0):
+    """
+    PatientId columns of the Patients, Procedures and Medications tables, with repeated
+    and null IDs and IDs missing from Patients.
+    """
+    random = np.random.default_rng(seed)
+    patients = pd.Series(random.integers(0, 3000, 4000), dtype=float)
+    procedures = pd.Series(random.integers(1000, 4000, 3000), dtype=float)
+    medications = pd.Series(random.integers(2000, 5000, 2000), dtype=float)
+    for ids in (patients, procedures, medications):
+        ids[::97] = np.nan
+    return patients, procedures, medications
+
+
+def _set_regions(*columns):
+    """
+    The region counts computed with Python sets, in bitmask order.
+    """
+    sets = [set(column.dropna()) for column in columns]
+    everything = set().union(*sets)
+    return [len({value for value in everything
+                 if all((value in sets[bit]) == bool(region >> bit & 1) for bit in range(len(sets)))})
+            for region in range(1, 2**len(sets))]
+
+
+def test_venn_table_matches_the_set_operations():
+    patients, procedures, medications = _ids()
+    a, b, c = (set(column.dropna()) for column in (patients, procedures, medications))
+    expected = [len(a - (b | c)), len(b - (a | c)), len((a & b) - c), len(c - (a | b)),
+                len((a & c) - b), len((b & c) - a), len(a & b & c)]
+
+    table = VennAnalysisReport.venn_analysis_table('PatientId', patients, procedures, medications)
+    assert table['Count'].tolist() == expected
+    assert table.index[0] == 'Patients that only exist in Patients'
+
+    missing = VennAnalysisReport.venn_analysis_table('PatientId', patients, procedures, medications,
+                                                     out_flag=False)
+    assert sorted(missing['Missing IDs']) == sorted((b | c) - a)
+
+
+def test_venn_analysis_of_more_datasets_shares_one_computation():
+    patients, procedures, medications = _ids()
+    billing = pd.Series(np.random.default_rng(1).integers(0, 6000, 1500))
+    venn = VennAnalysis('PatientId', {'Patients': patients, 'Procedures': procedures,
+                                      'Medications': medications, 'Billing': billing})
+
+    assert venn.region_counts().tolist() == _set_regions(patients, procedures, medications, billing)
+    assert len(venn.observations()) == 15
+    assert sorted(venn.region_ids('Billing')) == sorted(
+        set(billing) - set(patients.dropna()) - set(procedures.dropna()) - set(medications.dropna()))
+    assert sorted(venn.missing_ids('Procedures')) == sorted(
+        (set(patients.dropna()) | set(medications.dropna()) | set(billing)) - set(procedures.dropna()))
+
+    with pytest.raises(ValueError):
+        venn.diagram()
+    with pytest.raises(ValueError):
+        venn.region_ids('Dispatch')
+
+    three = VennAnalysis('PatientId', {'Patients': patients, 'Procedures': procedures,
+                                       'Medications': medications})
+    try:
+        diagram = three.diagram()
+        assert [label.get_text() for label in diagram.set_labels] == ['Patients', 'Procedures', 'Medications']
+        assert diagram.get_label_by_id('111').get_text() == str(three.region_counts()[7])
+    finally:
+        plt.close('all')
+
+
+def _short_test_loop(key_id, table, ids):
+    """
+    The per ID loop of the original short test, one boolean mask over the table per ID.
+    """
+    shapes = [table[table[key_id] == value].shape for value in ids]
+    return pd.DataFrame({'PatientId': ids, 'Raw Shape': [table.shape] * len(ids),
+                         'Logical Index Shape': shapes,
+                         'Pass/Fail': ['PASS' if shape[0] == 0 else 'FAIL' for shape in shapes]})
+
+
+def test_short_test_matches_the_per_id_loop(tmp_path):
+    patients, procedures, medications = _ids()
+    table = pd.DataFrame({'PatientId': patients, 'Shift': 'A'})
+    missing = VennAnalysisReport.venn_analysis_table('PatientId', patients, procedures, medications,
+                                                     out_flag=False)
+
+    report = VennAnalysisReport.venn_analysis_short_test('PatientId', table, missing)
+    assert (report['Pass/Fail'] == 'PASS').all()
+    pd.testing.assert_frame_equal(report, _short_test_loop('PatientId', table, missing['Missing IDs'].values))
+
+    # IDs that do exist fail, whatever the key column and the table width
+    procedures_table = pd.DataFrame({'FRDPersonnelID': ['A', 'B', 'B', None], 'Code': [1, 2, 3, 4],
+                                     'Description': ['IV', 'ECG', 'O2', 'IV']})
+    ids = pd.DataFrame({'Missing IDs': ['B', 'C', 'A']})
+    report = VennAnalysisReport.venn_analysis_short_test('FRDPersonnelID', procedures_table, ids)
+    pd.testing.assert_frame_equal(report, _short_test_loop('FRDPersonnelID', procedures_table,
+                                                           ids['Missing IDs'].values))
+    assert report['Logical Index Shape'].tolist() == [(2, 3), (0, 3), (1, 3)]
+
+    # Missing IDs read back from a csv file are compared with the numeric key column
+    missing.astype(int).astype(str).to_csv(tmp_path.joinpath('missing.csv'), index=False)
+    saved = pd.read_csv(tmp_path.joinpath('missing.csv'), dtype=str)
+    table = pd.DataFrame({'PatientId': [1, 2, 3]})
+    saved.loc[0, 'Missing IDs'] = '2'
+    report = VennAnalysisReport.venn_analysis_short_test('PatientId', table, saved)
+    assert report['Pass/Fail'].tolist() == ['FAIL'] + ['PASS'] * (len(saved) - 1)
+
+
+def _files(tmp_path):
+    """
+    The three ID columns stored as a csv file, a folder of parquet partitions and a list of
+    a csv and a parquet file.
+    """
+    patients, procedures, medications = _ids()
+    patients_path = tmp_path.joinpath('patients.csv')
+    pd.DataFrame({'PatientId': patients, 'Shift': 'A'}).to_csv(patients_path, index=False)
+
+    procedures_path = tmp_path.joinpath('procedures')
+    procedures_path.mkdir()
+    for part, rows in enumerate(np.array_split(np.arange(len(procedures)), 3)):
+        pd.DataFrame({'PatientId': procedures.values[rows]}).to_parquet(
+            procedures_path.joinpath('part-{}.parquet'.format(part)))
+
+    medications_paths = [tmp_path.joinpath('medications-1.csv'), tmp_path.joinpath('medications-2.parquet')]
+    medications[:1000].to_frame('PatientId').to_csv(medications_paths[0], index=False)
+    medications[1000:].to_frame('PatientId').to_parquet(medications_paths[1])
+    return (patients, procedures, medications), (patients_path, procedures_path, medications_paths)
+
+
+@pytest.mark.parametrize('partitions', [1, 3])
+def test_streaming_venn_matches_the_in_memory_table(tmp_path, partitions):
+    columns, paths = _files(tmp_path)
+    expected = VennAnalysisReport.venn_analysis_table('PatientId', *columns)
+
+    observations = VennAnalysisReport.venn_analysis_table_streaming('PatientId', *paths, chunk_size=500,
+                                                                    partitions=partitions)
+    pd.testing.assert_frame_equal(observations, expected)
+
+
+def test_approximate_venn_is_within_its_error_bounds(tmp_path):
+    columns, paths = _files(tmp_path)
+    expected = VennAnalysisReport.venn_analysis_table('PatientId', *columns)['Count']
+
+    sources = dict(zip(['Patients', 'Procedures', 'Medications'], paths))
+    venn = VennAnalysisReport.StreamingVennAnalysis('PatientId', sources, chunk_size=500,
+                                                    approximate=True, precision=12)
+    bounds = venn.error_bounds()
+    assert list(bounds.index) == list(expected.index)
+    assert (bounds['Std Error'] > 0).all()
+    assert ((bounds['Count'] - expected).abs() <= 3 * bounds['Std Error']).all()